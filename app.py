@@ -1,17 +1,23 @@
 #region Imports
-from flask import Flask, jsonify, redirect, url_for, render_template, request 
+from flask import Flask, jsonify, redirect, url_for, render_template, request, g, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
-import requests
 import os
-from datetime import datetime, timezone
-import uuid
+import time
+from datetime import datetime, timezone, timedelta
 import json
+import hashlib
+from functools import wraps
 
-from database import init_db, get_db, save_email_log, save_scheduled_email, find_in_db
+from database import init_db, get_db, find_in_db, fetch_email_page, fetch_recipient_history
 from models import EmailLog, ScheduledEmail
-from email_sender import send_email
-from scheduler import start_scheduler
+from scheduler import start_scheduler, start_purger
+from send_queue import SEND_ASYNC, start_send_workers
+from confirmations import start_confirmation_digest
+from email_export import EXPORT_FORMATS, export_emails
+import email_service
+import idempotency
+import metrics
 #endregion
 
 # ------------------------
@@ -27,56 +33,98 @@ CORS(app, resources={
     r"/*": {
         "origins": [o.strip() for o in allowed_origins if o.strip()],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"]
     }
 })
 
+HISTORY_PAGE_SIZE = 100                                             # Default entries per /recipients/<address>/history page
+HISTORY_MAX_PAGE_SIZE = 1000
+
+REQUEST_SECONDS = metrics.Histogram("http_request_duration_seconds", "Request latency by endpoint", ("endpoint", "method"))
+REQUESTS = metrics.Counter("http_requests_total", "Requests by endpoint and response status", ("endpoint", "method", "status"))
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    """Record the latency of every routed request (labelled by route, not path)."""
+    start = g.pop("request_start", None)
+    if start is not None and request.url_rule is not None:
+        endpoint = request.url_rule.rule
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
 # ------------------------
 #   HELPER FUNCTIONS
 # ------------------------
 
-def _normalize_recipients(raw: list[str]) -> list[str]:
-    """ Returns a cleaned list of recipiants from an email request.
-        (Trims spaces, makes lowercase, removes duplicated / empty)
-    
+def _parse_utc(value: str) -> datetime:
+    """ Parses an ISO date/time from a query string as UTC
+        (times without an offset are taken as UTC)
+
     Args:
-        raw (list[str]): Inputted list of emails 
-    
+        value (str): "YYYY-MM-DD" or a full ISO date/time
+
     Returns:
-        list[str]: the cleaned version of the raw list
+        datetime: the time in UTC
+
+    Raises:
+        ValueError: if value is not an ISO date/time
     """
-    if not isinstance(raw, list):
-        return None
-    cleaned = []
-    seen = set()
-    for r in raw:
-        if isinstance(r, str):
-            v = r.strip().lower()
-            if v and v not in seen:
-                seen.add(v)
-                cleaned.append(v)
-    return cleaned
-
-
-def _validate_lengths(subject_line: str, body: str) -> bool:
-    """ Light input guardrails to keep logs and payloads reasonable.
-        Limites can be adjusted as needed.
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _idempotent(view):
+    """ Makes an endpoint honour the Idempotency-Key header: a request
+        repeated with the same key (and the same JSON) gets the stored
+        response of the first one, marked with "Idempotent-Replayed: true",
+        without running the endpoint again.
 
     Args:
-        subject_line (str): subject line of the email
-        body (str): body of the email
-    
-    Returns:
-        Boolean: If the subject line and body are smaller than max
-        str: Error message for if it's too large
+        view (function): the endpoint
     """
-    MAX_SUBJECT = 256
-    MAX_BODY = 100_000
-    if len(subject_line) > MAX_SUBJECT:
-        return False, f"'subject_line' too long (>{MAX_SUBJECT})"
-    if len(body) > MAX_BODY:
-        return False, f"'body' too long (>{MAX_BODY} chars)"
-    return True, ""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key", "").strip()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > idempotency.MAX_KEY_LENGTH:
+            return jsonify({"status": "failed", "message": "Idempotency-Key is too long", "statusCode": 400}), 400
+
+        data = request.get_json(force=True, silent=True)
+        canonical = json.dumps(data, sort_keys=True).encode() if data is not None else request.get_data()
+        request_hash = hashlib.sha256(canonical).hexdigest()
+        endpoint = request.url_rule.rule
+
+        try:
+            state, stored = idempotency.begin(endpoint, key, request_hash)
+        except Exception as e:
+            print(f"[idempotency] lookup failed, running the request: {e}")
+            return view(*args, **kwargs)
+        if state == "replay":
+            response = Response(stored[1], status=stored[0], mimetype="application/json")
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        if state == "mismatch":
+            return jsonify({"status": "failed", "message": "Idempotency-Key was already used for a different request", "statusCode": 422}), 422
+        if state == "in_progress":
+            return jsonify({"status": "failed", "message": "A request with this Idempotency-Key is still being processed", "statusCode": 409}), 409
+
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency.release(endpoint, key)
+            raise
+        try:
+            idempotency.finish(endpoint, key, request_hash, response.status_code, response.get_data(as_text=True))
+        except Exception as e:
+            print(f"[idempotency] failed to store the response of {endpoint}: {e}")
+        return response
+    return wrapper
 
 # ------------------------
 #   API CALLS
@@ -89,6 +137,7 @@ def health():
 
 
 @app.post("/send-email")
+@_idempotent
 def send_email_endpoint():
     """ HTTP Request that takes in an JSON package and sends
         an email with the data from that package.
@@ -100,76 +149,87 @@ def send_email_endpoint():
             "recipiants": ["string"],           # typo supported
             "subject_line": "string",           # subject line of email
             "body": "string",                   # body of email
-            "is_html": boolean                  # if body is formatted as HTML
-            }
+            "is_html": boolean,                 # if body is formatted as HTML
+            "async": boolean                    # optional, queue the email and return right away
+            }                                   # (defaults to the SEND_ASYNC env setting)
+        Headers:
+            Idempotency-Key: "string"           # optional, a retry with the same key gets the first response
     
     Returns:
         JSON:
             {
-            "status": "string",                 # "success" or "failed"
+            "status": "string",                 # "success", "queued", "retrying" or "failed"
             "message": "string",                # Outcome of the email process
-            "statusCode": Integer,              # The status code of the email
+            "statusCode": Integer,              # The status code of the email (202 when queued)
             "details": ["string"], "string"     # the subject line and recipiants of the email if success
+                                                # (plus "message_id" when queued)
             }
     """
     try:
         data = request.get_json(force=True, silent=True) or {}
-        # Read user input
-        used_legacy = "recipiants" in data and "recipients" not in data
-        recipients_raw = data.get("recipients", data.get("recipiants", []))
-        subject_line = data.get("subject_line", "")
-        body = data.get("body", "")
-        is_html = bool(data.get("is_html", False))
-
-        # Normalize recipients
-        recipients = _normalize_recipients(recipients_raw)
-        if recipients is None:
-            return jsonify({"status": "failed", "message": "Invalid 'recipients'", "statusCode": 400}), 400
-        if not recipients:
-            return jsonify({"status": "failed", "message": "Empty 'recipients'", "statusCode": 400}), 400
-
-        # Optional confirmation copy to owner
-        confirm_to = os.getenv("CONFIRMATION_TO")
-        if confirm_to:
-            ct = confirm_to.strip().lower()
-            if ct and ct not in recipients:
-                recipients.append(ct)
-
-        # Required fields
-        if not subject_line:
-            return jsonify({"status": "failed", "message": "Missing 'subject_line'", "statusCode": 400}), 400
-        if not body:
-            return jsonify({"status": "failed", "message": "Missing 'body'", "statusCode": 400}), 400
-
-        # Length guardrails
-        ok, reason = _validate_lengths(subject_line, body)
-        if not ok:
-            return jsonify({"status": "failed", "message": reason, "statusCode": 400}), 400
-
-        # Send
-        success, status_code, message = send_email(recipients, subject_line, body, is_html)
-
-        # Log
-        with get_db() as db:
-            save_email_log(db, recipients, subject_line, body, is_html, success, status_code)
-
-        # Response
-        payload = {
-            "status": "success" if success else "failed",
-            "message": "Email sent successfully" if success else message,
-            "details": {"recipients": recipients, "subject_line": subject_line} if success else None,
-            "statusCode": 200 if success else status_code
-        }
-        if used_legacy:
-            payload["hint"] = "Use 'recipients' instead of legacy 'recipiants'."
-        return jsonify(payload), (200 if success else status_code)
+        is_async = email_service.parse_flag(data.get("async"), SEND_ASYNC)
+        if is_async is None:
+            return jsonify({"status": "failed", "message": "Invalid 'async', expected true or false", "statusCode": 400}), 400
+        payload, status_code = email_service.send_email_request(data, is_async)
+        return jsonify(payload), status_code
 
     except Exception as e:
         print(f"[send-email] error: {e}")
         return jsonify({"status": "failed", "message": "Server error", "statusCode": 500}), 500
 
 
+@app.post("/send-email/batch")
+def send_email_batch_endpoint():
+    """ HTTP Request that takes in a JSON package with many emails,
+        logs them all in one transaction and sends them in parallel.
+        Every message is validated first; if any is invalid nothing is sent.
+
+    Args:
+        Request (JSON):
+            {
+            "messages": [                       # list of emails (max BATCH_MAX_MESSAGES)
+                {
+                "recipients": ["string"],       # list of recipiant emails
+                "subject_line": "string",       # subject line of email
+                "body": "string",               # body of email
+                "is_html": boolean              # if body is formatted as HTML
+                }
+            ]
+            }
+    
+    Returns:
+        JSON:
+            {
+            "status": "string",                 # "success", "partial" or "failed"
+            "message": "string",                # Outcome of the batch
+            "statusCode": Integer,              # The status code of the batch
+            "details":
+                {
+                "results": [                    # one result per message, in request order
+                    {"index": Integer, "message_id": Integer, "status": "string", "statusCode": Integer, "message": "string"}
+                ],
+                "sent": Integer,                # number of emails sent
+                "failed": Integer,              # number of emails that failed
+                "elapsed_seconds": Float,       # time spent logging and sending
+                "messages_per_second": Float    # throughput of the batch
+                },
+            "errors": [                         # only if validation failed
+                {"index": Integer, "message": "string"}
+            ]
+            }
+    """
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+        payload, status_code = email_service.send_email_batch_request(data)
+        return jsonify(payload), status_code
+
+    except Exception as e:
+        print(f"[send-email-batch] error: {e}")
+        return jsonify({"status": "failed", "message": "Server error", "statusCode": 500}), 500
+
+
 @app.post("/send-timed-email")
+@_idempotent
 def send_timed_email_endpoint():
     """ HTTP Request that takes in an JSON package and submits 
         a request to send an email with the provided data at a 
@@ -186,6 +246,8 @@ def send_timed_email_endpoint():
             "time_to_send": "string",           # formatted as "HH:MM" (24 hour UTC)
             "date_to_send": "string"            # formatted as "YYYY-MM-DD"
             }
+        Headers:
+            Idempotency-Key: "string"           # optional, a retry with the same key gets the first response
     
     Returns:
         JSON:
@@ -205,89 +267,68 @@ def send_timed_email_endpoint():
     """
     try:
         data = request.get_json(force=True, silent=True) or {}
+        payload, status_code = email_service.schedule_email_request(data)
+        return jsonify(payload), status_code
 
-        used_legacy = "recipiants" in data and "recipients" not in data
-        recipients_raw = data.get("recipients", data.get("recipiants", []))
-        subject_line = data.get("subject_line", "")
-        body = data.get("body", "")
-        is_html = bool(data.get("is_html", False))
-        time_to_send = data.get("time_to_send", "")
-        date_to_send = data.get("date_to_send", "")
-
-        # Presence check
-        if not all([recipients_raw, subject_line, body, time_to_send, date_to_send]):
-            return jsonify({"status": "failed", "message": "Missing required fields", "statusCode": 400}), 400
-
-        # Normalize recipients
-        recipients = _normalize_recipients(recipients_raw)
-        if recipients is None:
-            return jsonify({"status": "failed", "message": "Invalid 'recipients'", "statusCode": 400}), 400
-        if not recipients:
-            return jsonify({"status": "failed", "message": "Empty 'recipients'", "statusCode": 400}), 400
-
-        # Length guardrails
-        ok, reason = _validate_lengths(subject_line, body)
-        if not ok:
-            return jsonify({"status": "failed", "message": reason, "statusCode": 400}), 400
-
-        # Combine date+time → UTC aware
-        try:
-            scheduled_dt = datetime.strptime(f"{date_to_send} {time_to_send}", "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
-        except ValueError:
-            return jsonify({"status": "failed", "message": "Invalid date or time format", "statusCode": 400}), 400
-
-        if scheduled_dt <= datetime.now(timezone.utc):
-            return jsonify({"status": "failed", "message": "Scheduled time must be in the future", "statusCode": 400}), 400
-
-        # Create id and persist
-        schedule_id = uuid.uuid4().hex
-        with get_db() as db:
-            # Save scheduled email
-            scheduled_ok = save_scheduled_email(db, schedule_id, recipients, subject_line, body, is_html, scheduled_dt)
-            if not scheduled_ok:
-                print("[send-timed-email] Failed to save scheduled email")
-            else:
-                confirm_to = os.getenv("CONFIRMATION_TO", "").strip().lower()
-                if confirm_to:
-                    try:
-                        c_subject_line = f"[EmailService] Complete your appointment! - {schedule_id}"
-                        c_body = f""" 
-                        <html><body> 
-                            <h3>Your appointment has been successfully created</h3> 
-                            <ul> 
-                                <li><b>Schedule ID:</b> {schedule_id}</li> 
-                                <li><b>Recipients:</b> {", ".join(recipients)}</li> 
-                                <li><b>Subject:</b> {subject_line}</li> 
-                                <li><b>Send at (UTC):</b> {scheduled_dt.isoformat()}</li> 
-                            </ul> 
-                        </body></html>
-                        """
-                        c_success, c_code, c_msg = send_email([confirm_to], c_subject_line, c_body, is_html=True)
-                        
-                        # Log
-                        save_email_log(db, [confirm_to], c_subject_line, c_body, True, c_success, c_code)
-                    except Exception as e:
-                        print(f"[send-timed-email] Confirmation error: {e}")
-        payload = {
-            "status": "success",
-            "message": "Timed email created successfully",
-            "details": {
-                "schedule_id": schedule_id,
-                "recipients": recipients,
-                "subject_line": subject_line,
-                "time_to_send": time_to_send,
-                "date_to_send": date_to_send
-            },
-            "statusCode": 201
-        }
-        if used_legacy:
-            payload["hint"] = "Use 'recipients' instead of legacy 'recipiants'."
-        return jsonify(payload), 201
     except Exception as e:
         print(f"[send-timed-email] error: {e}")
         return jsonify({"status": "failed", "message": "Failed to schedule email", "statusCode": 500}), 500
 
 
+@app.post("/send-timed-email/batch")
+@_idempotent
+def send_timed_email_batch_endpoint():
+    """ HTTP Request that takes in a JSON package with many timed emails
+        and schedules them all with bulk inserts, TIMED_BATCH_CHUNK_SIZE
+        emails per transaction. Every message is validated first; if any
+        is invalid nothing is scheduled. The batch is confirmed in the
+        next confirmation digest.
+
+    Args:
+        Request (JSON):
+            {
+            "messages": [                       # list of emails (max TIMED_BATCH_MAX_MESSAGES)
+                {
+                "recipients": ["string"],       # list of recipiant emails
+                "subject_line": "string",       # subject line of email
+                "body": "string",               # body of email
+                "is_html": boolean,             # if body is formatted as HTML
+                "time_to_send": "string",       # formatted as "HH:MM" (24 hour UTC)
+                "date_to_send": "string"        # formatted as "YYYY-MM-DD"
+                }
+            ]
+            }
+        Headers:
+            Idempotency-Key: "string"           # optional, a retry with the same key gets the first response
+
+    Returns:
+        JSON:
+            {
+            "status": "string",                 # "success" or "failed"
+            "message": "string",                # Outcome of the batch
+            "statusCode": Integer,              # The status code of the batch
+            "details":
+                {
+                "schedule_ids": ["string"],     # one per message, in request order
+                "scheduled": Integer,           # number of emails scheduled
+                "elapsed_seconds": Float,       # time spent storing the batch
+                "schedules_per_second": Float   # throughput of the batch
+                },
+            "errors": [                         # only if validation failed
+                {"index": Integer, "message": "string"}
+            ]
+            }
+    """
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+        payload, status_code = email_service.schedule_email_batch_request(data)
+        return jsonify(payload), status_code
+
+    except Exception as e:
+        print(f"[send-timed-email-batch] error: {e}")
+        return jsonify({"status": "failed", "message": "Failed to schedule emails", "statusCode": 500}), 500
+
+
 @app.get("/check-scheduled-email/<schedule_id>")
 def check_scheduled_email(schedule_id: str):
     """Return the status of a scheduled email, or 404 if not found.
@@ -301,9 +342,11 @@ def check_scheduled_email(schedule_id: str):
             "status": "string",                 # "success" or "failed"
             "message": "string",                # Outcome of the schedule look up process
             "statusCode": Integer,              # The status code of the email
-            "email_status": "string",           # status of the email
+            "email_status": "string",           # "scheduled", "sent", "failed" or "dead" (retries used up)
             "scheduled_time": "string",         # when the email is scheduled to be sent out
-            "sent_at": "string"                 # when the email was sent out (if has been already)
+            "sent_at": "string",                # when the email was sent out (if has been already)
+            "attempts": Integer,                # send attempts made so far
+            "next_attempt_at": "string"         # when the next attempt is due (while "scheduled")
             }
     """
     try:
@@ -318,6 +361,8 @@ def check_scheduled_email(schedule_id: str):
             "email_status": email.status,
             "scheduled_time": email.scheduled_time.isoformat(),
             "sent_at": email.sent_at.isoformat() if email.sent_at else None,
+            "attempts": email.attempts,
+            "next_attempt_at": email.next_attempt_at.isoformat() if email.next_attempt_at and email.status == "scheduled" else None,
             "statusCode": 200
         }), 200
 
@@ -325,6 +370,123 @@ def check_scheduled_email(schedule_id: str):
         print(f"[check-scheduled-email] error: {e}")
         return jsonify({"status": "failed", "message": "Error checking email status", "statusCode": 500}), 500
 
+
+@app.get("/check-email/<int:message_id>")
+def check_email(message_id: int):
+    """Return the status of an email sent through /send-email, or 404 if not found.
+    
+    Args:
+        message_id (int): the message id of the email (returned when queued)
+    
+    Returns:
+        JSON:
+            {
+            "status": "string",                 # "success" or "failed"
+            "message": "string",                # Outcome of the look up process
+            "statusCode": Integer,              # The status code of the look up
+            "email_status": "string",           # "queued", "retrying", "sent", "failed" or "dead"
+            "email_status_code": Integer,       # The status code of the email itself
+            "created_at": "string",             # when the email was received
+            "sent_at": "string",                # when the email was sent out (if has been already)
+            "attempts": Integer,                # send attempts made so far
+            "next_attempt_at": "string"         # when the next retry is due (while "retrying")
+            }
+    """
+    try:
+        with get_db() as db:
+            email = find_in_db(db, EmailLog, id=message_id)
+
+        if not email:
+            return jsonify({"status": "failed", "message": "Message ID not found", "statusCode": 404}), 404
+
+        return jsonify({
+            "status": "success",
+            "email_status": email.status,
+            "email_status_code": email.status_code,
+            "created_at": email.created_at.isoformat() if email.created_at else None,
+            "sent_at": email.sent_at.isoformat() if email.sent_at else None,
+            "attempts": email.attempts,
+            "next_attempt_at": email.next_attempt_at.isoformat() if email.next_attempt_at else None,
+            "statusCode": 200
+        }), 200
+
+    except Exception as e:
+        print(f"[check-email] error: {e}")
+        return jsonify({"status": "failed", "message": "Error checking email status", "statusCode": 500}), 500
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Returns the service metrics in the Prometheus text format.
+    
+    Returns:
+        text/plain: counters, gauges and latency histograms of the SMTP
+                    steps, endpoints, database commits, scheduler and purge
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.get("/recipients/<address>/history")
+def recipient_history(address: str):
+    """Return the emails sent or scheduled to one address, newest first.
+    
+    Args:
+        address (str): the recipient email address
+        since (str): query param, ISO date/time; only emails created at or after it
+        until (str): query param, ISO date/time; only emails created before it
+        before (str): query param, the "next" cursor of the previous page
+        limit (int): query param, entries per page (default 100, max 1000)
+    
+    Returns:
+        JSON:
+            {
+            "status": "string",                 # "success" or "failed"
+            "message": "string",                # Outcome of the look up process
+            "statusCode": Integer,              # The status code of the look up
+            "address": "string",
+            "emails": [
+                {
+                "message_id": Integer,          # EmailLog id (None while only scheduled)
+                "schedule_id": "string",        # for timed emails
+                "subject_line": "string",
+                "status": "string",             # delivery status for this address
+                "status_code": Integer,
+                "created_at": "string",
+                "scheduled_time": "string",
+                "sent_at": "string"
+                }
+            ],
+            "next": "string"                    # cursor for the next page, None on the last page
+            }
+    """
+    try:
+        limit = min(max(1, int(request.args.get("limit", HISTORY_PAGE_SIZE))), HISTORY_MAX_PAGE_SIZE)
+        since = request.args.get("since", "").strip()
+        until = request.args.get("until", "").strip()
+        since = _parse_utc(since) if since else None
+        until = _parse_utc(until) if until else None
+        before = request.args.get("before", "").strip() or None
+        if before:
+            datetime.fromisoformat(before.rsplit("|", 1)[0])
+            int(before.rsplit("|", 1)[1])
+    except (ValueError, IndexError):
+        return jsonify({"status": "failed", "message": "Invalid 'limit', 'since', 'until' or 'before'", "statusCode": 400}), 400
+
+    try:
+        with get_db() as db:
+            emails, cursor = fetch_recipient_history(db, address, since=since, until=until, before=before, limit=limit)
+
+        return jsonify({
+            "status": "success",
+            "message": f"{len(emails)} emails found",
+            "address": address.strip().lower(),
+            "emails": emails,
+            "next": cursor,
+            "statusCode": 200
+        }), 200
+
+    except Exception as e:
+        print(f"[recipient-history] error: {e}")
+        return jsonify({"status": "failed", "message": "Error reading recipient history", "statusCode": 500}), 500
+
 """
 @app.route("/unsubscribe")
 def unsubscribe():
@@ -344,6 +506,42 @@ def unsubscribe():
 # ------------------------
 
 adminCode = os.getenv("ADMIN_CODE")
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))   # Emails shown per admin page
+ADMIN_MAX_PAGE_SIZE = 500
+ADMIN_SORTS = ("newest", "oldest", "status")
+ADMIN_VIEW_MODELS = {"emails": EmailLog, "timed_emails": ScheduledEmail}
+
+def _admin_filters(args) -> dict:
+    """ Reads the admin filters from the query string of an admin view
+
+    Args:
+        args (MultiDict): request.args
+            status (str): exact email status ("sent", "failed", ...)
+            status_code (int): exact status code
+            recipient (str): a whole recipient email, or part of one (without "@")
+            subject (str): part of the subject line
+            schedule_id (str): exact schedule id (timed emails only)
+            from (str): "YYYY-MM-DD", created on or after this day (UTC)
+            to (str): "YYYY-MM-DD", created on or before this day (UTC)
+
+    Returns:
+        dict: the parsed filters
+
+    Raises:
+        ValueError: if status_code or a date is malformed
+    """
+    filters = {}
+    for key in ("status", "recipient", "subject", "schedule_id"):
+        value = args.get(key, "").strip()
+        if value:
+            filters[key] = value.lower() if key == "recipient" else value
+    if args.get("status_code", "").strip():
+        filters["status_code"] = int(args["status_code"])
+    if args.get("from", "").strip():
+        filters["from"] = datetime.strptime(args["from"].strip(), "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    if args.get("to", "").strip():
+        filters["to"] = datetime.strptime(args["to"].strip(), "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+    return filters
 
 @app.template_filter('friendly_datetime')
 def friendly_datetime(value, format="%B %d, %Y at %I:%M %p"):
@@ -399,6 +597,10 @@ def adminPannel(access_code):
         view_name (string): the name of the view you want to enter
                             in the admin pannel
             Options: ["emails", "timed_emails", "test_email"]
+        sort (string): "newest" (default), "oldest" or "status"
+        after (string): cursor of the page to show (from the "Next page" link)
+        limit (int): emails per page (default ADMIN_PAGE_SIZE)
+        filters: see _admin_filters
     
     Returns:
         if all arguments are correct / provided:
@@ -413,17 +615,113 @@ def adminPannel(access_code):
     if view is None:
         # Redirect to same route with view="emails"
         return redirect(url_for("adminPannel", access_code=access_code, view="emails"))
+    if view == "test_email":
+        return render_template("admin-testEmailView.html", access_code=access_code)
+
+    model = ADMIN_VIEW_MODELS.get(view)
+    if model is None:
+        return redirect(url_for("adminPannel", access_code=access_code, view="emails"))
+
+    sort = request.args.get("sort", "newest")
+    if sort not in ADMIN_SORTS:
+        sort = "newest"
+    after = request.args.get("after") or None
+    try:
+        limit = min(max(int(request.args.get("limit", ADMIN_PAGE_SIZE)), 1), ADMIN_MAX_PAGE_SIZE)
+        filters = _admin_filters(request.args)
+        with get_db() as db:
+            data, next_cursor = fetch_email_page(db, model, filters, sort=sort, after=after, limit=limit)
+    except ValueError:
+        return redirect(url_for("adminPannel", access_code=access_code, view=view))
+
+    # Links keep the current filters and sort
+    page_args = {k: v for k, v in request.args.items() if k not in ("after", "view")}
+    next_url = url_for("adminPannel", access_code=access_code, view=view, after=next_cursor, **page_args) if next_cursor else None
+    first_url = url_for("adminPannel", access_code=access_code, view=view, **page_args) if after else None
+
+    template = "admin-emailsView.html" if view == "emails" else "admin-timedEmailsView.html"
+    return render_template(
+        template,
+        email_data=data,
+        access_code=access_code,
+        view=view,
+        sort=sort,
+        filters=request.args,
+        next_url=next_url,
+        first_url=first_url
+    )
+
+@app.route("/admin/<access_code>/body/<view>/<int:email_id>")
+def adminEmailBody(access_code, view, email_id):
+    """ Returns the body of one email for the admin pannel, so bodies
+        are only loaded when an entry is expanded
+
+    Args:
+        access_code (string): The access code for your program
+        view (string): "emails" or "timed_emails"
+        email_id (int): the id of the email
+    
+    Returns:
+        JSON:
+            {
+            "status": "string",                 # "success" or "failed"
+            "body": "string",                   # body of the email
+            "is_html": boolean,                 # if body is formatted as HTML
+            "statusCode": Integer
+            }
+    """
+    if access_code != adminCode:
+        return jsonify({"status": "failed", "message": "Invalid access code", "statusCode": 403}), 403
+    model = ADMIN_VIEW_MODELS.get(view)
+    if model is None:
+        return jsonify({"status": "failed", "message": "Unknown view", "statusCode": 404}), 404
+
     with get_db() as db:
-        if view == "emails":
-            data = db.query(EmailLog).all()  # All email logs
-            return render_template("admin-emailsView.html", email_data=data, access_code=access_code)
+        email = find_in_db(db, model, id=email_id)
+        if not email:
+            return jsonify({"status": "failed", "message": "Email not found", "statusCode": 404}), 404
+        return jsonify({"status": "success", "body": email.body, "is_html": email.is_html, "statusCode": 200}), 200
 
-        elif view == "timed_emails":
-            data = db.query(ScheduledEmail).all()  # All scheduled emails
-            return render_template("admin-timedEmailsView.html", email_data=data, access_code=access_code)
+@app.route("/admin/<access_code>/export")
+def adminExport(access_code):
+    """ Streams every email of an admin view matching the filters as a
+        file download, oldest first, without loading them all at once
+        /admin/<access_code>/export?view=<view_name>&format=<format>
 
-        elif view == "test_email":
-            return render_template("admin-testEmailView.html", access_code=access_code)
+    Args:
+        access_code (string): The access code for your program
+        view_name (string): "emails" (default) or "timed_emails"
+        format (string): "ndjson" (default, one JSON object per line) or "csv"
+        body (bool): "true" to add the body of each email
+        gzip (bool): "true" to gzip the file
+        filters: see _admin_filters
+
+    Returns:
+        the streamed file (application/x-ndjson, text/csv or application/gzip)
+        JSON error with a 400 for a bad view, format or filter, 403 for a bad access code
+    """
+    if access_code != adminCode:
+        return jsonify({"status": "failed", "message": "Invalid access code", "statusCode": 403}), 403
+    view = request.args.get("view", "emails")
+    model = ADMIN_VIEW_MODELS.get(view)
+    if model is None:
+        return jsonify({"status": "failed", "message": "Unknown view", "statusCode": 400}), 400
+    fmt = request.args.get("format", "ndjson").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "failed", "message": f"format must be one of {', '.join(EXPORT_FORMATS)}", "statusCode": 400}), 400
+    try:
+        filters = _admin_filters(request.args)
+    except ValueError:
+        return jsonify({"status": "failed", "message": "Invalid filter", "statusCode": 400}), 400
+    include_body = request.args.get("body", "").strip().lower() in ("1", "true", "yes")
+    compress = request.args.get("gzip", "").strip().lower() in ("1", "true", "yes")
+
+    filename = f"{view}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{fmt}" + (".gz" if compress else "")
+    return Response(
+        export_emails(model, filters, fmt, include_body, compress),
+        mimetype="application/gzip" if compress else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @app.route("/send-test-email", methods=["POST"])
 def sendTestEmail():
@@ -439,8 +737,9 @@ def sendTestEmail():
         form.date_to_send (Input[type="date]): The date to send
 
     Returns: 
-        JSON: The response from the "/send-email" or "/send-timed-email" 
-        requests depending on if form.is_timed is provided.
+        JSON: The same response as the "/send-email" or "/send-timed-email" 
+        requests depending on if form.is_timed is provided (handled
+        in process, without an HTTP request to this server).
     """
     print(request.method)
 
@@ -461,7 +760,7 @@ def sendTestEmail():
                 "body": body,
                 "is_html": True
             }
-            response = requests.post("http://127.0.0.1:5002/send-email", json=package)
+            payload, status_code = email_service.send_email_request(package, SEND_ASYNC)
         else:
             time_to_send = data.get("time_to_send")
             date_to_send = data.get("date_to_send")
@@ -475,12 +774,10 @@ def sendTestEmail():
                 "time_to_send": time_to_send,
                 "date_to_send": date_to_send
             }
-            response = requests.post("http://127.0.0.1:5002/send-timed-email", json=package)
-        try:
-            return jsonify(response.json()), response.status_code
-        except ValueError:
-            return response.text, response.status_code
+            payload, status_code = email_service.schedule_email_request(package)
+        return jsonify(payload), status_code
     except Exception as e:
+        print(f"[send-test-email] error: {e}")
         return jsonify({"status": "failed", "message": "Error sending test email", "statusCode": 500}), 500
     
     
@@ -489,5 +786,8 @@ if __name__ == "__main__":
     # Init DB and start background scheduler only when running the app directly
     init_db()
     start_scheduler()
+    start_purger()
+    start_send_workers()
+    start_confirmation_digest()
     port = int(os.getenv("PORT", "5002"))
     app.run(host="0.0.0.0", port=port, debug=True, use_reloader=False)
\ No newline at end of file
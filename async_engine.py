@@ -0,0 +1,490 @@
+#region imports
+import asyncio
+import base64
+import os
+import re
+import smtplib
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import getaddresses
+
+import email_sender
+from email_sender import (EMAIL, SMTP_PASS, SMTP_SERVER, SMTP_PORT, SMTP_TIMEOUT, SMTP_STARTTLS, SMTP_POOL_IDLE_TIMEOUT,
+                          SEND_RATE_WAIT_SECONDS, rate_limiter, _smtp_step, _prepare_message, _failure,
+                          _temporary_reply)
+from metrics import Gauge
+#endregion
+
+# ------------------------
+#   ENV LOAD AND SETUP
+# ------------------------
+
+SEND_ENGINE = os.getenv("SEND_ENGINE", "thread").strip().lower()                 # "thread" (smtplib pool) or "asyncio"
+ASYNC_SMTP_CONNECTIONS = int(os.getenv("ASYNC_SMTP_CONNECTIONS", "100"))         # Max SMTP sessions open at once on the event loop
+ASYNC_SMTP_MAX_PENDING = int(os.getenv("ASYNC_SMTP_MAX_PENDING", "10000"))       # Max queued sends waiting on the event loop
+ASYNC_CALLBACK_WORKERS = int(os.getenv("ASYNC_CALLBACK_WORKERS", "2"))           # Threads recording the outcome of queued sends
+
+_LINE_ENDINGS = re.compile(rb"\r\n|\n|\r")
+_LEADING_DOT = re.compile(rb"(?m)^\.")
+
+# ------------------------
+#   ASYNC SMTP CLIENT
+# ------------------------
+
+class _SMTPProtocol(asyncio.Protocol):
+    """Buffers the replies of an SMTP server for AsyncSMTPSession."""
+
+    def __init__(self):
+        self.transport = None
+        self._buffer = bytearray()
+        self._waiter = None
+        self._lost = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self._buffer += data
+        self._wake()
+
+    def connection_lost(self, exc):
+        self._lost = smtplib.SMTPServerDisconnected(f"Connection unexpectedly closed: {exc}" if exc else "Connection unexpectedly closed")
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def read_reply(self, timeout: float) -> tuple[int, bytes]:
+        """Read one (possibly multi-line) reply: its code and text."""
+        lines = []
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                if self._lost is not None:
+                    raise self._lost
+                self._waiter = asyncio.get_running_loop().create_future()
+                try:
+                    await asyncio.wait_for(self._waiter, timeout)
+                except asyncio.TimeoutError:
+                    raise smtplib.SMTPServerDisconnected("Timed out waiting for the server") from None
+                continue
+            line = bytes(self._buffer[:end]).rstrip(b"\r")
+            del self._buffer[:end + 1]
+            try:
+                code = int(line[:3])
+            except ValueError:
+                raise smtplib.SMTPResponseException(-1, line) from None
+            lines.append(line[4:])
+            if line[3:4] != b"-":
+                return code, b"\n".join(lines)
+
+
+class AsyncSMTPSession:
+    """ One SMTP session on the event loop, speaking the subset of
+        RFC 5321 that send_email needs (EHLO, STARTTLS, AUTH PLAIN/LOGIN,
+        MAIL, RCPT, DATA). Errors are raised as the smtplib exceptions,
+        so results map to the same status codes as the threaded path.
+
+    Args:
+        host (str): SMTP server host
+        port (int): SMTP server port
+        user (str): login used for the SMTP AUTH
+        password (str): password used for the SMTP AUTH
+        timeout (float): seconds to wait for any reply
+        starttls (bool): upgrade the session with STARTTLS before login
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str, timeout: float = 30, starttls: bool = True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.starttls = starttls
+        self.features = {}
+        self._protocol = None
+
+    async def _command(self, line: str) -> tuple[int, bytes]:
+        self._protocol.transport.write(line.encode() + b"\r\n")
+        return await self._protocol.read_reply(self.timeout)
+
+    async def _ehlo(self) -> None:
+        code, reply = await self._command(f"EHLO {_local_hostname()}")
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, reply)
+        self.features = {}
+        for line in reply.decode("latin-1").split("\n")[1:]:
+            keyword, _, params = line.partition(" ")
+            self.features[keyword.lower()] = params
+
+    async def connect(self) -> None:
+        """Open, secure and authenticate the session."""
+        loop = asyncio.get_running_loop()
+        with _smtp_step("connect"):
+            _, self._protocol = await asyncio.wait_for(
+                loop.create_connection(_SMTPProtocol, self.host, self.port), self.timeout
+            )
+            code, reply = await self._protocol.read_reply(self.timeout)
+            if code != 220:
+                self.close()
+                raise smtplib.SMTPConnectError(code, reply)
+        try:
+            await self._ehlo()
+            if self.starttls:
+                with _smtp_step("starttls"):
+                    if "starttls" not in self.features:
+                        raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+                    code, reply = await self._command("STARTTLS")
+                    if code != 220:
+                        raise smtplib.SMTPResponseException(code, reply)
+                    self._protocol.transport = await loop.start_tls(
+                        self._protocol.transport, self._protocol, ssl.create_default_context(), server_hostname=self.host
+                    )
+                await self._ehlo()
+            with _smtp_step("login"):
+                await self._login()
+        except BaseException:
+            self.close()
+            raise
+
+    async def _login(self) -> None:
+        mechanisms = self.features.get("auth", "").upper().split()
+        if "PLAIN" in mechanisms:
+            token = base64.b64encode(f"\0{self.user}\0{self.password}".encode()).decode()
+            code, reply = await self._command(f"AUTH PLAIN {token}")
+        elif "LOGIN" in mechanisms:
+            code, reply = await self._command("AUTH LOGIN")
+            if code == 334:
+                code, reply = await self._command(base64.b64encode(self.user.encode()).decode())
+            if code == 334:
+                code, reply = await self._command(base64.b64encode(self.password.encode()).decode())
+        else:
+            raise smtplib.SMTPNotSupportedError("No suitable authentication method found.")
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, reply)
+
+    async def noop(self) -> bool:
+        """Probe the session before it is reused."""
+        try:
+            return (await self._command("NOOP"))[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    async def _rset(self) -> None:
+        try:
+            await self._command("RSET")
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    async def sendmail(self, from_addr: str, to_addrs: list[str], msg: bytes) -> dict:
+        """ Send one transaction (MAIL FROM, RCPT TO, DATA)
+
+        Args:
+            from_addr (str): envelope sender
+            to_addrs (list[str]): envelope recipients
+            msg (bytes): the serialized message
+
+        Returns:
+            dict: recipients the server refused (address -> (code, reply))
+        """
+        if self._protocol is None or self._protocol.transport.is_closing():
+            raise smtplib.SMTPServerDisconnected("please run connect() first")
+        with _smtp_step("send"):
+            code, reply = await self._command(f"MAIL FROM:<{from_addr}>")
+            if code != 250:
+                await self._rset()
+                raise smtplib.SMTPSenderRefused(code, reply, from_addr)
+            refused = {}
+            for address in to_addrs:
+                code, reply = await self._command(f"RCPT TO:<{address}>")
+                if code not in (250, 251):
+                    refused[address] = (code, reply)
+            if len(refused) == len(to_addrs):
+                await self._rset()
+                raise smtplib.SMTPRecipientsRefused(refused)
+            code, reply = await self._command("DATA")
+            if code != 354:
+                await self._rset()
+                raise smtplib.SMTPDataError(code, reply)
+            data = _LEADING_DOT.sub(b"..", _LINE_ENDINGS.sub(b"\r\n", msg))
+            if not data.endswith(b"\r\n"):
+                data += b"\r\n"
+            self._protocol.transport.write(data + b".\r\n")
+            code, reply = await self._protocol.read_reply(self.timeout)
+            if code != 250:
+                await self._rset()
+                raise smtplib.SMTPDataError(code, reply)
+            return refused
+
+    async def quit(self) -> None:
+        try:
+            await self._command("QUIT")
+        except Exception:
+            pass
+        self.close()
+
+    def close(self) -> None:
+        if self._protocol is not None and self._protocol.transport is not None:
+            self._protocol.transport.close()
+
+
+_hostname = None
+
+
+def _local_hostname() -> str:
+    """The name sent with EHLO (looked up once, as smtplib does per session)."""
+    global _hostname
+    if _hostname is None:
+        _hostname = socket.getfqdn()
+    return _hostname
+
+# ------------------------
+#   ASYNC SESSION POOL
+# ------------------------
+
+class AsyncSMTPPool:
+    """ Pool of authenticated AsyncSMTPSessions, the event loop
+        counterpart of email_sender.SMTPConnectionPool. Must be created
+        and used on one event loop.
+
+    Args:
+        host (str): SMTP server host
+        port (int): SMTP server port
+        user (str): login used for the SMTP AUTH
+        password (str): password used for the SMTP AUTH
+        size (int): max number of sessions open at the same time
+        idle_timeout (float): seconds a session may stay idle in the pool
+        timeout (float): seconds to wait for any reply
+        starttls (bool): upgrade every session with STARTTLS before login
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str,
+                 size: int = 100, idle_timeout: float = 60, timeout: float = 30, starttls: bool = True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.starttls = starttls
+        self._idle = deque()            # (session, last_used) pairs, most recent on the right
+        self._slots = asyncio.Semaphore(self.size)
+
+    async def _connect(self) -> AsyncSMTPSession:
+        session = AsyncSMTPSession(self.host, self.port, self.user, self.password, self.timeout, self.starttls)
+        await session.connect()
+        return session
+
+    async def _checkout(self) -> AsyncSMTPSession:
+        """Return a live idle session, or open a new one."""
+        now = time.monotonic()
+        while self._idle:
+            session, last_used = self._idle.pop()
+            if now - last_used <= self.idle_timeout and await session.noop():
+                return session
+            session.close()
+        return await self._connect()
+
+    async def send(self, msg: bytes, to_addrs: list[str], from_addr: str) -> dict:
+        """ Send a message over a pooled session. If the server dropped
+            the session or answered with a temporary (4xx) reply, reconnect
+            once and retry the send.
+
+        Args:
+            msg (bytes): the serialized message
+            to_addrs (list[str]): envelope recipients
+            from_addr (str): envelope sender
+
+        Returns:
+            dict: recipients the server refused (address -> (code, reply))
+        """
+        async with self._slots:
+            session = await self._checkout()
+            try:
+                try:
+                    refused = await session.sendmail(from_addr, to_addrs, msg)
+                except smtplib.SMTPServerDisconnected:
+                    session.close()
+                    session = await self._connect()
+                    refused = await session.sendmail(from_addr, to_addrs, msg)
+                except smtplib.SMTPResponseException as e:
+                    if not _temporary_reply(e):
+                        raise
+                    session.close()
+                    session = await self._connect()
+                    refused = await session.sendmail(from_addr, to_addrs, msg)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # the transaction was reset, the session can be reused
+                self._idle.append((session, time.monotonic()))
+                raise
+            except BaseException:
+                session.close()
+                raise
+            self._idle.append((session, time.monotonic()))
+            return refused
+
+    async def close_all(self) -> None:
+        idle, self._idle = list(self._idle), deque()
+        for session, _ in idle:
+            await session.quit()
+
+# ------------------------
+#   DELIVERY ENGINE
+# ------------------------
+
+class AsyncDeliveryEngine:
+    """ Runs every SMTP conversation of the process on one event loop in
+        a background thread, instead of one OS thread per in-flight send.
+        Threads (Flask requests, the scheduler) hand sends over with
+        `send_email` (blocking, same contract as email_sender.send_email),
+        `send_many` or `submit` (returns at once).
+
+    Args:
+        max_connections (int): max SMTP sessions open at once
+        max_pending (int): max sends queued with `submit` before it refuses more
+        callback_workers (int): threads running the callbacks given to `submit`
+    """
+
+    def __init__(self, max_connections: int = 100, max_pending: int = 10000, callback_workers: int = 2):
+        self.max_connections = max_connections
+        self.max_pending = max_pending
+        self.callback_workers = callback_workers
+        self.in_flight = 0
+        self._loop = None
+        self._pool = None
+        self._callbacks = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the event loop thread (once)."""
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="smtp-event-loop", daemon=True).start()
+            self._callbacks = ThreadPoolExecutor(max_workers=max(1, self.callback_workers), thread_name_prefix="smtp-callback")
+            self._pool = asyncio.run_coroutine_threadsafe(self._make_pool(), loop).result()
+            self._loop = loop
+        print(f"Asyncio delivery engine started ({self.max_connections} SMTP sessions)")
+
+    async def _make_pool(self) -> AsyncSMTPPool:
+        # created on the loop so its semaphore belongs to it
+        return AsyncSMTPPool(SMTP_SERVER, SMTP_PORT, EMAIL, SMTP_PASS, size=self.max_connections,
+                             idle_timeout=SMTP_POOL_IDLE_TIMEOUT, timeout=SMTP_TIMEOUT, starttls=SMTP_STARTTLS)
+
+    async def send(self, recipients: list[str], subject: str, body: str, is_html: bool = False) -> tuple[bool, int, str]:
+        """ send_email as a coroutine on the engine's loop
+
+        Returns:
+            bool: If email was sucessfully sent
+            int: Status code for the email
+            str: Status message for the email
+        """
+        try:
+            to = [r.strip() for r in recipients if r and r.strip()]
+            msg = _prepare_message(', '.join(to), to, subject, body, is_html)
+            if not isinstance(msg, bytes):
+                # non-ASCII addresses need SMTPUTF8, which smtplib negotiates
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, email_sender.send_email, recipients, subject, body, is_html
+                )
+
+            wait, limit = rate_limiter.reserve(EMAIL, to)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                SEND_RATE_WAIT_SECONDS.observe(wait, limit=limit)
+            await self._pool.send(msg, [address for _, address in getaddresses(to)], EMAIL)
+
+            return True, 200, "Email sent successfully"
+
+        except Exception as e:
+            return _failure(e)
+
+    def send_email(self, recipients: list[str], subject: str, body: str, is_html: bool = False) -> tuple[bool, int, str]:
+        """Send on the event loop and wait for the result (same contract as email_sender.send_email)."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.send(recipients, subject, body, is_html), self._loop).result()
+
+    def send_many(self, messages: list[dict]) -> list[tuple[bool, int, str]]:
+        """ Send many emails concurrently on the event loop and wait for all
+
+        Args:
+            messages (list[dict]): emails with "recipients", "subject_line", "body" and "is_html"
+
+        Returns:
+            list[tuple]: the send_email result of each email, in the same order as messages
+        """
+        self.start()
+
+        async def _all():
+            return await asyncio.gather(*(
+                self.send(m["recipients"], m["subject_line"], m["body"], m["is_html"]) for m in messages
+            ))
+
+        return list(asyncio.run_coroutine_threadsafe(_all(), self._loop).result())
+
+    def submit(self, recipients: list[str], subject: str, body: str, is_html: bool = False, callback=None):
+        """ Queue a send on the event loop and return right away
+
+        Args:
+            recipients (list[str]): list of the emails for the recipiants
+            subject (str): the subject line for the email
+            body (str): the body of the email
+            is_html (bool): if the body is formatted in HTML
+            callback (callable): optional, called with the send_email result
+                                 on a callback thread (never on the loop)
+
+        Returns:
+            Future: resolves to the send_email result, or None if max_pending
+                    sends are already queued
+        """
+        self.start()
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                return None
+            self.in_flight += 1
+        future = asyncio.run_coroutine_threadsafe(self.send(recipients, subject, body, is_html), self._loop)
+        future.add_done_callback(self._done)
+        if callback is not None:
+            future.add_done_callback(lambda f: self._callbacks.submit(_run_callback, callback, f))
+        return future
+
+    def _done(self, _) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+def _run_callback(callback, future) -> None:
+    try:
+        callback(future.result())
+    except Exception as e:
+        print(f"[async-engine] callback error: {e}")
+
+
+engine = AsyncDeliveryEngine(ASYNC_SMTP_CONNECTIONS, ASYNC_SMTP_MAX_PENDING, ASYNC_CALLBACK_WORKERS)
+Gauge("async_engine_in_flight", "Sends queued or running on the asyncio delivery engine").set_function(lambda: engine.in_flight)
+
+
+def use_async_engine() -> bool:
+    """If SEND_ENGINE selects the asyncio delivery engine."""
+    return SEND_ENGINE == "asyncio"
+
+
+def deliver(recipients: list[str], subject: str, body: str, is_html: bool = False) -> tuple[bool, int, str]:
+    """ send_email through the engine picked by SEND_ENGINE: the smtplib
+        pool ("thread", default) or the asyncio delivery engine ("asyncio")
+
+    Returns:
+        bool: If email was sucessfully sent
+        int: Status code for the email
+        str: Status message for the email
+    """
+    if use_async_engine():
+        return engine.send_email(recipients, subject, body, is_html)
+    return email_sender.send_email(recipients, subject, body, is_html)
@@ -0,0 +1,94 @@
+"""
+Latency of admin-triggered test sends: the old HTTP loopback (the
+/send-test-email handler POSTing to this server's own /send-email with
+requests) against the in-process call to the email service that
+/send-test-email makes now.
+
+Usage:
+  python benchmarks/admin_send.py --sends 500
+  python benchmarks/admin_send.py --timed       # schedule instead of send
+
+Starts the bundled SMTP sink and the service on a local port with a
+throwaway database. The loopback is reproduced with requests.post against
+the served app, the same request the old handler made.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from smtp_sink import SMTPSink
+
+
+def _report(label: str, latencies: list) -> float:
+    latencies = sorted(latencies)
+    mean = sum(latencies) / len(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label}: mean {mean * 1000:7.2f} ms  p50 {latencies[len(latencies) // 2] * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sends", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="SMTP sink DATA latency (seconds)")
+    parser.add_argument("--timed", action="store_true", help="Schedule the test emails instead of sending them")
+    args = parser.parse_args()
+
+    sink = SMTPSink(latency=args.latency).start()
+    db_path = os.path.join(tempfile.mkdtemp(), "admin_send.db")
+    os.environ.update({
+        "SMTP_SERVER": sink.host, "SMTP_PORT": str(sink.port), "SMTP_STARTTLS": "false",
+        "EMAIL": "bench@example.com", "SMTP_PASS": "bench",
+        "DATABASE_URL": f"sqlite:///{db_path}", "CONFIRMATION_TO": "",
+    })
+    sys.path.insert(0, ROOT)
+    import requests
+    from werkzeug.serving import make_server
+    import app as service
+    from database import init_db
+
+    init_db()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    client = service.app.test_client()
+
+    tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%d")
+    form = {"recipient": "admin@example.com", "subject": "Test email", "body": "<p>Test</p>"}
+    package = {"recipients": ["admin@example.com"], "subject_line": "Test email", "body": "<p>Test</p>", "is_html": True}
+    if args.timed:
+        form.update(is_timed=True, time_to_send="12:00", date_to_send=tomorrow)
+        package.update(time_to_send="12:00", date_to_send=tomorrow)
+    endpoint = "/send-timed-email" if args.timed else "/send-email"
+
+    print(f"sends={args.sends} sink latency={args.latency}s endpoint={endpoint}")
+    loopback, in_process = [], []
+    for _ in range(args.sends):
+        start = time.perf_counter()
+        response = requests.post(f"{base}{endpoint}", json=package)
+        loopback.append(time.perf_counter() - start)
+        assert response.status_code < 300, response.text
+
+        start = time.perf_counter()
+        response = client.post("/send-test-email", json=form)
+        in_process.append(time.perf_counter() - start)
+        assert response.status_code < 300, response.get_json()
+
+    before = _report("HTTP loopback ", loopback)
+    after = _report("in process    ", in_process)
+    print(f"{(before - after) * 1000:.2f} ms saved per send ({before / after:.1f}x)")
+    server.shutdown()
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
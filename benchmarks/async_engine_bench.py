@@ -0,0 +1,112 @@
+"""
+Compare the two delivery engines at increasing concurrency, with the
+bundled SMTP sink (benchmarks/smtp_sink.py) in a separate process:
+
+  thread   N threads sending through an smtplib pool of N sessions
+           (what send_batch does with BATCH_WORKERS=N and SMTP_POOL_SIZE=N)
+  asyncio  the asyncio delivery engine with N sessions on one event loop
+           (SEND_ENGINE=asyncio, ASYNC_SMTP_CONNECTIONS=N)
+
+Usage:
+  python benchmarks/async_engine_bench.py --concurrency 10,100,500 --messages 2000 --latency 0.1
+
+Reports messages per second and the peak number of threads in this
+process for each engine and level. The sink's own threads are not counted.
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _ThreadPeak:
+    """Samples threading.active_count() in the background and keeps the peak."""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="10,100,500", help="Comma separated SMTP sessions / threads")
+    parser.add_argument("--messages", type=int, default=2000, help="Emails sent per engine and level")
+    parser.add_argument("--latency", type=float, default=0.1, help="SMTP sink DATA latency (seconds)")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    port = _free_port()
+    sink = subprocess.Popen([sys.executable, os.path.join(ROOT, "benchmarks", "smtp_sink.py"),
+                             "--port", str(port), "--latency", str(args.latency)], stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(port), "SMTP_STARTTLS": "false",
+        "EMAIL": "bench@example.com", "SMTP_PASS": "bench",
+    })
+    sys.path.insert(0, ROOT)
+    import email_sender
+    from async_engine import AsyncDeliveryEngine
+
+    messages = [{"recipients": [f"user{i}@example.com"], "subject_line": "Engine benchmark",
+                 "body": f"<p>Engine benchmark {i}</p>", "is_html": True} for i in range(args.messages)]
+
+    print(f"messages={args.messages} sink latency={args.latency}s")
+    header = f"{'engine':<9}{'conc':>6}{'per_s':>10}{'errors':>8}{'threads':>9}"
+    print(header)
+    print("-" * len(header))
+    try:
+        for level in levels:
+            email_sender.smtp_pool = email_sender.SMTPConnectionPool(
+                email_sender.SMTP_SERVER, email_sender.SMTP_PORT, email_sender.EMAIL, email_sender.SMTP_PASS,
+                size=level, timeout=email_sender.SMTP_TIMEOUT, starttls=False,
+            )
+            with _ThreadPeak() as threads, ThreadPoolExecutor(max_workers=level) as pool:
+                start = time.perf_counter()
+                results = list(pool.map(
+                    lambda m: email_sender.send_email(m["recipients"], m["subject_line"], m["body"], m["is_html"]), messages
+                ))
+                elapsed = time.perf_counter() - start
+            email_sender.smtp_pool.close_all()
+            errors = sum(1 for r in results if not r[0])
+            print(f"{'thread':<9}{level:>6}{len(messages) / elapsed:>10.1f}{errors:>8}{threads.peak:>9}")
+
+            engine = AsyncDeliveryEngine(max_connections=level)
+            engine.start()
+            with _ThreadPeak() as threads:
+                start = time.perf_counter()
+                results = engine.send_many(messages)
+                elapsed = time.perf_counter() - start
+            errors = sum(1 for r in results if not r[0])
+            print(f"{'asyncio':<9}{level:>6}{len(messages) / elapsed:>10.1f}{errors:>8}{threads.peak:>9}")
+    finally:
+        sink.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare the database size and write volume of logging the same newsletter
+bodies inline on every row (the old layout) against storing each body
+once, compressed and keyed by its hash, in email_bodies.
+
+Usage:
+  python benchmarks/body_storage.py --emails 20000 --bodies 5
+
+--emails logged emails share --bodies distinct HTML bodies (about 20 KB
+each). Both layouts are written through the same SQLite profile; the
+inline layout is measured by writing the bodies straight into the body
+column, the way save_email_log did before email_bodies existed.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 1000
+
+
+def _newsletter(n: int) -> str:
+    """A ~20 KB HTML newsletter, different for every n."""
+    rows = "".join(
+        f"<tr><td style='padding:8px;font-family:Arial'>Issue {n} item {i}</td>"
+        f"<td style='padding:8px'><a href='https://example.com/news/{n}/{i}'>Read more about item {i}</a></td></tr>"
+        for i in range(120)
+    )
+    return f"<html><body><h1>Newsletter {n}</h1><table>{rows}</table></body></html>"
+
+
+def _file_bytes(path: str) -> int:
+    """Size of the database file plus its WAL."""
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def _run(label: str, dedup: bool, emails: int, bodies: list) -> None:
+    """Log `emails` emails into a fresh database and print its growth."""
+    from sqlalchemy import text
+    from database import make_engine, body_digest, _insert_bodies
+    from models import Base, EmailLog
+
+    path = os.path.join(tempfile.mkdtemp(), "bodies.db")
+    engine = make_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    digests = [body_digest(b) for b in bodies]
+
+    start = time.perf_counter()
+    for offset in range(0, emails, CHUNK):
+        with engine.begin() as conn:
+            rows = []
+            for i in range(offset, min(offset + CHUNK, emails)):
+                n = i % len(bodies)
+                if dedup:
+                    _insert_bodies(conn, {digests[n]: bodies[n]})
+                rows.append({
+                    "recipients": f"user{i}@example.com",
+                    "subject_line": f"Newsletter {n}",
+                    "body": "" if dedup else bodies[n],
+                    "body_hash": digests[n] if dedup else None,
+                    "is_html": True,
+                    "status": "sent",
+                    "status_code": 200,
+                })
+            conn.execute(EmailLog.__table__.insert(), rows)
+    elapsed = time.perf_counter() - start
+
+    with engine.begin() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    size = _file_bytes(path)
+    print(f"{label}: {size / 1024 / 1024:.1f} MiB, {size / emails:.0f} bytes per logged email, "
+          f"{emails / elapsed:.0f} rows/s")
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=20_000)
+    parser.add_argument("--bodies", type=int, default=5, help="Distinct bodies shared by the emails")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'unused.db')}")
+    bodies = [_newsletter(n) for n in range(args.bodies)]
+    print(f"emails={args.emails} distinct bodies={args.bodies} body size={len(bodies[0].encode()) / 1024:.1f} KB")
+
+    _run("inline bodies", False, args.emails, bodies)
+    _run("email_bodies ", True, args.emails, bodies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Export a large email_logs table: the streamed /admin/<code>/export against
+loading every row with .all() (what scraping the admin page amounted to),
+while another thread keeps logging emails the way the senders do.
+
+Usage:
+  python benchmarks/export_stream.py --rows 5000000
+  python benchmarks/export_stream.py --rows 1000000 --format csv --gzip
+
+Creates a throwaway SQLite database, then runs each mode in its own
+process and reports its time, peak memory (max RSS) and the commit
+latency of the concurrent writer.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 50_000
+
+
+def _fill(engine, rows: int):
+    """Insert rows sent email logs sharing one body, oldest first."""
+    from database import body_digest, _insert_bodies
+    from models import EmailLog
+
+    now = datetime.now(timezone.utc)
+    body = "<p>Export benchmark</p>"
+    body_hash = body_digest(body)
+    with engine.begin() as conn:
+        _insert_bodies(conn, {body_hash: body})
+        for start in range(0, rows, CHUNK):
+            created = now - timedelta(days=1)
+            conn.execute(EmailLog.__table__.insert(), [{
+                "id": i + 1,
+                "recipients": f"user{i}@example.com,copy{i % 100}@example.com",
+                "subject_line": f"Export benchmark {i}",
+                "body": "",
+                "body_hash": body_hash,
+                "is_html": True,
+                "status": "sent",
+                "status_code": 200,
+                "created_at": created,
+                "sent_at": created,
+            } for i in range(start, min(start + CHUNK, rows))])
+
+
+class _Writer:
+    """Logs one email every 10 ms from a background thread and keeps the commit latencies."""
+
+    def __init__(self):
+        self.latencies = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        from database import get_db, save_email_log
+        while not self._stop.wait(0.01):
+            start = time.perf_counter()
+            with get_db() as db:
+                save_email_log(db, ["writer@example.com"], "Writer", "<p>Writer</p>", True, True, 200)
+            self.latencies.append(time.perf_counter() - start)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _child(args):
+    """Run one mode in this process and print its result line."""
+    sys.path.insert(0, ROOT)
+    import app as service
+    from database import get_db
+    from models import EmailLog
+
+    with _Writer() as writer:
+        start = time.perf_counter()
+        if args.mode == "all":
+            with get_db() as db:
+                rows = len(db.query(EmailLog).all())
+            size = 0
+        else:
+            query = f"format={args.format}" + ("&gzip=true" if args.gzip else "")
+            response = service.app.test_client().get(f"/admin/{os.environ['ADMIN_CODE']}/export?{query}")
+            size = sum(len(piece) for piece in response.iter_encoded())
+            rows = args.rows
+        elapsed = time.perf_counter() - start
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    latencies = sorted(writer.latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    label = "query .all()" if args.mode == "all" else f"export {args.format}{' gzip' if args.gzip else ''}"
+    print(f"{label:<18}{elapsed:8.1f} s{rows / elapsed:10.0f} rows/s{peak_mb:9.0f} MB{size / 1e6:9.0f} MB"
+          f"{len(latencies):8d}{p99 * 1000:9.1f} ms{(latencies[-1] if latencies else 0) * 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Email logs in the database")
+    parser.add_argument("--format", default="ndjson", choices=("ndjson", "csv"))
+    parser.add_argument("--gzip", action="store_true", help="Export gzipped")
+    parser.add_argument("--skip-all", action="store_true", help="Do not run the .all() baseline (it needs a lot of memory)")
+    parser.add_argument("--mode", choices=("all", "export"), help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        os.environ.update({"DATABASE_URL": f"sqlite:///{args.db}", "ADMIN_CODE": "bench",
+                           "EMAIL": "bench@example.com", "SMTP_PASS": "bench"})
+        _child(args)
+        return
+
+    db_path = os.path.join(tempfile.mkdtemp(), "export_stream.db")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{db_path}", "EMAIL": "bench@example.com", "SMTP_PASS": "bench"})
+    sys.path.insert(0, ROOT)
+    from database import engine, init_db
+
+    init_db()
+    start = time.perf_counter()
+    _fill(engine, args.rows)
+    print(f"rows={args.rows} (inserted in {time.perf_counter() - start:.1f}s)")
+    print(f"{'':<18}{'time':>10}{'rate':>16}{'peak RSS':>12}{'file':>12}{'writes':>8}{'write p99':>12}{'write max':>12}")
+
+    modes = ["export"] if args.skip_all else ["export", "all"]
+    for mode in modes:
+        command = [sys.executable, os.path.abspath(__file__), "--mode", mode, "--db", db_path,
+                   "--rows", str(args.rows), "--format", args.format] + (["--gzip"] if args.gzip else [])
+        output = subprocess.run(command, capture_output=True, text=True).stdout
+        print(output.strip().splitlines()[-1] if output.strip() else f"{mode}: no output")
+
+
+if __name__ == "__main__":
+    main()
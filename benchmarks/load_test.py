@@ -0,0 +1,222 @@
+"""
+End-to-end load test of the send path, fully offline. Starts the bundled
+SMTP sink (benchmarks/smtp_sink.py), the service on a local port with a
+throwaway database, then at each concurrency level:
+
+  1. send-email   POST /send-email (synchronous send through the SMTP pool)
+  2. schedule     a burst of POST /send-timed-email
+  3. drain        moves that burst's emails to "due now", wakes the
+                  scheduler and times how long it takes to send them all
+
+Usage:
+  python benchmarks/load_test.py --concurrency 1,4,16 --requests 200 --latency 0.02
+  python benchmarks/load_test.py --failure-rate 0.05 --max-connections 2 --json results.json
+  python benchmarks/load_test.py --same-content --latency 0.05   # a newsletter burst the scheduler can coalesce
+  python benchmarks/load_test.py --confirm-to owner@example.com  # schedule with CONFIRMATION_TO set
+
+Reports throughput, p50/p95/p99 latency, errors and database growth per
+phase. Service settings (SMTP_POOL_SIZE, SCHEDULER_WORKERS, ...) are read
+from the environment as usual.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from smtp_sink import SMTPSink
+
+
+def _percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def _db_bytes() -> int:
+    """Size of the database pages in use (WAL included, free pages excluded)."""
+    from sqlalchemy import text
+    from database import engine
+
+    with engine.connect() as conn:
+        pages = conn.execute(text("PRAGMA page_count")).scalar() - conn.execute(text("PRAGMA freelist_count")).scalar()
+        return pages * conn.execute(text("PRAGMA page_size")).scalar()
+
+
+def _hammer(url: str, payloads: list, concurrency: int) -> dict:
+    """POST every payload to url from `concurrency` threads; returns latency stats."""
+    import requests
+
+    local = threading.local()
+
+    def post(payload):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            status = session.post(url, json=payload, timeout=60).status_code
+        except requests.RequestException:
+            status = 0
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(post, payloads))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r[0] * 1000 for r in results)
+    errors = sum(1 for r in results if r[1] >= 300 or r[1] == 0)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "per_second": round(len(results) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+    }
+
+
+def _drain(schedule_ids: list, timeout: float) -> dict:
+    """Make the given scheduled emails due now and time the scheduler sending them."""
+    import scheduler
+    from database import get_db
+    from models import ScheduledEmail
+
+    now = datetime.now(timezone.utc)
+    with get_db() as db:
+        db.query(ScheduledEmail).filter(ScheduledEmail.schedule_id.in_(schedule_ids)).update(
+            {"scheduled_time": now, "next_attempt_at": now}, synchronize_session=False
+        )
+        db.commit()
+
+    start = time.perf_counter()
+    scheduler.notify_scheduled("", now)
+    left = len(schedule_ids)
+    while left and time.perf_counter() - start < timeout:
+        time.sleep(0.05)
+        with get_db() as db:
+            left = db.query(ScheduledEmail.id).filter(
+                ScheduledEmail.schedule_id.in_(schedule_ids), ScheduledEmail.status == "scheduled"
+            ).count()
+    elapsed = time.perf_counter() - start
+    with get_db() as db:
+        failed = db.query(ScheduledEmail.id).filter(
+            ScheduledEmail.schedule_id.in_(schedule_ids), ScheduledEmail.status.in_(("failed", "dead"))
+        ).count()
+    return {
+        "requests": len(schedule_ids),
+        "errors": failed + left,
+        "seconds": round(elapsed, 3),
+        "per_second": round((len(schedule_ids) - left) / elapsed, 1),
+        "p50_ms": None, "p95_ms": None, "p99_ms": None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per phase and level")
+    parser.add_argument("--recipients", type=int, default=1, help="Recipients per email")
+    parser.add_argument("--latency", type=float, default=0.01, help="SMTP sink DATA latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--max-connections", type=int, default=0)
+    parser.add_argument("--same-content", action="store_true", help="Send every email with the same subject and body")
+    parser.add_argument("--confirm-to", default="", help="CONFIRMATION_TO address (default: no confirmations)")
+    parser.add_argument("--drain-timeout", type=float, default=300)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    sink = SMTPSink(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                    max_connections=args.max_connections).start()
+    db_path = os.path.join(tempfile.mkdtemp(), "load.db")
+    os.environ.update({
+        "SMTP_SERVER": sink.host, "SMTP_PORT": str(sink.port), "SMTP_STARTTLS": "false",
+        "EMAIL": "bench@example.com", "SMTP_PASS": "bench",
+        "DATABASE_URL": f"sqlite:///{db_path}", "CONFIRMATION_TO": args.confirm_to,
+    })
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+    import app as service
+    from database import init_db, get_db
+    from models import EmailLog, ScheduledEmail
+
+    init_db()
+    service.start_scheduler()
+    service.start_send_workers()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    def email(i, prefix):
+        n = 0 if args.same_content else i
+        return {
+            "recipients": [f"{prefix}{i}-{r}@example.com" for r in range(args.recipients)],
+            "subject_line": f"Load test {n}",
+            "body": f"<p>Load test email {n}</p>",
+            "is_html": True,
+        }
+
+    results = []
+    tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%d")
+    for level in levels:
+        before = _db_bytes()
+        row = _hammer(f"{base}/send-email", [email(i, f"c{level}-") for i in range(args.requests)], level)
+        row.update(phase="send-email", concurrency=level, db_growth_kb=round((_db_bytes() - before) / 1024, 1))
+        results.append(row)
+
+        before = _db_bytes()
+        burst = [dict(email(i, f"s{level}-"), time_to_send="12:00", date_to_send=tomorrow) for i in range(args.requests)]
+        row = _hammer(f"{base}/send-timed-email", burst, level)
+        row.update(phase="schedule", concurrency=level, db_growth_kb=round((_db_bytes() - before) / 1024, 1))
+        results.append(row)
+
+        before = _db_bytes()
+        with get_db() as db:
+            schedule_ids = [r[0] for r in db.query(ScheduledEmail.schedule_id).filter(
+                ScheduledEmail.status == "scheduled", ScheduledEmail.subject_line.like("Load test %"),
+                ScheduledEmail.recipients.like(f"s{level}-%")
+            )]
+        row = _drain(schedule_ids, args.drain_timeout)
+        row.update(phase="drain", concurrency=level, db_growth_kb=round((_db_bytes() - before) / 1024, 1))
+        results.append(row)
+
+    server.shutdown()
+    with get_db() as db:
+        logged = db.query(EmailLog).count()
+        scheduled = db.query(ScheduledEmail).count()
+
+    print(f"\nsink latency={args.latency}s jitter={args.jitter}s failure_rate={args.failure_rate} "
+          f"max_connections={args.max_connections or 'unlimited'}, {args.recipients} recipient(s) per email"
+          + (", same content" if args.same_content else ""))
+    header = f"{'phase':<11}{'conc':>5}{'reqs':>6}{'errors':>7}{'per_s':>9}{'p50_ms':>9}{'p95_ms':>9}{'p99_ms':>9}{'db_kb':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cells = [f"{r[k]:>9}" if r[k] is not None else f"{'-':>9}" for k in ("per_second", "p50_ms", "p95_ms", "p99_ms", "db_growth_kb")]
+        print(f"{r['phase']:<11}{r['concurrency']:>5}{r['requests']:>6}{r['errors']:>7}" + "".join(cells))
+    print(f"\ndatabase: {_db_bytes() / 1024 / 1024:.1f} MiB, {logged} email logs, {scheduled} scheduled emails")
+    print(f"sink: {sink.stats.as_dict()}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results, "sink": sink.stats.as_dict()}, f, indent=2)
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
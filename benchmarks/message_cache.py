@@ -0,0 +1,75 @@
+"""
+Time the Python side of building one outgoing message when the same body
+goes to many recipients: building and serializing a new EmailMessage for
+every recipient (what send_email did before the message cache) against
+taking the serialized body from the cache and folding only the headers.
+
+Usage:
+  python benchmarks/message_cache.py --messages 2000 --body-kb 20 --html
+
+No SMTP server is involved; only the bytes handed to smtplib are built.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _body(kb: int, html: bool) -> str:
+    """A body of about kb KB with some non-ASCII text."""
+    line = "<p>Newsletter item, café prices and more news</p>\n" if html else "Newsletter item, café prices and more news\n"
+    return line * max(1, kb * 1024 // len(line))
+
+
+def _uncached(to: str, subject: str, body: str, is_html: bool) -> bytes:
+    """Build and serialize a complete message, as send_message would."""
+    import email_sender
+    from email.generator import BytesGenerator
+    from email.message import EmailMessage
+
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = email_sender.EMAIL
+    msg["To"] = to
+    email_sender._add_body(msg, body, is_html)
+    out = io.BytesIO()
+    BytesGenerator(out, policy=msg.policy).flatten(msg, linesep="\r\n")
+    return out.getvalue()
+
+
+def _time(label: str, build, messages: int, body: str, is_html: bool) -> float:
+    start = time.perf_counter()
+    size = 0
+    for i in range(messages):
+        size += len(build(f"user{i}@example.com", "Weekly newsletter", body, is_html))
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed / messages * 1e6:8.1f} us per message ({size / messages / 1024:.1f} KB each)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--body-kb", type=int, default=20)
+    parser.add_argument("--html", action="store_true", help="Send the body as HTML instead of plain text")
+    args = parser.parse_args()
+
+    os.environ.setdefault("EMAIL", "bench@example.com")
+    sys.path.insert(0, ROOT)
+    import email_sender
+
+    body = _body(args.body_kb, args.html)
+    print(f"messages={args.messages} body={len(body.encode()) / 1024:.1f} KB html={args.html}")
+    before = _time("new EmailMessage per send", _uncached, args.messages, body, args.html)
+    after = _time("message cache            ", email_sender._message_bytes, args.messages, body, args.html)
+    lookups = email_sender.MESSAGE_CACHE_LOOKUPS.values()
+    print(f"speedup {before / after:.1f}x, cache hits {lookups.get(('hit',), 0)} misses {lookups.get(('miss',), 0)}, "
+          f"{email_sender.message_cache.size / 1024:.1f} KB cached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Restart of a replica with a large outbox: N queued emails that a crashed
+replica held (claimed, never sent) are put in a throwaway SQLite database,
+then the service is started again and the outbox is replayed.
+
+  restart   init_db() and recover_outbox(), what the service does before
+            it serves requests again
+  replay    replay_outbox() claiming and loading every email and handing
+            it to the senders (an unbounded in-memory queue, nothing sent)
+  deliver   with --deliver, the same replay with the senders running
+            against the bundled SMTP sink, until the outbox is empty
+
+Usage:
+  python benchmarks/outbox_recovery.py --emails 100000
+  SEND_ENGINE=asyncio python benchmarks/outbox_recovery.py --emails 20000 --deliver
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from smtp_sink import SMTPSink
+
+CHUNK = 5000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=100000, help="Emails left in the outbox by the crashed replica")
+    parser.add_argument("--deliver", action="store_true", help="Also send the replayed emails to the SMTP sink")
+    args = parser.parse_args()
+
+    sink = SMTPSink().start() if args.deliver else None
+    db_path = os.path.join(tempfile.mkdtemp(), "outbox_recovery.db")
+    os.environ.update({
+        "EMAIL": "bench@example.com", "SMTP_PASS": "bench", "SMTP_STARTTLS": "false",
+        "DATABASE_URL": f"sqlite:///{db_path}", "CONFIRMATION_TO": "",
+        "SCHEDULER_REPLICA_ID": "bench-replica",
+    })
+    if sink:
+        os.environ.update({"SMTP_SERVER": sink.host, "SMTP_PORT": str(sink.port)})
+    else:
+        os.environ["SEND_QUEUE_SIZE"] = "0"     # unbounded, so the replay is not held back by senders
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import insert
+    import send_queue
+    from database import get_db, init_db, save_queued_email_logs, count_outbox
+    from models import OutboxItem
+
+    # The crashed replica's outbox
+    init_db()
+    start = time.perf_counter()
+    claimed_by, lease_until = send_queue.outbox_claim()
+    with get_db() as db:
+        for offset in range(0, args.emails, CHUNK):
+            messages = [{"recipients": [f"user{i}@example.com"], "subject_line": f"Outbox {i}",
+                         "body": f"<p>Outbox email {i}</p>", "is_html": True}
+                        for i in range(offset, min(args.emails, offset + CHUNK))]
+            ids = save_queued_email_logs(db, messages)
+            db.execute(insert(OutboxItem), [{"email_log_id": log_id, "claimed_by": claimed_by,
+                                             "lease_until": lease_until, "claims": 1} for log_id in ids])
+            db.commit()
+    print(f"emails={args.emails} (seeded in {time.perf_counter() - start:.1f}s) engine={os.getenv('SEND_ENGINE', 'thread')}")
+
+    # Restart
+    start = time.perf_counter()
+    init_db()
+    send_queue.recover_outbox()
+    restart = time.perf_counter() - start
+    print(f"restart  {restart:8.2f} s")
+
+    if not sink:
+        start = time.perf_counter()
+        handed = send_queue.replay_outbox()
+        elapsed = time.perf_counter() - start
+        print(f"replay   {elapsed:8.2f} s  {handed / elapsed:10.0f} emails/s  ({handed} handed to the senders)")
+        return
+
+    start = time.perf_counter()
+    send_queue.start_send_workers()
+    while True:
+        with get_db() as db:
+            left = count_outbox(db)
+        if not left:
+            break
+        time.sleep(0.25)
+    elapsed = time.perf_counter() - start
+    print(f"deliver  {elapsed:8.2f} s  {args.emails / elapsed:10.0f} emails/s  (sink received {sink.stats.messages})")
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
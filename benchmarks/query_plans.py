@@ -0,0 +1,158 @@
+"""
+Show the query plan and latency of the scheduler and purge hot queries
+on a large SQLite database, before and after the model indexes exist.
+
+Usage:
+  python benchmarks/query_plans.py --rows 1000000
+
+Creates a throwaway database with --rows scheduled emails and --rows
+email logs, drops the indexes declared on the models, times each query,
+then creates the indexes through the init_db() migration path and times
+them again.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 50_000
+
+
+def _fill(engine, rows: int):
+    """ Insert `rows` scheduled emails and `rows` email logs, mostly sent,
+        spread over the last PURGE_DAYS + 1 days (oldest first)
+    """
+    from database import body_digest, _insert_bodies
+    from models import ScheduledEmail, EmailLog
+    from scheduler import PURGE_DAYS
+
+    now = datetime.now(timezone.utc)
+    span = timedelta(days=PURGE_DAYS + 1)
+    body = "<p>Benchmark</p>"
+    body_hash = body_digest(body)
+    with engine.begin() as conn:
+        _insert_bodies(conn, {body_hash: body})
+        for start in range(0, rows, CHUNK):
+            batch_s, batch_l = [], []
+            for i in range(start, min(start + CHUNK, rows)):
+                age = span * (1 - i / rows)
+                pending = i % 50 == 0                       # 2% still waiting to be sent
+                batch_s.append({
+                    "schedule_id": f"bench-{i}",
+                    "recipients": f"user{i}@example.com",
+                    "subject_line": "Benchmark",
+                    "body": "",
+                    "body_hash": body_hash,
+                    "is_html": True,
+                    "scheduled_time": now + age if pending else now - age,
+                    "next_attempt_at": now + age if pending else now - age,
+                    "status": "scheduled" if pending else "sent",
+                    "status_code": 201 if pending else 200,
+                    "created_at": now - age,
+                    "sent_at": None if pending else now - age,
+                })
+                batch_l.append({
+                    "recipients": f"user{i}@example.com",
+                    "subject_line": "Benchmark",
+                    "body": "",
+                    "body_hash": body_hash,
+                    "is_html": True,
+                    "status": "sent" if i % 20 else "failed",
+                    "status_code": 200 if i % 20 else 503,
+                    "created_at": now - age,
+                    "sent_at": now - age if i % 20 else None,
+                })
+            conn.execute(ScheduledEmail.__table__.insert(), batch_s)
+            conn.execute(EmailLog.__table__.insert(), batch_l)
+
+
+def _queries():
+    """The hot queries as (name, SQLAlchemy query builder) pairs."""
+    import scheduler
+    from sqlalchemy import func
+    from models import ScheduledEmail, EmailLog
+
+    now = datetime.now(timezone.utc)
+    purge_date = now - timedelta(days=scheduler.PURGE_DAYS)
+    return [
+        ("scheduler due claim", lambda db: db.query(ScheduledEmail.id).filter(
+            *scheduler._claimable(now)
+        ).order_by(ScheduledEmail.next_attempt_at, ScheduledEmail.id).limit(scheduler.SCHEDULER_CLAIM_BATCH)),
+        ("timer reload", lambda db: db.query(ScheduledEmail.next_attempt_at, ScheduledEmail.schedule_id).filter(
+            ScheduledEmail.status == "scheduled"
+        ).order_by(ScheduledEmail.next_attempt_at).limit(scheduler.SCHEDULER_PRELOAD)),
+        ("purge email_logs", lambda db: db.query(func.count(EmailLog.id)).filter(
+            EmailLog.sent_at <= purge_date
+        )),
+        ("purge scheduled_emails", lambda db: db.query(func.count(ScheduledEmail.id)).filter(
+            ScheduledEmail.sent_at.isnot(None),
+            ScheduledEmail.sent_at <= purge_date
+        )),
+    ]
+
+
+def _run(engine, label: str, repeat: int):
+    """Print the plan and median latency of every hot query."""
+    from sqlalchemy import text
+    from database import get_db
+
+    print(f"\n=== {label} ===")
+    with get_db() as db:
+        for name, build in _queries():
+            query = build(db)
+            sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query.all()
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{name}: median {statistics.median(timings):.2f} ms")
+            for row in plan:
+                print(f"    {row[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'plans.db')}"
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import Index, text
+    from database import init_db, engine
+    from models import EmailLog, ScheduledEmail
+
+    # Start from the old schema: drop the indexes declared in __table_args__
+    init_db()
+    with engine.begin() as conn:
+        for model in (EmailLog, ScheduledEmail):
+            for index in model.__table_args__:
+                if isinstance(index, Index):
+                    conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    start = time.perf_counter()
+    _fill(engine, args.rows)
+    print(f"inserted {args.rows} scheduled emails and {args.rows} email logs in {time.perf_counter() - start:.1f}s")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    _run(engine, "before (only id / schedule_id indexes)", args.repeat)
+
+    start = time.perf_counter()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"\nmigration (init_db) created the indexes in {time.perf_counter() - start:.1f}s")
+
+    _run(engine, "after", args.repeat)
+
+
+if __name__ == "__main__":
+    main()
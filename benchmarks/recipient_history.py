@@ -0,0 +1,116 @@
+"""
+Time the "what did we send to this address" lookup on a large SQLite
+database: a LIKE scan of the comma-joined email_logs.recipients column
+against /recipients/<address>/history on the indexed email_recipients table.
+
+Usage:
+  python benchmarks/recipient_history.py --rows 10000000
+
+Creates a throwaway database with --rows email_recipients rows spread over
+--rows / 2 email logs (two recipients each) and a pool of --addresses
+distinct addresses, then times both lookups for random addresses.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 50_000
+
+
+def _fill(engine, rows: int, addresses: int):
+    """Insert rows / 2 email logs with two recipients each, oldest first."""
+    from database import body_digest, _insert_bodies
+    from models import EmailLog, EmailRecipient
+
+    now = datetime.now(timezone.utc)
+    logs = rows // 2
+    body = "<p>Benchmark</p>"
+    body_hash = body_digest(body)
+    with engine.begin() as conn:
+        _insert_bodies(conn, {body_hash: body})
+        for start in range(0, logs, CHUNK):
+            batch_l, batch_r = [], []
+            for i in range(start, min(start + CHUNK, logs)):
+                created = now - timedelta(days=30) * (1 - i / logs)
+                pair = [f"user{(i * 2) % addresses}@example.com", f"user{(i * 2 + 1) % addresses}@example.com"]
+                batch_l.append({
+                    "id": i + 1,
+                    "recipients": ",".join(pair),
+                    "subject_line": f"Benchmark {i}",
+                    "body": "",
+                    "body_hash": body_hash,
+                    "is_html": True,
+                    "status": "sent",
+                    "status_code": 200,
+                    "created_at": created,
+                    "sent_at": created,
+                })
+                batch_r.extend({
+                    "email_log_id": i + 1,
+                    "address": address,
+                    "status": "sent",
+                    "status_code": 200,
+                    "created_at": created,
+                    "sent_at": created,
+                } for address in pair)
+            conn.execute(EmailLog.__table__.insert(), batch_l)
+            conn.execute(EmailRecipient.__table__.insert(), batch_r)
+
+
+def _time(label: str, lookup, addresses: list, repeat: int) -> None:
+    """Print the median latency of a lookup over the sample addresses."""
+    timings = []
+    found = 0
+    for address in addresses:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = len(lookup(address))
+            timings.append((time.perf_counter() - start) * 1000)
+    print(f"{label}: median {statistics.median(timings):.2f} ms, p95 "
+          f"{statistics.quantiles(timings, n=20)[-1]:.2f} ms ({found} emails for the last address)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="email_recipients rows")
+    parser.add_argument("--addresses", type=int, default=100_000, help="Distinct recipient addresses")
+    parser.add_argument("--samples", type=int, default=20, help="Addresses looked up")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-scan", action="store_true", help="Only time the indexed lookup")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'history.db')}"
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import text
+    from database import init_db, engine, get_db, fetch_recipient_history, _like_pattern
+    from models import EmailLog
+
+    init_db()
+    start = time.perf_counter()
+    _fill(engine, args.rows, args.addresses)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"inserted {args.rows} recipients ({args.rows // 2} email logs) in {time.perf_counter() - start:.1f}s")
+
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    sample = [f"user{random.randrange(args.addresses)}@example.com" for _ in range(args.samples)]
+    with get_db() as db:
+        if not args.skip_scan:
+            _time("LIKE on email_logs.recipients", lambda a: db.query(EmailLog.id).filter(
+                EmailLog.recipients.like(_like_pattern(a), escape="\\"),
+                EmailLog.created_at >= since
+            ).order_by(EmailLog.created_at.desc()).limit(100).all(), sample[:3], 1)
+        _time("email_recipients history", lambda a: fetch_recipient_history(
+            db, a, since=since, limit=100
+        )[0], sample, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Check that several scheduler replicas sharing one SQLite file split the
+due emails between them without sending any email twice, and that the
+claims of a crashed replica are picked up once its lease runs out.
+
+Usage:
+  python benchmarks/scheduler_replicas.py --replicas 4 --emails 2000
+  python benchmarks/scheduler_replicas.py --replicas 3 --emails 500 --crash
+
+Sending is replaced by a short sleep so no SMTP server is needed.
+Exits with status 1 if an email was sent twice or left unsent.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup_env(db_path: str, lease_seconds: float, replica_id: str = "parent"):
+    """Point the service at the shared database before its modules are imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["SCHEDULER_LEASE_SECONDS"] = str(lease_seconds)
+    os.environ["SCHEDULER_REPLICA_ID"] = replica_id
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def _replica(db_path: str, replica_id: str, lease_seconds: float, send_delay: float, crash: bool):
+    """Run one scheduler replica until no due emails are left."""
+    _setup_env(db_path, lease_seconds, replica_id)
+    import scheduler
+    from database import get_db
+    from models import ScheduledEmail
+
+    def fake_send(recipients, subject, body, is_html=False):
+        time.sleep(send_delay)
+        return True, 200, "Email sent successfully"
+
+    def fake_envelopes(envelopes, subject, body, is_html=False):
+        for _ in envelopes:
+            time.sleep(send_delay)
+            yield True, 200, "Email sent successfully", {}
+
+    scheduler.deliver = fake_send
+    scheduler.iter_email_envelopes = fake_envelopes
+
+    if crash:
+        # Claim a batch and die without sending it
+        with get_db() as db:
+            claimed = scheduler._claim_due_scheduled_emails(db)
+        print(f"[{replica_id}] claimed {len(claimed)} emails and crashed")
+        os._exit(1)
+
+    while True:
+        scheduler._send_due_emails()
+        with get_db() as db:
+            left = db.query(ScheduledEmail).filter(ScheduledEmail.status == "scheduled").count()
+        if not left:
+            return
+        time.sleep(0.2)  # remaining emails are leased by another replica
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--send-delay", type=float, default=0.002, help="Seconds each fake send takes")
+    parser.add_argument("--crash", action="store_true", help="Start one replica that claims a batch and crashes")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "replicas.db")
+    lease_seconds = 3 if args.crash else 300
+    _setup_env(db_path, lease_seconds)
+    from sqlalchemy import func
+    from database import init_db, get_db, store_body
+    from models import ScheduledEmail, EmailLog
+
+    init_db()
+    due = datetime.now(timezone.utc) - timedelta(seconds=1)
+    with get_db() as db:
+        body_hash = store_body(db, "<p>Replica test</p>")
+        db.add_all([
+            ScheduledEmail(
+                schedule_id=f"replica-test-{i}",
+                recipients=f"user{i}@example.com",
+                subject_line="Replica test",
+                body_text="",
+                body_hash=body_hash,
+                is_html=True,
+                scheduled_time=due,
+                status="scheduled",
+                status_code=201,
+            )
+            for i in range(args.emails)
+        ])
+        db.commit()
+
+    ctx = mp.get_context("spawn")
+    start = time.perf_counter()
+    if args.crash:
+        crasher = ctx.Process(target=_replica, args=(db_path, "crashed", lease_seconds, args.send_delay, True))
+        crasher.start()
+        crasher.join()
+    procs = [
+        ctx.Process(target=_replica, args=(db_path, f"replica-{i}", lease_seconds, args.send_delay, False))
+        for i in range(args.replicas)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    with get_db() as db:
+        per_replica = db.query(ScheduledEmail.claimed_by, func.count()).group_by(ScheduledEmail.claimed_by).all()
+        unsent = db.query(ScheduledEmail).filter(ScheduledEmail.status != "sent").count()
+        logged = db.query(EmailLog).count()
+        duplicates = db.query(EmailLog.recipients).group_by(EmailLog.recipients).having(func.count() > 1).count()
+
+    print(f"emails={args.emails} replicas={args.replicas} elapsed={elapsed:.2f}s")
+    for replica_id, count in sorted(per_replica, key=lambda r: str(r[0])):
+        print(f"  {replica_id}: {count}")
+    print(f"unsent={unsent} logged={logged} duplicates={duplicates}")
+    if unsent or duplicates or logged != args.emails:
+        print("FAILED")
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
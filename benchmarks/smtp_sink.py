@@ -0,0 +1,212 @@
+"""
+Local SMTP stand-in for benchmarks and offline testing. It accepts every
+login and swallows the messages instead of delivering them.
+
+Usage:
+  python benchmarks/smtp_sink.py --port 2525 --latency 0.05 --failure-rate 0.01 --max-connections 8
+
+Point the service at it with:
+  SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=false EMAIL=bench@example.com SMTP_PASS=x
+
+Options:
+  --latency          seconds added before the reply to every DATA (a slow provider)
+  --jitter           random extra seconds (0..jitter) added to the latency
+  --failure-rate     share of messages answered with "451 temporary failure"
+  --max-connections  sessions served at once; extra connections get "421" and are closed
+  --certfile/keyfile offer STARTTLS with this certificate (self-signed is fine)
+
+Recipients containing "reject" are refused with 550, to test partial failures.
+"""
+
+import argparse
+import random
+import socketserver
+import ssl
+import threading
+import time
+
+
+class SinkStats:
+    """Counters of a running sink, safe to read from another thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.refused_connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.failed_messages = 0
+        self.recipients = 0
+        self.bytes = 0
+
+    def add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+
+class _SessionHandler(socketserver.StreamRequestHandler):
+    """One SMTP session, speaking just enough of RFC 5321 for smtplib."""
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        sink = self.server.sink
+        if not sink._slots.acquire(blocking=False):
+            sink.stats.add(refused_connections=1)
+            self.reply("421 4.3.2 Too many connections, try again later")
+            return
+        try:
+            sink.stats.add(connections=1)
+            self._session(sink)
+        except (ConnectionError, ssl.SSLError, OSError):
+            pass
+        finally:
+            sink._slots.release()
+
+    def _session(self, sink):
+        self.reply("220 smtp-sink ESMTP ready")
+        rcpts = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                features = ["smtp-sink", "AUTH PLAIN LOGIN", "8BITMIME", "SIZE 52428800"]
+                if sink.tls_context is not None and not isinstance(self.request, ssl.SSLSocket):
+                    features.insert(1, "STARTTLS")
+                for feature in features[:-1]:
+                    self.wfile.write(f"250-{feature}\r\n".encode())
+                self.reply(f"250 {features[-1]}")
+            elif verb == "STARTTLS" and sink.tls_context is not None:
+                self.reply("220 2.0.0 Ready to start TLS")
+                self.request = sink.tls_context.wrap_socket(self.request, server_side=True)
+                self.rfile = self.request.makefile("rb")
+                self.wfile = self.request.makefile("wb")
+            elif verb == "AUTH":
+                sink.stats.add(logins=1)
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                rcpts = 0
+                self.reply("250 2.1.0 OK")
+            elif verb == "RCPT":
+                if "reject" in command.lower():
+                    self.reply("550 5.1.1 Mailbox unavailable")
+                else:
+                    rcpts += 1
+                    self.reply("250 2.1.5 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b""):
+                        break
+                    size += len(data)
+                delay = sink.latency + (random.uniform(0, sink.jitter) if sink.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                if sink.failure_rate and random.random() < sink.failure_rate:
+                    sink.stats.add(failed_messages=1)
+                    self.reply("451 4.3.0 Temporary failure, try again later")
+                else:
+                    sink.stats.add(messages=1, recipients=rcpts, bytes=size)
+                    self.reply("250 2.0.0 Queued")
+            elif verb in ("NOOP", "RSET"):
+                self.reply("250 2.0.0 OK")
+            elif verb == "QUIT":
+                self.reply("221 2.0.0 Bye")
+                return
+            else:
+                self.reply("502 5.5.2 Command not recognized")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 1024       # listen backlog, so bursts of concurrent connects are not dropped
+
+
+class _Unlimited:
+    """Stands in for the connection semaphore when there is no limit."""
+
+    def acquire(self, blocking=True):
+        return True
+
+    def release(self):
+        pass
+
+
+class SMTPSink:
+    """ Threaded SMTP server that accepts and drops every message
+
+    Args:
+        host (str): interface to listen on
+        port (int): port to listen on (0 picks a free port)
+        latency (float): seconds added before the reply to every DATA
+        jitter (float): random extra seconds (0..jitter) added to latency
+        failure_rate (float): share of messages answered with a 451
+        max_connections (int): sessions served at once (0 = unlimited)
+        certfile (str): certificate offered with STARTTLS (None = no STARTTLS)
+        keyfile (str): key of certfile
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0, jitter: float = 0,
+                 failure_rate: float = 0, max_connections: int = 0, certfile: str = None, keyfile: str = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stats = SinkStats()
+        self._slots = threading.BoundedSemaphore(max_connections) if max_connections > 0 else _Unlimited()
+        self.tls_context = None
+        if certfile:
+            self.tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.tls_context.load_cert_chain(certfile, keyfile)
+        self._server = _Server((host, port), _SessionHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address[:2]
+
+    def start(self) -> "SMTPSink":
+        """Serve in a background thread."""
+        threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--max-connections", type=int, default=0)
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.latency, args.jitter, args.failure_rate,
+                    args.max_connections, args.certfile, args.keyfile).start()
+    print(f"SMTP sink listening on {sink.host}:{sink.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"[smtp-sink] {sink.stats.as_dict()}")
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare concurrent email log inserts with the SQLite performance profile
+(WAL, busy_timeout, synchronous=NORMAL, cache and mmap, pooled
+connections) turned on and off.
+
+Usage:
+  python benchmarks/sqlite_profile.py --threads 8 --inserts 500
+
+Every writer thread commits one EmailLog row at a time through
+save_email_log, like /send-email does, while a reader thread keeps
+running the scheduler's due query. Failed inserts are the
+"database is locked" errors the service would hit.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(profile: bool, threads: int, inserts: int) -> None:
+    """Run the writers and the reader against a fresh database file."""
+    from sqlalchemy.orm import sessionmaker
+    from database import make_engine, save_email_log
+    from models import Base, ScheduledEmail
+
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'profile.db')}"
+    engine = make_engine(url, sqlite_profile=profile)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    failures = []
+    reads = [0]
+    done = threading.Event()
+
+    def writer(n):
+        failed = 0
+        for i in range(inserts):
+            with Session() as db:
+                if not save_email_log(db, [f"user{n}-{i}@example.com"], "Benchmark", "<p>Benchmark</p>", True, True, 200):
+                    failed += 1
+        failures.append(failed)
+
+    def reader():
+        while not done.is_set():
+            try:
+                with Session() as db:
+                    db.query(ScheduledEmail.id).filter(
+                        ScheduledEmail.status == "scheduled",
+                        ScheduledEmail.next_attempt_at <= datetime.now(timezone.utc)
+                    ).limit(100).all()
+                reads[0] += 1
+            except Exception:
+                pass
+
+    r = threading.Thread(target=reader)
+    r.start()
+    workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    r.join()
+
+    total = threads * inserts
+    failed = sum(failures)
+    with engine.connect() as conn:
+        journal = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    print(f"profile={'on ' if profile else 'off'} journal={journal:<8} pool={type(engine.pool).__name__:<14} "
+          f"inserts={total - failed}/{total} failed={failed} "
+          f"throughput={(total - failed) / elapsed:,.0f} rows/s reads={reads[0]} elapsed={elapsed:.2f}s")
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--inserts", type=int, default=500, help="Inserts per writer thread")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    for profile in (False, True):
+        _run(profile, args.threads, args.inserts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Time scheduling many emails through POST /send-timed-email (one request,
+one transaction and one fsync per email) against one POST
+/send-timed-email/batch (bulk inserts, TIMED_BATCH_CHUNK_SIZE emails per
+transaction).
+
+Usage:
+  python benchmarks/timed_batch.py --emails 20000 --single 1000 --recipients 2
+  TIMED_BATCH_CHUNK_SIZE=10000 python benchmarks/timed_batch.py --same-content
+
+Runs the app in process (Flask test client) against a throwaway SQLite
+database; no SMTP server is involved and no confirmation is sent.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=20000, help="Emails in the batch request")
+    parser.add_argument("--single", type=int, default=1000, help="Emails scheduled one request at a time")
+    parser.add_argument("--recipients", type=int, default=1, help="Recipients per email")
+    parser.add_argument("--same-content", action="store_true", help="Give every email the same body")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "timed_batch.db")
+    os.environ.update({
+        "EMAIL": "bench@example.com", "SMTP_PASS": "bench",
+        "DATABASE_URL": f"sqlite:///{db_path}", "CONFIRMATION_TO": "",
+    })
+    sys.path.insert(0, ROOT)
+    import app as service
+    from database import init_db
+
+    init_db()
+    client = service.app.test_client()
+    tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    def email(i, prefix):
+        n = 0 if args.same_content else i
+        return {
+            "recipients": [f"{prefix}{i}-{r}@example.com" for r in range(args.recipients)],
+            "subject_line": f"Timed batch {n}",
+            "body": f"<p>Timed batch email {n}</p>",
+            "is_html": True,
+            "time_to_send": f"{(i // 60) % 24:02d}:{i % 60:02d}",
+            "date_to_send": tomorrow,
+        }
+
+    print(f"emails={args.emails} single={args.single} recipients={args.recipients} same_content={args.same_content}")
+
+    start = time.perf_counter()
+    for i in range(args.single):
+        response = client.post("/send-timed-email", json=email(i, "single-"))
+        assert response.status_code == 201, response.get_json()
+    single = args.single / (time.perf_counter() - start)
+    print(f"POST /send-timed-email       {single:10.1f} schedules/s")
+
+    messages = [email(i, "batch-") for i in range(args.emails)]
+    start = time.perf_counter()
+    response = client.post("/send-timed-email/batch", json={"messages": messages})
+    elapsed = time.perf_counter() - start
+    details = response.get_json()["details"]
+    assert response.status_code == 201, response.get_json()
+    batch = details["scheduled"] / elapsed
+    print(f"POST /send-timed-email/batch {batch:10.1f} schedules/s "
+          f"(request {elapsed:.2f}s, of which inserts {details['elapsed_seconds']:.2f}s "
+          f"= {details['schedules_per_second']:.0f}/s)")
+    print(f"speedup {batch / single:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#region imports
+import atexit
+import os
+import threading
+import time
+
+from database import get_db, save_email_log, save_queued_email_log
+from async_engine import deliver
+from scheduler import is_transient, schedule_retries
+from metrics import Counter, Gauge
+#endregion
+
+# ------------------------
+#   ENV LOAD AND SETUP
+# ------------------------
+
+CONFIRMATION_DIGEST_MAX = int(os.getenv("CONFIRMATION_DIGEST_MAX", "50"))              # Schedules that trigger a digest right away
+CONFIRMATION_DIGEST_SECONDS = float(os.getenv("CONFIRMATION_DIGEST_SECONDS", "60"))    # Max seconds a schedule waits for its digest
+CONFIRMATION_DIGEST_LIST = int(os.getenv("CONFIRMATION_DIGEST_LIST", "100"))           # Schedules listed one by one in a digest
+
+CONFIRMATION_SCHEDULES = Counter("confirmation_schedules_total", "Scheduled emails added to a confirmation digest")
+CONFIRMATION_DIGESTS = Counter("confirmation_digests_total", "Confirmation digests by outcome", ("result",))
+
+# ------------------------
+#   PENDING DIGEST
+# ------------------------
+
+class _Digest:
+    """ Summary of the schedules waiting for their confirmation. Only the
+        first CONFIRMATION_DIGEST_LIST schedules are kept in full, the rest
+        are counted, so a large batch costs the same memory as a small one.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.listed = []                # (schedule_id, recipients, subject_line, scheduled_dt)
+        self.first = None               # earliest send time
+        self.last = None                # latest send time
+        self.opened = None              # monotonic time the first schedule was added
+
+    def add(self, schedule_id: str, recipients: list[str], subject_line: str, scheduled_dt) -> None:
+        if self.count == 0:
+            self.opened = time.monotonic()
+        self.count += 1
+        if len(self.listed) < CONFIRMATION_DIGEST_LIST:
+            self.listed.append((schedule_id, recipients, subject_line, scheduled_dt))
+        self.first = scheduled_dt if self.first is None else min(self.first, scheduled_dt)
+        self.last = scheduled_dt if self.last is None else max(self.last, scheduled_dt)
+
+
+_pending = _Digest()
+_cond = threading.Condition()
+_started = False
+
+Gauge("confirmation_digest_pending", "Schedules waiting for their confirmation digest").set_function(lambda: _pending.count)
+
+# ------------------------
+#   DIGEST EMAIL
+# ------------------------
+
+def _render(digest: _Digest) -> tuple[str, str]:
+    """ Build the confirmation email of a digest
+
+    Args:
+        digest (_Digest): the schedules to confirm
+
+    Returns:
+        str: subject line
+        str: HTML body
+    """
+    if digest.count == 1:
+        schedule_id, recipients, subject_line, scheduled_dt = digest.listed[0]
+        c_subject_line = f"[EmailService] Complete your appointment! - {schedule_id}"
+        c_body = f"""
+        <html><body>
+            <h3>Your appointment has been successfully created</h3>
+            <ul>
+                <li><b>Schedule ID:</b> {schedule_id}</li>
+                <li><b>Recipients:</b> {", ".join(recipients)}</li>
+                <li><b>Subject:</b> {subject_line}</li>
+                <li><b>Send at (UTC):</b> {scheduled_dt.isoformat()}</li>
+            </ul>
+        </body></html>
+        """
+        return c_subject_line, c_body
+
+    rows = "".join(
+        f"<li><b>{schedule_id}</b> - {subject_line} to {', '.join(recipients)} ({scheduled_dt.isoformat()})</li>"
+        for schedule_id, recipients, subject_line, scheduled_dt in digest.listed
+    )
+    more = digest.count - len(digest.listed)
+    c_subject_line = f"[EmailService] {digest.count} appointments created"
+    c_body = f"""
+        <html><body>
+            <h3>{digest.count} appointments have been successfully created</h3>
+            <ul>
+                <li><b>First send at (UTC):</b> {digest.first.isoformat()}</li>
+                <li><b>Last send at (UTC):</b> {digest.last.isoformat()}</li>
+            </ul>
+            <ul>{rows}</ul>
+            {f"<p>... and {more} more</p>" if more else ""}
+        </body></html>
+        """
+    return c_subject_line, c_body
+
+
+def _send_digest(digest: _Digest) -> None:
+    """ Send the confirmation of a digest to CONFIRMATION_TO and log it.
+        A transient failure is handed to the scheduler to retry.
+
+    Args:
+        digest (_Digest): the schedules to confirm
+    """
+    confirm_to = os.getenv("CONFIRMATION_TO", "").strip().lower()
+    if not confirm_to or not digest.count:
+        return
+    c_subject_line, c_body = _render(digest)
+    c_success, c_code, c_msg = deliver([confirm_to], c_subject_line, c_body, is_html=True)
+    CONFIRMATION_DIGESTS.inc(result="sent" if c_success else "failed")
+    if not c_success:
+        print(f"[confirmations] digest of {digest.count} schedules failed: {c_msg}")
+
+    # Log
+    with get_db() as db:
+        if not c_success and is_transient(c_code):
+            log_id = save_queued_email_log(db, [confirm_to], c_subject_line, c_body, True)
+            if log_id and schedule_retries(db, [(log_id, c_code)]):
+                return
+        save_email_log(db, [confirm_to], c_subject_line, c_body, True, c_success, c_code)
+
+
+def _take() -> _Digest:
+    """Swap the pending digest for an empty one (the caller holds _cond)."""
+    global _pending
+    digest, _pending = _pending, _Digest()
+    return digest
+
+
+# ------------------------
+#   BACKGROUND DELIVERY
+# ------------------------
+
+def queue_confirmations(emails: list[dict]) -> None:
+    """ Add scheduled emails to the next confirmation digest. Does nothing
+        unless CONFIRMATION_TO is set.
+
+    Args:
+        emails (list[dict]): emails with "schedule_id", "recipients", "subject_line" and "scheduled_dt"
+    """
+    if not emails or not os.getenv("CONFIRMATION_TO", "").strip():
+        return
+    start_confirmation_digest()
+    with _cond:
+        for e in emails:
+            _pending.add(e["schedule_id"], e["recipients"], e["subject_line"], e["scheduled_dt"])
+        CONFIRMATION_SCHEDULES.inc(len(emails))
+        if _pending.count >= CONFIRMATION_DIGEST_MAX:
+            _cond.notify()
+
+
+def _digest_loop() -> None:
+    """ Main loop of the digest thread: sends the pending digest once it holds
+        CONFIRMATION_DIGEST_MAX schedules or its oldest schedule has waited
+        CONFIRMATION_DIGEST_SECONDS.
+    """
+    while True:
+        with _cond:
+            while True:
+                if _pending.count >= CONFIRMATION_DIGEST_MAX:
+                    break
+                if _pending.count:
+                    left = _pending.opened + CONFIRMATION_DIGEST_SECONDS - time.monotonic()
+                    if left <= 0:
+                        break
+                    _cond.wait(left)
+                else:
+                    _cond.wait()
+            digest = _take()
+        try:
+            _send_digest(digest)
+        except Exception as e:
+            print(f"[confirmations] unexpected error: {e}")
+
+
+def flush_confirmations() -> None:
+    """Send the pending digest now (used when the process exits)."""
+    with _cond:
+        digest = _take()
+    try:
+        _send_digest(digest)
+    except Exception as e:
+        print(f"[confirmations] flush error: {e}")
+
+
+def start_confirmation_digest() -> None:
+    """Start the digest thread (once) that stops when the app stops."""
+    global _started
+    with _cond:
+        if _started:
+            return
+        threading.Thread(target=_digest_loop, name="confirmation-digest", daemon=True).start()
+        atexit.register(flush_confirmations)
+        _started = True
+    print(f"Confirmation digest started (every {CONFIRMATION_DIGEST_MAX} schedules or {CONFIRMATION_DIGEST_SECONDS:g}s)")
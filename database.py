@@ -1,11 +1,17 @@
 #region imports
 import os
-from datetime import datetime, timezone
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+import hashlib
+import uuid
+import zlib
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import create_engine, event, inspect, text, update, select, insert, bindparam, and_, or_, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker, Session, defer
+from sqlalchemy.pool import QueuePool, StaticPool
 from dotenv import load_dotenv
-from models import Base, EmailLog, ScheduledEmail
+from models import Base, EmailBody, EmailLog, EmailRecipient, ScheduledEmail, IdempotencyKey, OutboxItem
 from contextlib import contextmanager
+from metrics import Histogram
 #endregion
 
 # ------------------------
@@ -27,9 +33,62 @@ DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{default_db_path}")
 # Ensure folder exists
 os.makedirs(os.path.dirname(default_db_path), exist_ok=True)
 
-# Use check_same_thread only for SQLite connections
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+# SQLite performance profile, applied on every new connection
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "true").strip().lower() in ("1", "true", "yes", "on")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")           # WAL lets readers run during a write
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # Wait this long for a lock before "database is locked"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")         # NORMAL is durable in WAL mode except on power loss
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))       # Negative = KiB, so 64 MiB of page cache
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # Bytes of the file read through mmap
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))                     # Connections kept open
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))               # Extra connections allowed under load
+BODY_COMPRESSION_LEVEL = int(os.getenv("BODY_COMPRESSION_LEVEL", "6"))  # zlib level for stored email bodies
+BODY_MIGRATION_CHUNK = 1000                                             # Rows moved per statement by the body migration
+
+DB_COMMIT_SECONDS = Histogram("db_commit_seconds", "Duration of database commits on the write paths", ("operation", "table"))
+
+
+def make_engine(url: str, sqlite_profile: bool = SQLITE_PROFILE):
+    """
+    Create the SQLAlchemy engine for a database url.
+
+    For SQLite the connection is shared across threads, an in-memory database
+    uses a single static connection, and a file database gets a connection pool
+    with the SQLITE_* pragmas applied to every connection (if sqlite_profile).
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+
+    # Use check_same_thread only for SQLite connections
+    connect_args = {"check_same_thread": False}
+    if not sqlite_profile:
+        return create_engine(url, connect_args=connect_args)
+
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        new_engine = create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        new_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            poolclass=QueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+        )
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_sqlite_profile(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+    return new_engine
+
+
+engine = make_engine(DATABASE_URL)
 
 # Session factory (no autocommit, no autoflush)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
@@ -42,8 +101,160 @@ utcnow = lambda: datetime.now(timezone.utc)
 # ------------------------
 
 def init_db() -> None:
-    """Create all tables if they do not exist."""
+    """Create all tables if they do not exist, and migrate existing ones."""
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        _backfill_next_attempt(conn)
+        _drop_obsolete_indexes(conn)
+        _create_missing_indexes(conn)
+    _migrate_bodies()
+    with engine.begin() as conn:
+        _backfill_recipients(conn)
+
+
+def _add_missing_columns(conn) -> None:
+    """
+    Add columns declared on the models but missing from tables created
+    by an older version of the service. New columns must be nullable
+    or have a server_default.
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            conn.execute(text(ddl))
+            print(f"[db] added column {table.name}.{column.name}")
+
+
+def _backfill_next_attempt(conn) -> None:
+    """
+    Scheduled emails written before retries existed are first attempted
+    at their scheduled_time.
+    """
+    table = ScheduledEmail.__table__
+    result = conn.execute(
+        table.update().where(table.c.next_attempt_at.is_(None)).values(next_attempt_at=table.c.scheduled_time)
+    )
+    if result.rowcount:
+        print(f"[db] set next_attempt_at of {result.rowcount} scheduled emails")
+
+
+OBSOLETE_INDEXES = {
+    "scheduled_emails": ("ix_scheduled_emails_status_time",),   # replaced by ix_scheduled_emails_status_due
+}
+
+def _drop_obsolete_indexes(conn) -> None:
+    """Drop indexes older versions of the service created and no query uses anymore."""
+    inspector = inspect(conn)
+    for table_name, names in OBSOLETE_INDEXES.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table_name)}
+        for name in names:
+            if name in existing:
+                conn.execute(text(f"DROP INDEX {name}"))
+                print(f"[db] dropped index {name}")
+
+
+def _create_missing_indexes(conn) -> None:
+    """
+    Create indexes declared on the models but missing from tables
+    created by an older version of the service.
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=conn)
+                print(f"[db] created index {index.name}")
+
+
+def _migrate_bodies() -> None:
+    """
+    Move the inline bodies of rows written before email_bodies existed
+    into email_bodies, and point the rows at them. Each chunk of
+    BODY_MIGRATION_CHUNK rows is its own transaction, so the write lock is
+    never held for long and an interrupted migration resumes where it
+    stopped (migrated rows have a body_hash).
+    """
+    for table in (EmailLog.__table__, ScheduledEmail.__table__):
+        moved = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(table.c.id, table.c.body).where(table.c.body_hash.is_(None)).limit(BODY_MIGRATION_CHUNK)
+                ).all()
+                if not rows:
+                    break
+                bodies = {}
+                updates = []
+                for row_id, body in rows:
+                    digest = body_digest(body or "")
+                    bodies[digest] = body or ""
+                    updates.append({"row_id": row_id, "digest": digest})
+                _insert_bodies(conn, bodies)
+                conn.execute(
+                    table.update().where(table.c.id == bindparam("row_id")).values(body="", body_hash=bindparam("digest")),
+                    updates
+                )
+            moved += len(rows)
+        if moved:
+            print(f"[db] moved {moved} bodies of {table.name} to email_bodies")
+
+
+def _backfill_recipients(conn) -> None:
+    """
+    Fill email_recipients from the comma-joined recipients of rows written
+    before it existed. Runs once, while email_recipients is still empty.
+    Scheduled emails that were already sent are covered by their EmailLog.
+    """
+    if conn.execute(select(EmailRecipient.id).limit(1)).first() is not None:
+        return
+    sources = (
+        (EmailLog.__table__, "email_log_id", None),
+        (ScheduledEmail.__table__, "scheduled_email_id", ScheduledEmail.__table__.c.status == "scheduled"),
+    )
+    for table, fk, condition in sources:
+        last_id = 0
+        added = 0
+        while True:
+            query = select(
+                table.c.id, table.c.recipients, table.c.status, table.c.status_code, table.c.created_at, table.c.sent_at
+            ).where(table.c.id > last_id).order_by(table.c.id).limit(BODY_MIGRATION_CHUNK)
+            if condition is not None:
+                query = query.where(condition)
+            rows = conn.execute(query).all()
+            if not rows:
+                break
+            values = [
+                {
+                    fk: row_id,
+                    "address": address,
+                    "status": status,
+                    "status_code": status_code,
+                    "created_at": created_at,
+                    "sent_at": sent_at,
+                }
+                for row_id, recipients, status, status_code, created_at, sent_at in rows
+                for address in split_recipients(recipients)
+            ]
+            if values:
+                conn.execute(EmailRecipient.__table__.insert(), values)
+            added += len(values)
+            last_id = rows[-1][0]
+        if added:
+            print(f"[db] added {added} recipients of {table.name} to email_recipients")
 
 @contextmanager
 def get_db() -> Session:
@@ -79,7 +290,8 @@ def add_to_db(session, instance, return_bool=False):
     """
     try:
         session.add(instance)
-        session.commit()
+        with DB_COMMIT_SECONDS.time(operation="add", table=instance.__tablename__):
+            session.commit()
         session.refresh(instance)
         return True if return_bool else instance
     except Exception as e:
@@ -89,26 +301,496 @@ def add_to_db(session, instance, return_bool=False):
         raise e
 
 
+def _like_pattern(value: str) -> str:
+    """Escape LIKE wildcards so user input is matched literally."""
+    return "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def filter_emails(query, model, filters: dict):
+    """
+    Apply the admin filters to a query (or select) on EmailLog or ScheduledEmail.
+
+    Args:
+        filters (dict): any of "status" (str), "status_code" (int), "recipient" (str),
+                        "subject" (str), "schedule_id" (str), "from" / "to" (datetime on created_at)
+                        A recipient containing "@" must match a whole address,
+                        anything else matches part of an address.
+    """
+    if filters.get("status"):
+        query = query.filter(model.status == filters["status"])
+    if filters.get("status_code") is not None:
+        query = query.filter(model.status_code == filters["status_code"])
+    if filters.get("recipient"):
+        if "@" in filters["recipient"]:
+            # A full address is looked up through the email_recipients index
+            fk = EmailRecipient.email_log_id if model is EmailLog else EmailRecipient.scheduled_email_id
+            query = query.filter(model.id.in_(
+                select(fk).where(EmailRecipient.address == filters["recipient"].strip().lower())
+            ))
+        else:
+            query = query.filter(model.recipients.like(_like_pattern(filters["recipient"]), escape="\\"))
+    if filters.get("subject"):
+        query = query.filter(model.subject_line.like(_like_pattern(filters["subject"]), escape="\\"))
+    if filters.get("schedule_id") and model is ScheduledEmail:
+        query = query.filter(model.schedule_id == filters["schedule_id"])
+    if filters.get("from"):
+        query = query.filter(model.created_at >= filters["from"])
+    if filters.get("to"):
+        query = query.filter(model.created_at < filters["to"])
+    return query
+
+
+def fetch_email_page(session, model, filters: dict, sort: str = "newest", after: str = None, limit: int = 50):
+    """
+    Return one keyset-paginated page of EmailLog or ScheduledEmail rows,
+    without loading the email bodies.
+
+    Args:
+        filters (dict): see filter_emails
+        sort (str): "newest", "oldest" or "status" (status code, then oldest)
+        after (str): the cursor returned with the previous page
+        limit (int): max rows on the page
+
+    Returns:
+        (list): the rows of the page
+        (str): the cursor of the next page, or None if this is the last page
+    """
+    status_code = func.coalesce(model.status_code, 0)
+    query = filter_emails(session.query(model).options(defer(model.body_text)), model, filters)
+
+    if sort == "status":
+        if after:
+            code, last_id = (int(v) for v in after.split(":", 1))
+            query = query.filter(or_(status_code > code, and_(status_code == code, model.id > last_id)))
+        query = query.order_by(status_code, model.id)
+    elif sort == "oldest":
+        if after:
+            query = query.filter(model.id > int(after))
+        query = query.order_by(model.id)
+    else:
+        if after:
+            query = query.filter(model.id < int(after))
+        query = query.order_by(model.id.desc())
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    cursor = f"{last.status_code or 0}:{last.id}" if sort == "status" else str(last.id)
+    return rows, cursor
+
+
+# Columns of each table written by the admin export, in file order
+EXPORT_COLUMNS = {
+    EmailLog: ("id", "recipients", "subject_line", "is_html", "status", "status_code",
+               "attempts", "created_at", "sent_at", "next_attempt_at"),
+    ScheduledEmail: ("id", "schedule_id", "recipients", "subject_line", "is_html", "scheduled_time", "status",
+                     "status_code", "attempts", "created_at", "sent_at", "next_attempt_at", "email_log_id"),
+}
+
+
+def iter_email_export(model, filters: dict, chunk_size: int = 5000, include_body: bool = False):
+    """
+    Yield every EmailLog or ScheduledEmail row matching the admin filters,
+    oldest first, chunk_size rows at a time. Each chunk is one keyset query
+    (id > last id) in its own short session, so memory does not grow with
+    the table and no read transaction is held open (keeping SQLite from
+    checkpointing its WAL) while the caller writes a chunk out.
+
+    Args:
+        filters (dict): see filter_emails
+        include_body (bool): also read the email bodies (as "body")
+
+    Yields:
+        (list[dict]): the EXPORT_COLUMNS of each row of a chunk
+    """
+    names = EXPORT_COLUMNS[model]
+    columns = [getattr(model, name) for name in names]
+    if include_body:
+        columns += [model.body_text, model.body_hash, EmailBody.content, EmailBody.encoding]
+    last_id = 0
+    while True:
+        stmt = select(*columns)
+        if include_body:
+            stmt = stmt.outerjoin(EmailBody, EmailBody.hash == model.body_hash)
+        stmt = filter_emails(stmt, model, filters).where(model.id > last_id).order_by(model.id).limit(chunk_size)
+        with get_db() as db:
+            rows = db.execute(stmt).all()
+        if not rows:
+            return
+
+        chunk, bodies = [], {}
+        for row in rows:
+            item = dict(zip(names, row))
+            if include_body:
+                body_text, body_hash, content, encoding = row[len(names):]
+                if content is None:
+                    item["body"] = body_text
+                else:
+                    if body_hash not in bodies:
+                        bodies[body_hash] = EmailBody.decode(content, encoding)
+                    item["body"] = bodies[body_hash]
+            chunk.append(item)
+        yield chunk
+
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+#-------------------------
+#   EMAIL BODY STORAGE
+#-------------------------
+
+def body_digest(body: str) -> str:
+    """Returns the key of a body in email_bodies (sha256 of the text)."""
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def _insert_bodies(conn, bodies: dict) -> None:
+    """
+    Compress and insert the bodies not stored yet.
+
+    Args:
+        conn (Connection or Session): where to run the statements
+        bodies (dict): body text keyed by body_digest
+    """
+    if not bodies:
+        return
+    table = EmailBody.__table__
+    existing = {
+        row[0] for row in conn.execute(select(table.c.hash).where(table.c.hash.in_(list(bodies))))
+    }
+    now = datetime.now(timezone.utc)
+    rows = []
+    for digest, body in bodies.items():
+        if digest in existing:
+            continue
+        data = body.encode("utf-8")
+        rows.append({
+            "hash": digest,
+            "content": zlib.compress(data, BODY_COMPRESSION_LEVEL),
+            "encoding": "zlib",
+            "size": len(data),
+            "created_at": now,
+        })
+    if not rows:
+        return
+
+    # Another writer may store the same body at the same time
+    _insert_or_ignore(conn, table, rows)
+
+
+def _insert_or_ignore(conn, table, rows):
+    """
+    Insert rows, skipping those that conflict with a unique key.
+
+    Args:
+        conn (Connection or Session): where to run the statement
+        table (Table): the table to insert into
+        rows (list[dict] or dict): the rows (a single dict for one row)
+
+    Returns:
+        (CursorResult): the result; rowcount tells how many rows were inserted
+    """
+    dialect = conn.get_bind().dialect.name if isinstance(conn, Session) else conn.dialect.name
+    if dialect == "sqlite":
+        return conn.execute(sqlite.insert(table).on_conflict_do_nothing(), rows)
+    if dialect == "postgresql":
+        return conn.execute(postgresql.insert(table).on_conflict_do_nothing(), rows)
+    return conn.execute(table.insert(), rows)
+
+
+def store_body(session, body: str) -> str:
+    """
+    Store a body once in email_bodies (part of the session's transaction).
+
+    Returns:
+        (str): the body_hash to reference it with
+    """
+    digest = body_digest(body)
+    _insert_bodies(session, {digest: body})
+    return digest
+
+
+#-------------------------
+#   RECIPIENT LOGIC
+#-------------------------
+
+def split_recipients(recipients: str) -> list[str]:
+    """Returns the lowercase addresses of a comma-joined recipients column."""
+    return [r.strip().lower() for r in (recipients or "").split(",") if r.strip()]
+
+
+def _recipient_rows(recipients, status, status_code=None, sent_at=None) -> list:
+    """Returns one EmailRecipient per distinct address of an email."""
+    now = datetime.now(timezone.utc)
+    return [
+        EmailRecipient(address=address, status=status, status_code=status_code, created_at=now, sent_at=sent_at)
+        for address in dict.fromkeys(r.strip().lower() for r in recipients if r and r.strip())
+    ]
+
+
+def fetch_recipient_history(session, address: str, since=None, until=None, before: str = None, limit: int = 100):
+    """
+    Return the emails sent (or scheduled) to one address, newest first.
+
+    Args:
+        address (str): the recipient email address
+        since (datetime): only emails created at or after this time
+        until (datetime): only emails created before this time
+        before (str): the cursor returned with the previous page
+        limit (int): max entries on the page
+
+    Returns:
+        (list[dict]): one entry per email with its per-recipient status
+        (str): the cursor of the next page, or None if this is the last page
+    """
+    query = session.query(EmailRecipient).filter(EmailRecipient.address == address.strip().lower())
+    if since:
+        query = query.filter(EmailRecipient.created_at >= since)
+    if until:
+        query = query.filter(EmailRecipient.created_at < until)
+    if before:
+        created, last_id = before.rsplit("|", 1)
+        created = datetime.fromisoformat(created)
+        query = query.filter(or_(
+            EmailRecipient.created_at < created,
+            and_(EmailRecipient.created_at == created, EmailRecipient.id < int(last_id))
+        ))
+    rows = query.order_by(EmailRecipient.created_at.desc(), EmailRecipient.id.desc()).limit(limit + 1).all()
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = f"{rows[-1].created_at.isoformat()}|{rows[-1].id}"
+
+    # Subjects of the page's emails, one primary key lookup per table
+    log_ids = {r.email_log_id for r in rows if r.email_log_id}
+    scheduled_ids = {r.scheduled_email_id for r in rows if r.scheduled_email_id}
+    logs = dict(session.query(EmailLog.id, EmailLog.subject_line).filter(EmailLog.id.in_(log_ids)).all()) if log_ids else {}
+    scheduled = {
+        row.id: row for row in session.query(
+            ScheduledEmail.id, ScheduledEmail.schedule_id, ScheduledEmail.subject_line, ScheduledEmail.scheduled_time
+        ).filter(ScheduledEmail.id.in_(scheduled_ids))
+    } if scheduled_ids else {}
+
+    entries = []
+    for r in rows:
+        timed = scheduled.get(r.scheduled_email_id)
+        entries.append({
+            "message_id": r.email_log_id,
+            "schedule_id": timed.schedule_id if timed else None,
+            "subject_line": logs.get(r.email_log_id) or (timed.subject_line if timed else None),
+            "status": r.status,
+            "status_code": r.status_code,
+            "created_at": r.created_at.isoformat() if r.created_at else None,
+            "scheduled_time": timed.scheduled_time.isoformat() if timed else None,
+            "sent_at": r.sent_at.isoformat() if r.sent_at else None,
+        })
+    return entries, cursor
+
+
 #-------------------------
 #   EMAIL LOG LOGIC
 #-------------------------
 
-def save_email_log(session, recipients, subject_line, body, is_html, success, status_code) -> bool:
+def save_email_log(session, recipients, subject_line, body, is_html, success, status_code, body_hash=None, scheduled_email_id=None, status=None, attempts=1, refused=None) -> bool:
+    """
+    Store an EmailLog row for an email that was just sent (or failed).
+    Pass body_hash when the body is already in email_bodies, and
+    scheduled_email_id to move the recipients of a scheduled email to the log.
+    status overrides "sent"/"failed" (e.g. "dead"), and refused
+    ({address: SMTP reply code}) marks the recipients the server refused.
+    """
     try:
+        status = status or ("sent" if success else "failed")
+        sent_at = datetime.now(timezone.utc) if success else None
         log = EmailLog(
             recipients=",".join(recipients),
             subject_line=subject_line,
-            body=body,
+            body_text="",
+            body_hash=body_hash or store_body(session, body),
             is_html=is_html,
-            status="sent" if success else "failed",
+            status=status,
             status_code=status_code,
-            sent_at=datetime.now(timezone.utc) if success else None,
+            sent_at=sent_at,
+            attempts=attempts,
         )
+        moved = 0
+        if scheduled_email_id is not None:
+            session.add(log)
+            session.flush()
+            moved = session.query(EmailRecipient).filter(
+                EmailRecipient.scheduled_email_id == scheduled_email_id
+            ).update(
+                {"email_log_id": log.id, "status": status, "status_code": status_code, "sent_at": sent_at},
+                synchronize_session=False
+            )
+        if not moved:
+            log.recipient_rows = _recipient_rows(recipients, status, status_code, sent_at)
+        if refused:
+            session.add(log)
+            session.flush()
+            _mark_refused(session, log.id, refused)
         return add_to_db(session, log, return_bool=True)
     except:
         return False
 
 
+def _mark_refused(session, log_id, refused: dict) -> None:
+    """Mark the recipients of a log the SMTP server refused as failed, with its reply code."""
+    for address, code in refused.items():
+        session.query(EmailRecipient).filter(
+            EmailRecipient.email_log_id == log_id, EmailRecipient.address == address.lower()
+        ).update({"status": "failed", "status_code": code, "sent_at": None}, synchronize_session=False)
+
+
+def save_queued_email_log(session, recipients, subject_line, body, is_html, outbox_claim=None):
+    """
+    Store an EmailLog row for an email that will be sent in the background.
+    With outbox_claim ((claimed_by, lease_until)) the email is also put in
+    the outbox, already claimed, in the same transaction.
+
+    Returns:
+        (int): the id of the new log row, or None on failure.
+    """
+    try:
+        log = EmailLog(
+            recipients=",".join(recipients),
+            subject_line=subject_line,
+            body_text="",
+            body_hash=store_body(session, body),
+            is_html=is_html,
+            status="queued",
+            status_code=202,
+            sent_at=None,
+            recipient_rows=_recipient_rows(recipients, "queued", 202),
+        )
+        if outbox_claim is None:
+            return add_to_db(session, log).id
+        session.add(log)
+        session.flush()
+        log_id = log.id
+        claimed_by, lease_until = outbox_claim
+        session.add(OutboxItem(email_log_id=log_id, claimed_by=claimed_by, lease_until=lease_until, claims=1))
+        with DB_COMMIT_SECONDS.time(operation="add", table=EmailLog.__tablename__):
+            session.commit()
+        return log_id
+    except:
+        session.rollback()
+        return None
+
+
+def update_email_log(session, log_id, success, status_code, status=None, attempts=None, refused=None) -> bool:
+    """
+    Record the outcome of a queued (or retried) email on its EmailLog row.
+    status overrides "sent"/"failed" (e.g. "dead"), attempts the attempt
+    count, and refused ({address: SMTP reply code}) marks the recipients
+    the server refused.
+    """
+    try:
+        log = session.get(EmailLog, log_id)
+        if log is None:
+            return False
+        log.status = status or ("sent" if success else "failed")
+        log.status_code = status_code
+        log.sent_at = datetime.now(timezone.utc) if success else None
+        log.next_attempt_at = None
+        if attempts is not None:
+            log.attempts = attempts
+        session.query(EmailRecipient).filter(EmailRecipient.email_log_id == log_id).update(
+            {"status": log.status, "status_code": status_code, "sent_at": log.sent_at},
+            synchronize_session=False
+        )
+        if refused:
+            _mark_refused(session, log_id, refused)
+        _clear_outbox(session, [log_id])
+        with DB_COMMIT_SECONDS.time(operation="update", table=EmailLog.__tablename__):
+            session.commit()
+        return True
+    except:
+        session.rollback()
+        return False
+
+
+def save_queued_email_logs(session, messages) -> list[int]:
+    """
+    Store "queued" EmailLog rows for a batch of emails in one transaction.
+
+    Args:
+        messages (list[dict]): emails with "recipients", "subject_line", "body" and "is_html"
+
+    Returns:
+        (list[int]): the ids of the new log rows, in the same order as messages.
+    """
+    try:
+        digests = {}
+        for m in messages:
+            if m["body"] not in digests:
+                digests[m["body"]] = body_digest(m["body"])
+        _insert_bodies(session, {digest: body for body, digest in digests.items()})
+
+        logs = [
+            EmailLog(
+                recipients=",".join(m["recipients"]),
+                subject_line=m["subject_line"],
+                body_text="",
+                body_hash=digests[m["body"]],
+                is_html=m["is_html"],
+                status="queued",
+                status_code=202,
+                sent_at=None,
+                recipient_rows=_recipient_rows(m["recipients"], "queued", 202),
+            )
+            for m in messages
+        ]
+        session.add_all(logs)
+        session.flush()
+        ids = [log.id for log in logs]
+        with DB_COMMIT_SECONDS.time(operation="batch_add", table=EmailLog.__tablename__):
+            session.commit()
+        return ids
+    except Exception as e:
+        session.rollback()
+        raise e
+
+
+def update_email_logs(session, outcomes) -> None:
+    """
+    Record the outcome of many queued emails in one transaction.
+
+    Args:
+        outcomes (list[tuple]): (log_id, success, status_code) for each email
+    """
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "id": log_id,
+            "status": "sent" if success else "failed",
+            "status_code": status_code,
+            "sent_at": now if success else None,
+        }
+        for log_id, success, status_code in outcomes
+    ]
+    if not rows:
+        return
+    try:
+        session.execute(update(EmailLog), rows)
+        recipients = EmailRecipient.__table__
+        session.execute(
+            recipients.update().where(recipients.c.email_log_id == bindparam("log_id")).values(
+                status=bindparam("new_status"), status_code=bindparam("new_code"), sent_at=bindparam("new_sent_at")
+            ),
+            [{"log_id": r["id"], "new_status": r["status"], "new_code": r["status_code"], "new_sent_at": r["sent_at"]} for r in rows]
+        )
+        with DB_COMMIT_SECONDS.time(operation="batch_update", table=EmailLog.__tablename__):
+            session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+
+
 def save_scheduled_email(session, schedule_id, recipients, subject_line, body, is_html, scheduled_dt, status="scheduled", status_code=201) -> bool:
     """
     Create and store a new ScheduledEmail record.
@@ -119,17 +801,304 @@ def save_scheduled_email(session, schedule_id, recipients, subject_line, body, i
             schedule_id=schedule_id,
             recipients=",".join(recipients),
             subject_line=subject_line,
-            body=body,
+            body_text="",
+            body_hash=store_body(session, body),
             is_html=is_html,
             scheduled_time=scheduled_dt,
             status=status,
             status_code=status_code,
             created_at=datetime.now(timezone.utc),
+            recipient_rows=_recipient_rows(recipients, status, status_code),
         )
         return add_to_db(session, scheduled_email, return_bool=True)
     except:
         return False
 
+def save_scheduled_emails(session, emails) -> int:
+    """
+    Store many ScheduledEmail rows and their recipient rows in one
+    transaction, with bulk (multi-row) inserts instead of one ORM object
+    and round trip per row.
+
+    Args:
+        emails (list[dict]): emails with "schedule_id", "recipients", "subject_line",
+                             "body", "is_html" and "scheduled_dt"
+
+    Returns:
+        (int): how many emails were stored
+    """
+    if not emails:
+        return 0
+    try:
+        digests = {}
+        for e in emails:
+            if e["body"] not in digests:
+                digests[e["body"]] = body_digest(e["body"])
+        _insert_bodies(session, {digest: body for body, digest in digests.items()})
+
+        now = datetime.now(timezone.utc)
+        table = ScheduledEmail.__table__
+        session.execute(
+            insert(table),
+            [{
+                "schedule_id": e["schedule_id"],
+                "recipients": ",".join(e["recipients"]),
+                "subject_line": e["subject_line"],
+                "body": "",
+                "body_hash": digests[e["body"]],
+                "is_html": e["is_html"],
+                "scheduled_time": e["scheduled_dt"],
+                "next_attempt_at": e["scheduled_dt"],
+                "attempts": 0,
+                "status": "scheduled",
+                "status_code": 201,
+                "created_at": now,
+            } for e in emails]
+        )
+        # RETURNING in parameter order makes SQLite insert row by row, so map the ids back by schedule_id
+        ids = dict(session.execute(
+            select(table.c.schedule_id, table.c.id).where(table.c.schedule_id.in_([e["schedule_id"] for e in emails]))
+        ).all())
+
+        session.execute(insert(EmailRecipient.__table__), [
+            {"scheduled_email_id": ids[e["schedule_id"]], "address": address, "status": "scheduled",
+             "status_code": 201, "created_at": now}
+            for e in emails
+            for address in dict.fromkeys(r.strip().lower() for r in e["recipients"] if r and r.strip())
+        ])
+        with DB_COMMIT_SECONDS.time(operation="batch_add", table=ScheduledEmail.__tablename__):
+            session.commit()
+        return len(ids)
+    except Exception as e:
+        session.rollback()
+        raise e
+
+
+def save_retry_emails(session, failures) -> dict:
+    """
+    Hand emails that failed on their first attempt over to the scheduler:
+    each gets a ScheduledEmail retry row pointing back at its EmailLog,
+    which is marked "retrying". Everything is stored in one transaction.
+
+    Args:
+        failures (list[tuple]): (log_id, status_code, next_attempt_at) for each email
+
+    Returns:
+        (dict): the schedule_id of the retry row of each log_id
+    """
+    if not failures:
+        return {}
+    try:
+        logs = {log.id: log for log in session.query(EmailLog).filter(EmailLog.id.in_([f[0] for f in failures]))}
+        now = datetime.now(timezone.utc)
+        schedule_ids = {}
+        for log_id, status_code, next_attempt_at in failures:
+            log = logs.get(log_id)
+            if log is None:
+                continue
+            schedule_ids[log_id] = f"retry-{uuid.uuid4().hex}"
+            session.add(ScheduledEmail(
+                schedule_id=schedule_ids[log_id],
+                recipients=log.recipients,
+                subject_line=log.subject_line,
+                body_text=log.body_text,
+                body_hash=log.body_hash,
+                is_html=log.is_html,
+                scheduled_time=now,
+                next_attempt_at=next_attempt_at,
+                attempts=1,
+                status="scheduled",
+                status_code=status_code,
+                created_at=now,
+                email_log_id=log_id,
+            ))
+            log.status = "retrying"
+            log.status_code = status_code
+            log.attempts = 1
+            log.next_attempt_at = next_attempt_at
+        session.query(EmailRecipient).filter(EmailRecipient.email_log_id.in_(list(schedule_ids))).update(
+            {"status": "retrying"}, synchronize_session=False
+        )
+        _clear_outbox(session, list(schedule_ids))
+        with DB_COMMIT_SECONDS.time(operation="retry", table=ScheduledEmail.__tablename__):
+            session.commit()
+        return schedule_ids
+    except Exception as e:
+        session.rollback()
+        raise e
+
+#-------------------------
+#   OUTBOX
+#-------------------------
+
+def _clear_outbox(session, log_ids: list[int]) -> None:
+    """Drop the outbox rows of emails whose outcome is being recorded (commit is up to the caller)."""
+    if log_ids:
+        session.query(OutboxItem).filter(OutboxItem.email_log_id.in_(log_ids)).delete(synchronize_session=False)
+
+
+def _outbox_claimable(now):
+    """Filter for outbox emails no sender holds a live lease on."""
+    return or_(OutboxItem.lease_until.is_(None), OutboxItem.lease_until < now)
+
+
+def claim_outbox(session, claimed_by: str, lease_seconds: float, limit: int) -> list[tuple]:
+    """
+    Atomically claim up to limit outbox emails nobody holds (never claimed,
+    released, or whose lease ran out), oldest first.
+
+    Returns:
+        (list[tuple]): (email_log_id, claims) of each email claimed, claims
+                       counting this one
+    """
+    now = datetime.now(timezone.utc)
+    lease_until = now + timedelta(seconds=lease_seconds)
+    candidates = [row[0] for row in session.query(OutboxItem.id).filter(
+        _outbox_claimable(now)
+    ).order_by(OutboxItem.id).limit(limit)]
+    if not candidates:
+        return []
+    session.execute(
+        update(OutboxItem)
+        .where(OutboxItem.id.in_(candidates), _outbox_claimable(now))
+        .values(claimed_by=claimed_by, lease_until=lease_until, claims=OutboxItem.claims + 1)
+        .execution_options(synchronize_session=False)
+    )
+    with DB_COMMIT_SECONDS.time(operation="claim", table=OutboxItem.__tablename__):
+        session.commit()
+    return [tuple(row) for row in session.query(OutboxItem.email_log_id, OutboxItem.claims).filter(
+        OutboxItem.id.in_(candidates),
+        OutboxItem.claimed_by == claimed_by,
+        OutboxItem.lease_until == lease_until
+    ).order_by(OutboxItem.id)]
+
+
+def release_outbox(session, log_ids: list[int] = None, claimed_by: str = None) -> int:
+    """
+    Give outbox emails back so the next claim takes them: the emails of
+    log_ids, or every email held by claimed_by.
+
+    Returns:
+        (int): how many emails were released
+    """
+    query = session.query(OutboxItem)
+    if log_ids is not None:
+        query = query.filter(OutboxItem.email_log_id.in_(log_ids))
+    if claimed_by is not None:
+        query = query.filter(OutboxItem.claimed_by == claimed_by)
+    released = query.update({"claimed_by": None, "lease_until": None}, synchronize_session=False)
+    session.commit()
+    return released
+
+
+def next_outbox_expiry(session, claimed_by: str):
+    """
+    Earliest time an outbox email held by another replica than claimed_by
+    becomes claimable again, so a crashed replica's emails are picked up.
+
+    Returns:
+        (datetime): the earliest lease expiry, or None
+    """
+    expiry = session.query(OutboxItem.lease_until).filter(
+        OutboxItem.lease_until >= datetime.now(timezone.utc),
+        OutboxItem.claimed_by != claimed_by
+    ).order_by(OutboxItem.lease_until).first()
+    if expiry is None:
+        return None
+    # SQLite hands back naive datetimes, every time in the db is UTC
+    return expiry[0] if expiry[0].tzinfo else expiry[0].replace(tzinfo=timezone.utc)
+
+
+def load_outbox_emails(session, log_ids: list[int]) -> list[dict]:
+    """
+    Get what a sender needs to deliver outbox emails from their EmailLog rows.
+
+    Returns:
+        (list[dict]): "log_id", "recipients", "subject_line", "body" and
+                      "is_html" of each email found, in log_ids order
+    """
+    # Plain rows rather than ORM objects: a replay loads the whole outbox
+    logs = {row.id: row for row in session.execute(
+        select(EmailLog.id, EmailLog.recipients, EmailLog.subject_line, EmailLog.body_text,
+               EmailLog.body_hash, EmailLog.is_html).where(EmailLog.id.in_(log_ids))
+    )}
+    hashes = {row.body_hash for row in logs.values() if row.body_hash}
+    bodies = {row.hash: EmailBody.decode(row.content, row.encoding) for row in session.execute(
+        select(EmailBody.hash, EmailBody.content, EmailBody.encoding).where(EmailBody.hash.in_(hashes))
+    )} if hashes else {}
+    return [
+        {"log_id": row.id, "recipients": split_recipients(row.recipients), "subject_line": row.subject_line,
+         "body": bodies.get(row.body_hash, "") if row.body_hash else row.body_text, "is_html": row.is_html}
+        for row in (logs.get(i) for i in log_ids) if row is not None
+    ]
+
+
+def count_outbox(session) -> int:
+    """Number of emails in the outbox, claimed or not."""
+    return session.query(func.count(OutboxItem.id)).scalar()
+
+#-------------------------
+#   IDEMPOTENCY KEYS
+#-------------------------
+
+def claim_idempotency_key(session, endpoint: str, key: str, request_hash: str, lock_seconds: float):
+    """
+    Lock an idempotency key for a request about to run. An expired row
+    (its response outlived the TTL, or its request never finished) is
+    taken over.
+
+    Args:
+        endpoint (str): the endpoint the key is used on
+        key (str): the Idempotency-Key header
+        request_hash (str): fingerprint of the request
+        lock_seconds (float): how long the key stays locked if the request never finishes
+
+    Returns:
+        (IdempotencyKey): None if the key was claimed, else the row holding it
+    """
+    now = datetime.now(timezone.utc)
+    claim = {"status": "pending", "request_hash": request_hash, "response_code": None,
+             "response_body": None, "created_at": now, "expires_at": now + timedelta(seconds=lock_seconds)}
+    inserted = _insert_or_ignore(session, IdempotencyKey.__table__, dict(claim, endpoint=endpoint, key=key))
+    session.commit()
+    if inserted.rowcount:
+        return None
+
+    row = session.query(IdempotencyKey).filter_by(endpoint=endpoint, key=key).one_or_none()
+    if row is None:
+        # purged in between, try once more
+        return claim_idempotency_key(session, endpoint, key, request_hash, lock_seconds)
+    expires_at = row.expires_at if row.expires_at.tzinfo else row.expires_at.replace(tzinfo=timezone.utc)
+    if expires_at > now:
+        return row
+
+    taken = session.query(IdempotencyKey).filter(
+        IdempotencyKey.id == row.id, IdempotencyKey.expires_at == row.expires_at
+    ).update(claim, synchronize_session=False)
+    session.commit()
+    if taken:
+        return None
+    session.refresh(row)
+    return row
+
+
+def save_idempotent_response(session, endpoint: str, key: str, response_code: int, response_body: str, ttl_seconds: float) -> None:
+    """Store the response of a claimed key, replayed for ttl_seconds."""
+    session.query(IdempotencyKey).filter_by(endpoint=endpoint, key=key).update({
+        "status": "done",
+        "response_code": response_code,
+        "response_body": response_body,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+    }, synchronize_session=False)
+    session.commit()
+
+
+def release_idempotency_key(session, endpoint: str, key: str) -> None:
+    """Unlock a claimed key whose request failed, so it can be retried."""
+    session.query(IdempotencyKey).filter_by(endpoint=endpoint, key=key, status="pending").delete(synchronize_session=False)
+    session.commit()
+
+
 # ------------------------
 #   UNSUBSCRIBE LOGIC TBI
 # ------------------------
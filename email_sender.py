@@ -1,9 +1,20 @@
 #region imports
 import os
+import io
+import hashlib
 import smtplib
 import datetime
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from email import policy
+from email.generator import BytesGenerator
 from email.message import EmailMessage
+from email.utils import getaddresses
 from dotenv import load_dotenv
+from metrics import Counter, Gauge, Histogram
 #endregion
 
 # ------------------------
@@ -16,50 +27,646 @@ EMAIL = os.getenv("EMAIL")
 SMTP_PASS = os.getenv("SMTP_PASS")
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").strip().lower() in ("1", "true", "yes")  # false only for local test servers
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))                      # Max open SMTP sessions
+SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))   # Seconds before an idle session is closed
+SMTP_MESSAGE_CACHE_BYTES = int(os.getenv("SMTP_MESSAGE_CACHE_BYTES", str(64 * 1024 * 1024)))  # Serialized message bodies kept (0 = off)
+
+SEND_RATE_LIMIT = float(os.getenv("SEND_RATE_LIMIT", "0"))                  # Messages per second over all senders (0 = unlimited)
+SEND_RATE_BURST = float(os.getenv("SEND_RATE_BURST", "10"))
+SEND_RATE_PER_SENDER = float(os.getenv("SEND_RATE_PER_SENDER", "0"))        # Messages per second from one sender address (0 = unlimited)
+SEND_RATE_SENDER_BURST = float(os.getenv("SEND_RATE_SENDER_BURST", "10"))
+SEND_RATE_PER_DOMAIN = float(os.getenv("SEND_RATE_PER_DOMAIN", "0"))        # Recipients per second at one domain (0 = unlimited)
+SEND_RATE_DOMAIN_BURST = float(os.getenv("SEND_RATE_DOMAIN_BURST", "10"))
+SEND_RATE_DOMAIN_LIMITS = os.getenv("SEND_RATE_DOMAIN_LIMITS", "")          # Per domain overrides, e.g. "gmail.com=20,yahoo.com=5"
+
+SMTP_STEP_SECONDS = Histogram("smtp_step_duration_seconds", "Duration of SMTP connect, starttls, login and send", ("step",))
+SMTP_STEPS = Counter("smtp_steps_total", "SMTP connect, starttls, login and send by result", ("step", "result"))
+SMTP_POOL_WAIT_SECONDS = Histogram("smtp_pool_wait_seconds", "Time spent waiting for a free SMTP session slot")
+MESSAGE_CACHE_LOOKUPS = Counter("smtp_message_cache_total", "Serialized message body cache lookups by result (hit or miss)", ("result",))
+MESSAGE_CACHE_BYTES = Gauge("smtp_message_cache_bytes", "Bytes of serialized message bodies held in the cache")
+MESSAGE_CACHE_ENTRIES = Gauge("smtp_message_cache_entries", "Serialized message bodies held in the cache")
+SEND_RATE_WAIT_SECONDS = Histogram("send_rate_limit_wait_seconds", "Time sends were held back by the rate limiter, by the limit that held them", ("limit",))
+
+@contextmanager
+def _smtp_step(step: str):
+    """Count and time one SMTP step (connect, starttls, login, send)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SMTP_STEPS.inc(step=step, result="error")
+        raise
+    else:
+        SMTP_STEPS.inc(step=step, result="ok")
+    finally:
+        SMTP_STEP_SECONDS.observe(time.perf_counter() - start, step=step)
+
+
+def _temporary_reply(e: Exception) -> bool:
+    """If the server answered with a 4xx reply (421, 450, 451, 452...): the same send may succeed later."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return bool(e.recipients) and all(400 <= code < 500 for code, _ in e.recipients.values())
+    return isinstance(e, smtplib.SMTPResponseException) and 400 <= e.smtp_code < 500
+
+# ------------------------
+#   SMTP CONNECTION POOL
+# ------------------------
+
+class SMTPConnectionPool:
+    """ Thread-safe pool of authenticated SMTP sessions.
+
+        Sessions are opened lazily (connect, STARTTLS, login) and kept
+        open between sends. Before an idle session is reused it is probed
+        with NOOP, and sessions idle for longer than `idle_timeout` are
+        closed instead of reused.
+
+    Args:
+        host (str): SMTP server host
+        port (int): SMTP server port
+        user (str): login used for the SMTP AUTH
+        password (str): password used for the SMTP AUTH
+        size (int): max number of sessions open at the same time
+        idle_timeout (float): seconds a session may stay idle in the pool
+        timeout (float): socket timeout for every SMTP session
+        starttls (bool): upgrade every session with STARTTLS before login
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str,
+                 size: int = 4, idle_timeout: float = 60, timeout: float = 30, starttls: bool = True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.starttls = starttls
+        self._idle = deque()            # (server, last_used) pairs, most recent on the right
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new SMTP session."""
+        with _smtp_step("connect"):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                with _smtp_step("starttls"):
+                    server.starttls()
+                server.ehlo()
+            with _smtp_step("login"):
+                server.login(self.user, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        """Close a session, ignoring errors from an already dead socket."""
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        """Probe a session with NOOP before it is reused."""
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self) -> smtplib.SMTP:
+        """Return a live idle session, or open a new one."""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            if now - last_used <= self.idle_timeout and self._is_alive(server):
+                return server
+            self._close(server)
+        return self._connect()
+
+    def _checkin(self, server: smtplib.SMTP) -> None:
+        """Return a healthy session to the pool."""
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    @contextmanager
+    def session(self):
+        """ Hold one pooled session for several sends
+
+        Yields:
+            PooledSession: sends over the same SMTP session until the block ends
+        """
+        with SMTP_POOL_WAIT_SECONDS.time():
+            self._slots.acquire()
+        session = PooledSession(self)
+        try:
+            yield session
+        finally:
+            if session.server is not None:
+                self._checkin(session.server)
+            self._slots.release()
+
+    def send_message(self, msg, to_addrs: list[str] = None, from_addr: str = None) -> dict:
+        """ Send a message over a pooled session. If the server dropped
+            the session, reconnect once and retry the send.
+
+        Args:
+            msg (EmailMessage | bytes): the message to send, or its serialized bytes
+            to_addrs (list[str]): envelope recipients (defaults to the To/Cc/Bcc headers,
+                                  required for bytes)
+            from_addr (str): envelope sender (defaults to the From header, or the login for bytes)
+
+        Returns:
+            dict: recipients the server refused (address -> (code, reply))
+        """
+        with self.session() as session:
+            return session.send(msg, to_addrs, from_addr)
+
+    def close_all(self) -> None:
+        """Close every idle session in the pool."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for server, _ in idle:
+            self._close(server)
+
+
+class PooledSession:
+    """ A session checked out of an SMTPConnectionPool by `session()`.
+        The SMTP session is opened on the first send and, if the server
+        drops it, reopened by the next one. A send the server drops or
+        answers with a temporary (4xx) reply is tried once more on a new
+        connection.
+
+    Args:
+        pool (SMTPConnectionPool): the pool the session belongs to
+    """
+
+    def __init__(self, pool: SMTPConnectionPool):
+        self.pool = pool
+        self.server = None
+
+    def _send_once(self, msg, to_addrs, from_addr) -> dict:
+        if self.server is None:
+            self.server = self.pool._checkout()
+        with _smtp_step("send"):
+            if isinstance(msg, bytes):
+                return self.server.sendmail(from_addr or self.pool.user, to_addrs, msg)
+            return self.server.send_message(msg, from_addr=from_addr, to_addrs=to_addrs)
+
+    def send(self, msg, to_addrs: list[str] = None, from_addr: str = None) -> dict:
+        """ Send one SMTP transaction (MAIL FROM, RCPT TO, DATA)
+
+        Args:
+            msg (EmailMessage | bytes): the message to send, or its serialized bytes
+            to_addrs (list[str]): envelope recipients (defaults to the To/Cc/Bcc headers,
+                                  required for bytes)
+            from_addr (str): envelope sender (defaults to the From header, or the login for bytes)
+
+        Returns:
+            dict: recipients the server refused (address -> (code, reply))
+        """
+        try:
+            try:
+                return self._send_once(msg, to_addrs, from_addr)
+            except smtplib.SMTPServerDisconnected:
+                self.pool._close(self.server)
+                self.server = None
+                return self._send_once(msg, to_addrs, from_addr)
+            except smtplib.SMTPResponseException as e:
+                if not _temporary_reply(e):
+                    raise
+                if self.server is not None:
+                    self.pool._close(self.server)
+                    self.server = None
+                return self._send_once(msg, to_addrs, from_addr)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+            # smtplib reset the transaction, the session can be reused
+            raise
+        except Exception:
+            if self.server is not None:
+                self.pool._close(self.server)
+                self.server = None
+            raise
+
+
+smtp_pool = SMTPConnectionPool(
+    SMTP_SERVER, SMTP_PORT, EMAIL, SMTP_PASS,
+    size=SMTP_POOL_SIZE,
+    idle_timeout=SMTP_POOL_IDLE_TIMEOUT,
+    timeout=SMTP_TIMEOUT,
+    starttls=SMTP_STARTTLS,
+)
+
+# ------------------------
+#   MESSAGE CACHE
+# ------------------------
+
+class MessageCache:
+    """ LRU cache of serialized MIME bodies (everything below the
+        Subject/From/To headers), bounded by their total size. Sending
+        the same body to many recipients then only builds the headers
+        of each message instead of serializing the body again.
+
+    Args:
+        max_bytes (int): most bytes held; least recently used bodies are dropped first
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, build) -> bytes:
+        """ Returns the cached bytes of key, building and caching them on a miss
+
+        Args:
+            key (hashable): identifies the content
+            build (callable): returns the bytes when they are not cached
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is not None:
+            MESSAGE_CACHE_LOOKUPS.inc(result="hit")
+            return data
+
+        MESSAGE_CACHE_LOOKUPS.inc(result="miss")
+        data = build()
+        if len(data) <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = data
+                    self.size += len(data)
+                while self.size > self.max_bytes:
+                    _, dropped = self._entries.popitem(last=False)
+                    self.size -= len(dropped)
+        return data
+
+
+message_cache = MessageCache(SMTP_MESSAGE_CACHE_BYTES)
+MESSAGE_CACHE_BYTES.set_function(lambda: message_cache.size)
+MESSAGE_CACHE_ENTRIES.set_function(lambda: len(message_cache))
+
+_HEADER_POLICY = policy.default.clone(linesep="\r\n")
+
+
+@lru_cache(maxsize=1024)
+def _fold_header(name: str, value: str) -> str:
+    """Folds one header line (encoded words for non-ASCII); Subject and From repeat across a bulk send."""
+    return _HEADER_POLICY.header_store_parse(name, value)[1].fold(policy=_HEADER_POLICY)
+
+
+def _serialize_body(body: str, is_html: bool) -> bytes:
+    """Serializes the MIME body of a message (its Content-Type header and parts)."""
+    msg = EmailMessage()
+    _add_body(msg, body, is_html)
+    out = io.BytesIO()
+    BytesGenerator(out, policy=msg.policy).flatten(msg, linesep="\r\n")
+    return out.getvalue()
+
+
+def _message_bytes(to: str, subject: str, body: str, is_html: bool) -> bytes:
+    """ Serialize a message the way smtplib's send_message would, taking
+        the body from the message cache and folding only the headers
+
+    Args:
+        to (str): value of the To header
+        subject (str): the subject line for the email
+        body (str): the body of the email
+        is_html (bool): if the body is formatted in HTML
+
+    Returns:
+        bytes: the message, ready for SMTP DATA
+    """
+    if SMTP_MESSAGE_CACHE_BYTES > 0:
+        key = (hashlib.sha256(body.encode("utf-8", "surrogatepass")).digest(), is_html)
+        mime = message_cache.get(key, lambda: _serialize_body(body, is_html))
+    else:
+        mime = _serialize_body(body, is_html)
+    headers = _fold_header("Subject", subject) + _fold_header("From", EMAIL) + _fold_header("To", to)
+    return headers.encode("ascii", "surrogateescape") + mime
+
+# ------------------------
+#   SEND RATE LIMITS
+# ------------------------
+
+class TokenBucket:
+    """ Token bucket refilled at `rate` tokens per second up to `burst`.
+
+        Tokens are reserved rather than polled for: a caller always takes
+        its tokens, possibly running the bucket into debt, and is told how
+        long to wait until they would have been there, so waiting callers
+        are served in arrival order and none of them spins.
+
+    Args:
+        rate (float): tokens added per second
+        burst (float): most tokens the bucket holds
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available."""
+        self._refill(now)
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def take(self, cost: float) -> None:
+        self.tokens -= cost
+
+
+def _parse_domain_limits(value: str) -> dict:
+    """Parses "gmail.com=20,yahoo.com=5" into {domain: rate}."""
+    limits = {}
+    for item in value.split(","):
+        domain, _, rate = item.partition("=")
+        if domain.strip() and rate.strip():
+            limits[domain.strip().lower()] = float(rate)
+    return limits
+
+
+class SendRateLimiter:
+    """ Global, per sender and per recipient domain token buckets shared
+        by every thread that sends mail. A send over a limit is held back
+        (the calling thread sleeps) until the buckets allow it, instead of
+        being rejected, so sustained throughput settles at the configured
+        rates. A rate of 0 turns that limit off.
+
+    Args:
+        rate (float): messages per second over all senders
+        burst (float): messages sent back to back before `rate` applies
+        sender_rate (float): messages per second from one sender address
+        sender_burst (float): burst of one sender
+        domain_rate (float): recipients per second at one domain
+        domain_burst (float): burst of one domain
+        domain_rates (dict): per domain overrides of domain_rate
+        max_domains (int): domain buckets kept, the least recently used are dropped past it
+    """
+
+    def __init__(self, rate: float = 0, burst: float = 10, sender_rate: float = 0, sender_burst: float = 10,
+                 domain_rate: float = 0, domain_burst: float = 10, domain_rates: dict = None, max_domains: int = 10000):
+        self._global = TokenBucket(rate, burst) if rate > 0 else None
+        self.sender_rate = sender_rate
+        self.sender_burst = sender_burst
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.domain_rates = domain_rates or {}
+        self.max_domains = max_domains
+        self._senders = {}
+        self._domains = OrderedDict()      # domain -> bucket, least recently used first
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._global or self.sender_rate > 0 or self.domain_rate > 0
+                    or any(rate > 0 for rate in self.domain_rates.values()))
+
+    def _domain_bucket(self, domain: str):
+        """Returns the bucket of a domain (None if it is not limited)."""
+        bucket = self._domains.get(domain)
+        if bucket is not None:
+            self._domains.move_to_end(domain)
+            return bucket
+        rate = self.domain_rates.get(domain, self.domain_rate)
+        if rate <= 0:
+            return None
+        while len(self._domains) >= max(1, self.max_domains):
+            self._domains.popitem(last=False)
+        bucket = self._domains[domain] = TokenBucket(rate, self.domain_burst)
+        return bucket
+
+    def reserve(self, sender: str, recipients: list[str]) -> tuple[float, str]:
+        """ Take the tokens of one message from `sender` to `recipients`
+            without waiting (callers that must not block, such as the
+            asyncio engine, sleep on the result themselves)
+
+        Args:
+            sender (str): address the message is sent from
+            recipients (list[str]): addresses the message is sent to
+
+        Returns:
+            float: seconds to wait before the message may be sent
+            str: the limit that holds it back ("global", "sender" or "domain"), or None
+        """
+        if not self.enabled:
+            return 0.0, None
+
+        per_domain = {}
+        for address in recipients:
+            domain = address.rpartition("@")[2].strip().lower()
+            if domain:
+                per_domain[domain] = per_domain.get(domain, 0) + 1
+
+        with self._lock:
+            now = time.monotonic()
+            buckets = []
+            if self._global:
+                buckets.append(("global", self._global, 1))
+            if self.sender_rate > 0 and sender:
+                bucket = self._senders.get(sender)
+                if bucket is None:
+                    bucket = self._senders[sender] = TokenBucket(self.sender_rate, self.sender_burst)
+                buckets.append(("sender", bucket, 1))
+            for domain, count in per_domain.items():
+                bucket = self._domain_bucket(domain)
+                if bucket is not None:
+                    buckets.append(("domain", bucket, count))
+
+            wait, limit = 0.0, None
+            for name, bucket, cost in buckets:
+                needed = bucket.wait_time(cost, now)
+                if needed > wait:
+                    wait, limit = needed, name
+            for _, bucket, cost in buckets:
+                bucket.take(cost)
+        return wait, limit
+
+    def acquire(self, sender: str, recipients: list[str]) -> float:
+        """ Wait until one message from `sender` to `recipients` is allowed
+
+        Args:
+            sender (str): address the message is sent from
+            recipients (list[str]): addresses the message is sent to
+
+        Returns:
+            float: seconds the caller was held back
+        """
+        wait, limit = self.reserve(sender, recipients)
+        if wait > 0:
+            time.sleep(wait)
+            SEND_RATE_WAIT_SECONDS.observe(wait, limit=limit)
+        return wait
+
+
+rate_limiter = SendRateLimiter(
+    SEND_RATE_LIMIT, SEND_RATE_BURST,
+    sender_rate=SEND_RATE_PER_SENDER,
+    sender_burst=SEND_RATE_SENDER_BURST,
+    domain_rate=SEND_RATE_PER_DOMAIN,
+    domain_burst=SEND_RATE_DOMAIN_BURST,
+    domain_rates=_parse_domain_limits(SEND_RATE_DOMAIN_LIMITS),
+)
 
 # ------------------------
 #   SEND EMAIL
 # ------------------------
 
 def send_email(recipients: list[str], subject: str, body: str, is_html: bool = False) -> tuple[bool, int, str]:
-    """ Uses the SMTP information saved in the .env file to 
-        send an email using smtplib
+    """ Uses the SMTP information saved in the .env file to
+        send an email through the shared SMTP connection pool.
+        Blocks while the send rate limits are reached.
 
     Args:
         recipiants (list[str]): list of the emails for the recipiants
         subject (str): the subject line for the email
         body (str): the body of the email
         is_html (bool): if the body is formatted in HTML
-    
+
     Returns:
         bool: If email was sucessfully sent
         int: Status code for the email
         str: Status message for the email
     """
     try:
+        to = [r.strip() for r in recipients if r and r.strip()]
+        msg = _prepare_message(', '.join(to), to, subject, body, is_html)
+
+        rate_limiter.acquire(EMAIL, to)
+        smtp_pool.send_message(msg, [address for _, address in getaddresses(to)], EMAIL)
+
+        return True, 200, "Email sent successfully"
+
+    except Exception as e:
+        return _failure(e)
+
+
+def send_email_envelopes(envelopes: list[list[str]], subject: str, body: str, is_html: bool = False) -> list[tuple]:
+    """ Send one email to several envelopes over a single pooled SMTP
+        session: the message is serialized once and each envelope is its own
+        SMTP transaction (RCPT TO of its recipients, then DATA). The To
+        header reads "undisclosed-recipients:;" so recipients of a shared
+        transaction do not see each other.
+
+    Args:
+        envelopes (list[list[str]]): recipients of each SMTP transaction
+        subject (str): the subject line for the email
+        body (str): the body of the email
+        is_html (bool): if the body is formatted in HTML
+
+    Returns:
+        list[tuple]: per envelope, in order: if it was sent (bool), its
+                     status code (int), status message (str) and the
+                     refused recipients (dict: address -> SMTP reply code)
+    """
+    return list(iter_email_envelopes(envelopes, subject, body, is_html))
+
+
+def iter_email_envelopes(envelopes: list[list[str]], subject: str, body: str, is_html: bool = False):
+    """ send_email_envelopes, one envelope at a time: each result is
+        yielded as soon as its SMTP transaction returns, before the next
+        envelope is sent, so the caller can record it first. Envelopes
+        after the caller stops iterating are not sent.
+
+    Args:
+        envelopes (list[list[str]]): recipients of each SMTP transaction
+        subject (str): the subject line for the email
+        body (str): the body of the email
+        is_html (bool): if the body is formatted in HTML
+
+    Yields:
+        tuple: the result of the next envelope (see send_email_envelopes)
+    """
+    try:
+        msg = _prepare_message("undisclosed-recipients:;", [a for to in envelopes for a in to], subject, body, is_html)
+    except Exception as e:
+        for _ in envelopes:
+            yield _failure(e) + ({},)
+        return
+
+    done = 0
+    try:
+        with smtp_pool.session() as session:
+            for to in envelopes:
+                try:
+                    rate_limiter.acquire(EMAIL, to)
+                    refused = session.send(msg, to, EMAIL)
+                    result = (True, 200, "Email sent successfully", {a: r[0] for a, r in refused.items()})
+                except smtplib.SMTPRecipientsRefused as e:
+                    result = _failure(e) + ({a: r[0] for a, r in e.recipients.items()},)
+                except Exception as e:
+                    result = _failure(e) + ({},)
+                done += 1
+                yield result
+    except Exception as e:
+        # the pool itself failed (the envelopes sent so far keep their results)
+        for _ in envelopes[done:]:
+            yield _failure(e) + ({},)
+
+
+def _prepare_message(to: str, to_addrs: list[str], subject: str, body: str, is_html: bool):
+    """ Returns the message to send: its serialized bytes, or an
+        EmailMessage when an address is not ASCII (smtplib then
+        negotiates SMTPUTF8 for it)
+
+    Args:
+        to (str): value of the To header
+        to_addrs (list[str]): envelope recipients
+        subject (str): the subject line for the email
+        body (str): the body of the email
+        is_html (bool): if the body is formatted in HTML
+    """
+    if not all(address.isascii() for address in [EMAIL or "", *to_addrs]):
         msg = EmailMessage()
         msg['Subject'] = subject
         msg['From'] = EMAIL
-        msg['To'] = ', '.join([r.strip() for r in recipients if r and r.strip()])
+        msg['To'] = to
+        _add_body(msg, body, is_html)
+        return msg
+    return _message_bytes(to, subject, body, is_html)
 
-        if is_html:
-            msg.add_alternative(body, subtype="html")
-        else:
-            msg.add_alternative(f"<html><body><pre style='white-space: pre-wrap'>{body}</pre></body></html>", subtype="html")
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.ehlo()
-            server.starttls()
-            server.login(EMAIL, SMTP_PASS)
-            server.send_message(msg)
+def _add_body(msg: EmailMessage, body: str, is_html: bool) -> None:
+    """Adds the HTML body of send_email to a message (plain text is wrapped in <pre>)."""
+    if is_html:
+        msg.add_alternative(body, subtype="html")
+    else:
+        msg.add_alternative(f"<html><body><pre style='white-space: pre-wrap'>{body}</pre></body></html>", subtype="html")
 
-        return True, 200, "Email sent successfully"
 
-    except smtplib.SMTPAuthenticationError as e:
+def _failure(e: Exception) -> tuple[bool, int, str]:
+    """ Maps an exception raised while sending to send_email's (success, status code, message).
+        Temporary (4xx) replies map to 503, which the scheduler retries.
+    """
+    if _temporary_reply(e):
+        return False, 503, f"SMTP temporary failure: {e}"
+    if isinstance(e, smtplib.SMTPAuthenticationError):
         return False, 401, f"SMTP auth failed: {e}"
-    except smtplib.SMTPConnectError as e:
+    if isinstance(e, smtplib.SMTPConnectError):
         return False, 503, f"SMTP connection failed: {e}"
-    except smtplib.SMTPException as e:
+    if isinstance(e, smtplib.SMTPException):
         return False, 500, f"SMTP error: {e}"
-    except Exception as e:
-        return False, 520, f"Unknown error: {e}"
\ No newline at end of file
+    return False, 520, f"Unknown error: {e}"
@@ -0,0 +1,524 @@
+#region imports
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from database import get_db, save_email_log, save_queued_email_log, save_queued_email_logs, update_email_logs, save_scheduled_email, save_scheduled_emails
+from async_engine import deliver
+from scheduler import notify_scheduled, is_transient, schedule_retries
+from send_queue import enqueue_email, outbox_claim, send_batch
+from confirmations import queue_confirmations
+from idempotency import mark_committed
+#endregion
+
+# ------------------------
+#   ENV LOAD AND SETUP
+# ------------------------
+
+BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", "5000"))  # Max messages per /send-email/batch request
+TIMED_BATCH_MAX_MESSAGES = int(os.getenv("TIMED_BATCH_MAX_MESSAGES", "50000"))  # Max messages per /send-timed-email/batch request
+TIMED_BATCH_CHUNK_SIZE = int(os.getenv("TIMED_BATCH_CHUNK_SIZE", "5000"))       # Timed emails inserted per transaction
+
+# ------------------------
+#   REQUEST VALIDATION
+# ------------------------
+
+def normalize_recipients(raw: list[str]) -> list[str]:
+    """ Returns a cleaned list of recipiants from an email request.
+        (Trims spaces, makes lowercase, removes duplicated / empty)
+    
+    Args:
+        raw (list[str]): Inputted list of emails 
+    
+    Returns:
+        list[str]: the cleaned version of the raw list
+    """
+    if not isinstance(raw, list):
+        return None
+    cleaned = []
+    seen = set()
+    for r in raw:
+        if isinstance(r, str):
+            v = r.strip().lower()
+            if v and v not in seen:
+                seen.add(v)
+                cleaned.append(v)
+    return cleaned
+
+
+def parse_flag(value, default: bool):
+    """ Reads an optional boolean flag of a request (a JSON boolean, or
+        "true"/"false"/"1"/"0" in any case)
+
+    Args:
+        value: the flag as sent, None if it is missing
+        default (bool): the flag when it is missing
+
+    Returns:
+        bool: the flag, or None if the value is not a boolean
+    """
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("true", "1"):
+            return True
+        if text in ("false", "0"):
+            return False
+    return None
+
+
+def validate_lengths(subject_line: str, body: str) -> bool:
+    """ Light input guardrails to keep logs and payloads reasonable.
+        Limites can be adjusted as needed.
+
+    Args:
+        subject_line (str): subject line of the email
+        body (str): body of the email
+    
+    Returns:
+        Boolean: If the subject line and body are smaller than max
+        str: Error message for if it's too large
+    """
+    MAX_SUBJECT = 256
+    MAX_BODY = 100_000
+    if len(subject_line) > MAX_SUBJECT:
+        return False, f"'subject_line' too long (>{MAX_SUBJECT})"
+    if len(body) > MAX_BODY:
+        return False, f"'body' too long (>{MAX_BODY} chars)"
+    return True, ""
+
+
+def parse_email_request(data: dict):
+    """ Reads and validates the fields of a single email request
+        (the JSON package of /send-email or one item of /send-email/batch)
+
+    Args:
+        data (dict): the JSON package of the email
+
+    Returns:
+        dict: the cleaned fields ("recipients", "subject_line", "body",
+              "is_html", "used_legacy"), or None if the request is invalid
+        str: Error message for if the request is invalid
+    """
+    if not isinstance(data, dict):
+        return None, "Invalid message"
+    used_legacy = "recipiants" in data and "recipients" not in data
+    recipients_raw = data.get("recipients", data.get("recipiants", []))
+    subject_line = data.get("subject_line", "")
+    body = data.get("body", "")
+    is_html = bool(data.get("is_html", False))
+
+    # Normalize recipients
+    recipients = normalize_recipients(recipients_raw)
+    if recipients is None:
+        return None, "Invalid 'recipients'"
+    if not recipients:
+        return None, "Empty 'recipients'"
+
+    # Required fields
+    if not subject_line:
+        return None, "Missing 'subject_line'"
+    if not body:
+        return None, "Missing 'body'"
+
+    # Length guardrails
+    ok, reason = validate_lengths(subject_line, body)
+    if not ok:
+        return None, reason
+
+    return {
+        "recipients": recipients,
+        "subject_line": subject_line,
+        "body": body,
+        "is_html": is_html,
+        "used_legacy": used_legacy,
+    }, ""
+
+def parse_timed_email_request(data: dict, send_times: dict = None):
+    """ Reads and validates the fields of a timed email request
+        (the JSON package of /send-timed-email or one item of /send-timed-email/batch)
+
+    Args:
+        data (dict): the JSON package of the email
+        send_times (dict): optional, parsed send times by (date, time), shared
+                           by the items of a batch so each is parsed once
+
+    Returns:
+        dict: the cleaned fields ("recipients", "subject_line", "body", "is_html",
+              "time_to_send", "date_to_send", "scheduled_dt", "used_legacy"),
+              or None if the request is invalid
+        str: Error message for if the request is invalid
+    """
+    if not isinstance(data, dict):
+        return None, "Invalid message"
+    used_legacy = "recipiants" in data and "recipients" not in data
+    recipients_raw = data.get("recipients", data.get("recipiants", []))
+    subject_line = data.get("subject_line", "")
+    body = data.get("body", "")
+    is_html = bool(data.get("is_html", False))
+    time_to_send = data.get("time_to_send", "")
+    date_to_send = data.get("date_to_send", "")
+
+    # Presence check
+    if not all([recipients_raw, subject_line, body, time_to_send, date_to_send]):
+        return None, "Missing required fields"
+
+    # Normalize recipients
+    recipients = normalize_recipients(recipients_raw)
+    if recipients is None:
+        return None, "Invalid 'recipients'"
+    if not recipients:
+        return None, "Empty 'recipients'"
+
+    # Length guardrails
+    ok, reason = validate_lengths(subject_line, body)
+    if not ok:
+        return None, reason
+
+    # Combine date+time → UTC aware
+    send_times = {} if send_times is None else send_times
+    scheduled_dt = send_times.get((date_to_send, time_to_send))
+    if scheduled_dt is None:
+        try:
+            scheduled_dt = datetime.strptime(f"{date_to_send} {time_to_send}", "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            return None, "Invalid date or time format"
+        send_times[(date_to_send, time_to_send)] = scheduled_dt
+
+    if scheduled_dt <= datetime.now(timezone.utc):
+        return None, "Scheduled time must be in the future"
+
+    return {
+        "recipients": recipients,
+        "subject_line": subject_line,
+        "body": body,
+        "is_html": is_html,
+        "time_to_send": time_to_send,
+        "date_to_send": date_to_send,
+        "scheduled_dt": scheduled_dt,
+        "used_legacy": used_legacy,
+    }, ""
+
+
+# ------------------------
+#   SEND
+# ------------------------
+
+def send_email_request(data: dict, is_async: bool = False) -> tuple[dict, int]:
+    """ Validate and send (or queue) one email, as /send-email does
+
+    Args:
+        data (dict): the JSON package of the email
+        is_async (bool): queue the email for the background senders and return right away
+
+    Returns:
+        dict: the response payload ("status", "message", "statusCode", ...)
+        int: HTTP status code of the response
+    """
+    # Read and validate user input
+    fields, reason = parse_email_request(data)
+    if fields is None:
+        return {"status": "failed", "message": reason, "statusCode": 400}, 400
+    recipients = fields["recipients"]
+    subject_line = fields["subject_line"]
+    body = fields["body"]
+    is_html = fields["is_html"]
+    used_legacy = fields["used_legacy"]
+
+    # Optional confirmation copy to owner
+    confirm_to = os.getenv("CONFIRMATION_TO")
+    if confirm_to:
+        ct = confirm_to.strip().lower()
+        if ct and ct not in recipients:
+            recipients.append(ct)
+
+    # Queue for the background senders (the outbox keeps it if they are full or the app stops)
+    if is_async:
+        with get_db() as db:
+            message_id = save_queued_email_log(db, recipients, subject_line, body, is_html, outbox_claim=outbox_claim())
+        if message_id is None:
+            return {"status": "failed", "message": "Failed to queue email", "statusCode": 500}, 500
+        mark_committed()
+        enqueue_email(message_id, recipients, subject_line, body, is_html)
+
+        payload = {
+            "status": "queued",
+            "message": "Email queued for delivery",
+            "details": {"message_id": message_id, "recipients": recipients, "subject_line": subject_line},
+            "statusCode": 202
+        }
+        if used_legacy:
+            payload["hint"] = "Use 'recipients' instead of legacy 'recipiants'."
+        return payload, 202
+
+    # Send
+    success, status_code, message = deliver(recipients, subject_line, body, is_html)
+    if success:
+        mark_committed()
+
+    # Transient failure: log it and let the scheduler retry with backoff
+    if not success and is_transient(status_code):
+        with get_db() as db:
+            message_id = save_queued_email_log(db, recipients, subject_line, body, is_html)
+            retry = schedule_retries(db, [(message_id, status_code)]).get(message_id) if message_id else None
+        if retry:
+            mark_committed()
+            schedule_id, next_attempt_at = retry
+            payload = {
+                "status": "retrying",
+                "message": f"{message} (retry scheduled)",
+                "details": {
+                    "message_id": message_id,
+                    "schedule_id": schedule_id,
+                    "next_attempt_at": next_attempt_at.isoformat(),
+                    "recipients": recipients,
+                    "subject_line": subject_line
+                },
+                "statusCode": 202
+            }
+            if used_legacy:
+                payload["hint"] = "Use 'recipients' instead of legacy 'recipiants'."
+            return payload, 202
+
+    # Log
+    with get_db() as db:
+        save_email_log(db, recipients, subject_line, body, is_html, success, status_code)
+
+    # Response
+    payload = {
+        "status": "success" if success else "failed",
+        "message": "Email sent successfully" if success else message,
+        "details": {"recipients": recipients, "subject_line": subject_line} if success else None,
+        "statusCode": 200 if success else status_code
+    }
+    if used_legacy:
+        payload["hint"] = "Use 'recipients' instead of legacy 'recipiants'."
+    return payload, (200 if success else status_code)
+
+
+def send_email_batch_request(data: dict) -> tuple[dict, int]:
+    """ Validate, log and send many emails in parallel, as /send-email/batch does.
+        If any message is invalid nothing is sent.
+
+    Args:
+        data (dict): the JSON package with the "messages" list
+
+    Returns:
+        dict: the response payload ("status", "message", "statusCode", "details" or "errors")
+        int: HTTP status code of the response
+    """
+    messages_raw = data.get("messages") if isinstance(data, dict) else None
+
+    if not isinstance(messages_raw, list) or not messages_raw:
+        return {"status": "failed", "message": "Missing 'messages'", "statusCode": 400}, 400
+    if len(messages_raw) > BATCH_MAX_MESSAGES:
+        return {"status": "failed", "message": f"Too many messages (>{BATCH_MAX_MESSAGES})", "statusCode": 400}, 400
+
+    # Validate every message before sending any
+    messages, errors = [], []
+    for i, m in enumerate(messages_raw):
+        fields, reason = parse_email_request(m)
+        if fields is None:
+            errors.append({"index": i, "message": reason})
+        else:
+            messages.append(fields)
+    if errors:
+        return {"status": "failed", "message": "Invalid messages", "errors": errors, "statusCode": 400}, 400
+
+    start = time.perf_counter()
+
+    # Log all emails in one transaction, send in parallel, then record all outcomes
+    with get_db() as db:
+        message_ids = save_queued_email_logs(db, messages)
+    mark_committed()
+    outcomes = send_batch(messages)
+    with get_db() as db:
+        update_email_logs(db, [
+            (message_id, success, status_code)
+            for message_id, (success, status_code, _) in zip(message_ids, outcomes)
+            if success or not is_transient(status_code)
+        ])
+        retries = schedule_retries(db, [
+            (message_id, status_code)
+            for message_id, (success, status_code, _) in zip(message_ids, outcomes)
+            if not success and is_transient(status_code)
+        ])
+
+    elapsed = time.perf_counter() - start
+    results = []
+    for i, (message_id, (success, status_code, message)) in enumerate(zip(message_ids, outcomes)):
+        result = {
+            "index": i,
+            "message_id": message_id,
+            "status": "success" if success else "failed",
+            "statusCode": 200 if success else status_code,
+            "message": "Email sent successfully" if success else message
+        }
+        if message_id in retries:
+            result.update(status="retrying", statusCode=202, message=f"{message} (retry scheduled)",
+                          schedule_id=retries[message_id][0], next_attempt_at=retries[message_id][1].isoformat())
+        results.append(result)
+    sent = sum(1 for r in results if r["status"] == "success")
+    retrying = sum(1 for r in results if r["status"] == "retrying")
+    failed = len(results) - sent - retrying
+
+    payload = {
+        "status": "success" if not failed and not retrying else ("partial" if sent or retrying else "failed"),
+        "message": f"Sent {sent} of {len(results)} emails" + (f", {retrying} will be retried" if retrying else ""),
+        "details": {
+            "results": results,
+            "sent": sent,
+            "retrying": retrying,
+            "failed": failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "messages_per_second": round(len(results) / elapsed, 2) if elapsed > 0 else None
+        },
+        "statusCode": 200
+    }
+    return payload, 200
+
+
+# ------------------------
+#   SCHEDULE
+# ------------------------
+
+def schedule_email_request(data: dict) -> tuple[dict, int]:
+    """ Validate and store one timed email, as /send-timed-email does
+
+    Args:
+        data (dict): the JSON package of the email
+
+    Returns:
+        dict: the response payload ("status", "message", "statusCode", ...)
+        int: HTTP status code of the response
+    """
+    # Read and validate user input
+    fields, reason = parse_timed_email_request(data)
+    if fields is None:
+        return {"status": "failed", "message": reason, "statusCode": 400}, 400
+    recipients = fields["recipients"]
+    subject_line = fields["subject_line"]
+    body = fields["body"]
+    is_html = fields["is_html"]
+    time_to_send = fields["time_to_send"]
+    date_to_send = fields["date_to_send"]
+    scheduled_dt = fields["scheduled_dt"]
+    used_legacy = fields["used_legacy"]
+
+    # Create id and persist
+    schedule_id = uuid.uuid4().hex
+    with get_db() as db:
+        # Save scheduled email
+        scheduled_ok = save_scheduled_email(db, schedule_id, recipients, subject_line, body, is_html, scheduled_dt)
+    if not scheduled_ok:
+        print("[send-timed-email] Failed to save scheduled email")
+        return {"status": "failed", "message": "Failed to schedule email", "statusCode": 500}, 500
+    mark_committed()
+    notify_scheduled(schedule_id, scheduled_dt)
+    # Confirmation to owner, sent in the background with the next digest
+    queue_confirmations([{"schedule_id": schedule_id, "recipients": recipients,
+                          "subject_line": subject_line, "scheduled_dt": scheduled_dt}])
+    payload = {
+        "status": "success",
+        "message": "Timed email created successfully",
+        "details": {
+            "schedule_id": schedule_id,
+            "recipients": recipients,
+            "subject_line": subject_line,
+            "time_to_send": time_to_send,
+            "date_to_send": date_to_send
+        },
+        "statusCode": 201
+    }
+    if used_legacy:
+        payload["hint"] = "Use 'recipients' instead of legacy 'recipiants'."
+    return payload, 201
+
+
+def schedule_email_batch_request(data: dict) -> tuple[dict, int]:
+    """ Validate and store many timed emails with bulk inserts,
+        TIMED_BATCH_CHUNK_SIZE per transaction, as /send-timed-email/batch
+        does. If any message is invalid nothing is scheduled.
+
+    Args:
+        data (dict): the JSON package with the "messages" list
+
+    Returns:
+        dict: the response payload ("status", "message", "statusCode", "details" or "errors")
+        int: HTTP status code of the response
+    """
+    messages_raw = data.get("messages") if isinstance(data, dict) else None
+
+    if not isinstance(messages_raw, list) or not messages_raw:
+        return {"status": "failed", "message": "Missing 'messages'", "statusCode": 400}, 400
+    if len(messages_raw) > TIMED_BATCH_MAX_MESSAGES:
+        return {"status": "failed", "message": f"Too many messages (>{TIMED_BATCH_MAX_MESSAGES})", "statusCode": 400}, 400
+
+    # Validate every message before storing any
+    messages, errors, send_times = [], [], {}
+    for i, m in enumerate(messages_raw):
+        fields, reason = parse_timed_email_request(m, send_times)
+        if fields is None:
+            errors.append({"index": i, "message": reason})
+        else:
+            fields["schedule_id"] = uuid.uuid4().hex
+            messages.append(fields)
+    if errors:
+        return {"status": "failed", "message": "Invalid messages", "errors": errors, "statusCode": 400}, 400
+
+    # Store in chunks, one transaction each, so a huge batch never holds the write lock for long
+    start = time.perf_counter()
+    scheduled = 0
+    failure = None
+    try:
+        with get_db() as db:
+            for i in range(0, len(messages), TIMED_BATCH_CHUNK_SIZE):
+                scheduled += save_scheduled_emails(db, messages[i:i + TIMED_BATCH_CHUNK_SIZE])
+    except Exception as e:
+        print(f"[send-timed-email-batch] stopped after {scheduled} of {len(messages)} emails: {e}")
+        failure = e
+    elapsed = time.perf_counter() - start
+
+    if not scheduled:
+        return {"status": "failed", "message": "Failed to schedule emails", "statusCode": 500}, 500
+    mark_committed()
+
+    # The committed chunks are sent whatever happened to the rest
+    stored = messages[:scheduled]
+
+    # Wake the scheduler once per distinct send time, not once per email
+    for scheduled_dt in sorted({m["scheduled_dt"] for m in stored}):
+        notify_scheduled("", scheduled_dt)
+
+    # Confirmation to owner, sent in the background with the next digest
+    queue_confirmations(stored)
+
+    if failure is not None:
+        # Not a 5xx: the stored emails must not be scheduled again by a retry under the same idempotency key
+        return {
+            "status": "partial",
+            "message": f"Scheduled {scheduled} of {len(messages)} emails, the rest failed",
+            "details": {
+                "schedule_ids": [m["schedule_id"] for m in stored],
+                "scheduled": scheduled,
+                "failed": len(messages) - scheduled
+            },
+            "statusCode": 207
+        }, 207
+
+    payload = {
+        "status": "success",
+        "message": f"Scheduled {scheduled} emails",
+        "details": {
+            "schedule_ids": [m["schedule_id"] for m in messages],
+            "scheduled": scheduled,
+            "elapsed_seconds": round(elapsed, 3),
+            "schedules_per_second": round(scheduled / elapsed, 2) if elapsed > 0 else None
+        },
+        "statusCode": 201
+    }
+    return payload, 201
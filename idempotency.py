@@ -0,0 +1,163 @@
+#region imports
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, timezone, timedelta
+
+from database import get_db, claim_idempotency_key, save_idempotent_response, release_idempotency_key
+from metrics import Counter, Gauge
+#endregion
+
+# ------------------------
+#   ENV LOAD AND SETUP
+# ------------------------
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))   # How long the response of a key is replayed
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))   # How long a key stays locked by a request that never finished
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))      # Finished responses also kept in memory
+MAX_KEY_LENGTH = 255
+
+SERVER_ERROR = {"status": "failed", "message": "Server error", "statusCode": 500}
+
+IDEMPOTENCY_REQUESTS = Counter("idempotency_requests_total", "Requests with an Idempotency-Key by outcome", ("outcome",))
+
+# ------------------------
+#   HOT CACHE
+# ------------------------
+
+class _HotCache:
+    """ Finished responses of recent keys, so a retried request is
+        answered without a database round trip. The database stays the
+        source of truth (it is shared by every replica); only responses
+        that can no longer change are cached.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries = OrderedDict()       # (endpoint, key) -> (request_hash, code, body, expires_at)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, endpoint: str, key: str):
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+            if entry is None:
+                return None
+            if entry[3] <= datetime.now(timezone.utc):
+                del self._entries[(endpoint, key)]
+                return None
+            self._entries.move_to_end((endpoint, key))
+            return entry
+
+    def put(self, endpoint: str, key: str, entry: tuple) -> None:
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[(endpoint, key)] = entry
+            self._entries.move_to_end((endpoint, key))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+_cache = _HotCache(IDEMPOTENCY_CACHE_SIZE)
+Gauge("idempotency_cache_entries", "Idempotent responses held in memory").set_function(lambda: len(_cache))
+
+# ------------------------
+#   REQUEST LIFECYCLE
+# ------------------------
+
+# False while a request holding a new key runs, True once it committed a side effect, None otherwise
+_committed = ContextVar("idempotency_committed", default=None)
+
+
+def mark_committed() -> None:
+    """ Record that the running request committed a side effect (an email
+        sent, queued or scheduled). A 5xx it ends with is then stored for
+        its key like any other response, so a retry does not repeat it.
+        Does nothing outside a request holding an Idempotency-Key.
+    """
+    if _committed.get() is not None:
+        _committed.set(True)
+
+
+def _take_committed() -> bool:
+    """Whether the running request marked a commit, clearing the mark."""
+    committed = bool(_committed.get())
+    _committed.set(None)
+    return committed
+
+
+def begin(endpoint: str, key: str, request_hash: str) -> tuple:
+    """ Look up an Idempotency-Key before its request runs, locking it
+        if it is new
+
+    Args:
+        endpoint (str): the endpoint the key is used on
+        key (str): the Idempotency-Key header
+        request_hash (str): fingerprint of the request
+
+    Returns:
+        str: "new" (run the request), "replay" (return the stored response),
+             "mismatch" (key reused for another request) or "in_progress"
+        tuple: (status code, body) of the stored response when replaying
+    """
+    entry = _cache.get(endpoint, key)
+    if entry is not None:
+        if entry[0] != request_hash:
+            IDEMPOTENCY_REQUESTS.inc(outcome="mismatch")
+            return "mismatch", None
+        IDEMPOTENCY_REQUESTS.inc(outcome="replayed")
+        return "replay", (entry[1], entry[2])
+
+    with get_db() as db:
+        row = claim_idempotency_key(db, endpoint, key, request_hash, IDEMPOTENCY_LOCK_SECONDS)
+        if row is None:
+            IDEMPOTENCY_REQUESTS.inc(outcome="new")
+            _committed.set(False)
+            return "new", None
+        if row.request_hash != request_hash:
+            IDEMPOTENCY_REQUESTS.inc(outcome="mismatch")
+            return "mismatch", None
+        if row.status != "done":
+            IDEMPOTENCY_REQUESTS.inc(outcome="in_progress")
+            return "in_progress", None
+        expires_at = row.expires_at if row.expires_at.tzinfo else row.expires_at.replace(tzinfo=timezone.utc)
+        _cache.put(endpoint, key, (row.request_hash, row.response_code, row.response_body, expires_at))
+        IDEMPOTENCY_REQUESTS.inc(outcome="replayed")
+        return "replay", (row.response_code, row.response_body)
+
+
+def finish(endpoint: str, key: str, request_hash: str, status_code: int, body: str) -> None:
+    """ Store the response of a request that claimed its key. Server
+        errors (5xx) unlock the key instead, so the client can retry,
+        unless the request had already committed (see mark_committed).
+
+    Args:
+        endpoint (str): the endpoint the key is used on
+        key (str): the Idempotency-Key header
+        request_hash (str): fingerprint of the request
+        status_code (int): HTTP status of the response
+        body (str): body of the response
+    """
+    committed = _take_committed()
+    with get_db() as db:
+        if status_code >= 500 and not committed:
+            release_idempotency_key(db, endpoint, key)
+            return
+        save_idempotent_response(db, endpoint, key, status_code, body, IDEMPOTENCY_TTL_SECONDS)
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    _cache.put(endpoint, key, (request_hash, status_code, body, expires_at))
+
+
+def release(endpoint: str, key: str) -> None:
+    """Unlock a key whose request raised, or store a 500 for it if the request had already committed."""
+    committed = _take_committed()
+    with get_db() as db:
+        if committed:
+            save_idempotent_response(db, endpoint, key, 500, json.dumps(SERVER_ERROR), IDEMPOTENCY_TTL_SECONDS)
+        else:
+            release_idempotency_key(db, endpoint, key)
@@ -0,0 +1,227 @@
+#region imports
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+#endregion
+
+# ------------------------
+#   METRIC TYPES
+# ------------------------
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+
+REGISTRY = []
+
+
+class _Metric:
+    """ Base of the metric types. Every thread writes to its own shard,
+        so updates never take a lock; shards are only summed when the
+        metrics are rendered. The lock is taken once per thread, when
+        its shard is created. Shards of finished threads are folded into
+        one totals shard (when rendering, and as new threads add shards),
+        so short lived request threads do not pile up.
+
+    Args:
+        name (str): metric name (Prometheus naming, e.g. "smtp_send_seconds")
+        help (str): one line description shown in /metrics
+        labelnames (tuple[str]): names of the labels every update must give
+    """
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = {}               # thread -> its shard
+        self._totals = {}               # shards of finished threads, merged
+        self._fold_at = 64              # fold again once this many shards exist
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _shard(self) -> dict:
+        """Returns the calling thread's shard (label values -> value)."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                if len(self._shards) >= self._fold_at:
+                    self._fold_finished()
+                    self._fold_at = max(64, 2 * len(self._shards))
+                self._shards[threading.current_thread()] = shard
+        return shard
+
+    def _fold_finished(self) -> None:
+        """Merge the shards of threads that ended into the totals (the caller holds the lock)."""
+        for thread in [t for t in self._shards if not t.is_alive()]:
+            self._merge(self._totals, self._shards.pop(thread))
+
+    def _merged(self) -> dict:
+        """Returns the totals and every live shard summed (label values -> value)."""
+        result = {}
+        with self._lock:
+            self._fold_finished()
+            self._merge(result, self._totals)
+            for shard in list(self._shards.values()):
+                self._merge(result, shard)
+        return result
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        """Add the values of a shard to another."""
+        raise NotImplementedError
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _label_text(self, key: tuple, extra: str = "") -> str:
+        """Returns the {name="value",...} part of a sample line."""
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A value that only goes up (events, errors, rows)."""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        for key, value in list(shard.items()):
+            into[key] = into.get(key, 0) + value
+
+    def values(self) -> dict:
+        """Returns the total of every label set, summed over the threads."""
+        return self._merged()
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in sorted(self.values().items())]
+
+
+class Gauge(_Metric):
+    """ A value that goes up and down. Either set it, or give it a
+        function that is called each time the metrics are rendered.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function) -> None:
+        """ Compute the gauge when rendered
+
+        Args:
+            function (callable): returns the value (a number, or a dict of
+                                 label values tuple -> number for labelled gauges)
+        """
+        self._function = function
+
+    def render(self) -> list[str]:
+        values = dict(self._values)
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception as e:
+                print(f"[metrics] gauge {self.name} failed: {e}")
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """ Distribution of durations (or sizes) in fixed buckets, with the
+        sum and count of the observations.
+
+    Args:
+        buckets (tuple[float]): upper bounds of the buckets, ascending
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # per bucket counts (the last one is +Inf), sum
+            state = shard[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with block took, even if it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        for key, (counts, total) in list(shard.items()):
+            merged = into.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            for i, count in enumerate(list(counts)):
+                merged[0][i] += count
+            merged[1] += total
+
+    def snapshot(self) -> dict:
+        """Returns label values -> (per bucket counts, sum), summed over the threads."""
+        return self._merged()
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(self.snapshot().items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                labels = self._label_text(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {running}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {running}")
+        return lines
+
+
+# ------------------------
+#   EXPOSITION
+# ------------------------
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """ Returns every registered metric in the Prometheus text format
+
+    Returns:
+        str: the body of the /metrics response
+    """
+    lines = []
+    for metric in list(REGISTRY):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
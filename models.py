@@ -1,6 +1,7 @@
 #region imports
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
-from sqlalchemy.orm import declarative_base
+import zlib
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Index, LargeBinary, ForeignKey, text
+from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime, timezone
 #endregion 
 
@@ -12,31 +13,156 @@ Base = declarative_base()
 
 utcnow = lambda: datetime.now(timezone.utc)  
 
-class EmailLog(Base):
+def _first_attempt(context):
+    """A scheduled email is first attempted at its scheduled_time."""
+    return context.get_current_parameters().get("scheduled_time")
+
+class EmailBody(Base):
+    """Email bodies stored once, keyed by the sha256 of the text, compressed"""
+    __tablename__ = "email_bodies"
+    hash = Column(String(64), primary_key=True)
+    content = Column(LargeBinary, nullable=False)
+    encoding = Column(String(16), nullable=False, default="zlib")
+    size = Column(Integer, nullable=False)                          # bytes before compression
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+
+    @property
+    def text(self) -> str:
+        return self.decode(self.content, self.encoding)
+
+    @staticmethod
+    def decode(content: bytes, encoding: str) -> str:
+        """The text of a stored body from its content and encoding columns."""
+        data = zlib.decompress(content) if encoding == "zlib" else content
+        return data.decode("utf-8")
+
+
+class _StoredBodyMixin:
+    """ Emails keep their body in email_bodies. Rows written before that
+        still have the text in the legacy body column until init_db()
+        migrates them.
+    """
+
+    @property
+    def body(self) -> str:
+        if self.body_hash:
+            return self.stored_body.text if self.stored_body is not None else ""
+        return self.body_text
+
+
+class EmailLog(_StoredBodyMixin, Base):
     __tablename__ = "email_logs"
     id = Column(Integer, primary_key=True, index=True)
     recipients = Column(Text, nullable=False)
     subject_line = Column(String(500), nullable=False)
-    body = Column(Text, nullable=False)
+    body_text = Column("body", Text, nullable=False, default="")    # legacy inline body
+    body_hash = Column(String(64), ForeignKey("email_bodies.hash"), nullable=True, index=True)
+    stored_body = relationship(EmailBody, lazy="select")
+    recipient_rows = relationship("EmailRecipient", foreign_keys="EmailRecipient.email_log_id", lazy="select")
     is_html = Column(Boolean, default=False)
     status = Column(String(50), default="pending")
     status_code = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), default=utcnow)  
     sent_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=1, server_default="1")   # send attempts made
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)            # set while status is "retrying"
+
+    __table_args__ = (
+        # purge_logs: sent_at <= purge date (failed / queued rows have no sent_at)
+        Index("ix_email_logs_sent_at", "sent_at",
+              sqlite_where=text("sent_at IS NOT NULL"), postgresql_where=text("sent_at IS NOT NULL")),
+    )
     
-class ScheduledEmail(Base):
+class ScheduledEmail(_StoredBodyMixin, Base):
     __tablename__ = "scheduled_emails"
     id = Column(Integer, primary_key=True, index=True)
     schedule_id = Column(String(64), unique=True, index=True, nullable=False)
     recipients = Column(Text, nullable=False)
     subject_line = Column(String(500), nullable=False)
-    body = Column(Text, nullable=False)
+    body_text = Column("body", Text, nullable=False, default="")    # legacy inline body
+    body_hash = Column(String(64), ForeignKey("email_bodies.hash"), nullable=True, index=True)
+    stored_body = relationship(EmailBody, lazy="select")
+    recipient_rows = relationship("EmailRecipient", foreign_keys="EmailRecipient.scheduled_email_id", lazy="select")
     is_html = Column(Boolean, default=False)
     scheduled_time = Column(DateTime(timezone=True), nullable=False)
     status = Column(String(50), default="scheduled")
     status_code = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), default=utcnow)  
     sent_at = Column(DateTime(timezone=True), nullable=True)
+    claimed_by = Column(String(128), nullable=True)                 # scheduler replica that claimed the email
+    lease_until = Column(DateTime(timezone=True), nullable=True)    # claim expires after this time
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")   # send attempts made
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True, default=_first_attempt)  # when the scheduler sends it next
+    email_log_id = Column(Integer, ForeignKey("email_logs.id"), nullable=True)  # EmailLog this email retries (immediate sends)
+
+    __table_args__ = (
+        # scheduler: status == "scheduled" and next_attempt_at <= now, ordered by next_attempt_at
+        Index("ix_scheduled_emails_status_due", "status", "next_attempt_at"),
+        # purge_logs: sent_at <= purge date (unsent rows have no sent_at)
+        Index("ix_scheduled_emails_sent_at", "sent_at",
+              sqlite_where=text("sent_at IS NOT NULL"), postgresql_where=text("sent_at IS NOT NULL")),
+    )
+
+class EmailRecipient(Base):
+    """ One row per (email, recipient) with the delivery status for that
+        address. A scheduled email's rows are linked to its EmailLog once
+        it is sent, so each address keeps a single row per email.
+    """
+    __tablename__ = "email_recipients"
+    id = Column(Integer, primary_key=True)
+    email_log_id = Column(Integer, ForeignKey("email_logs.id"), nullable=True, index=True)
+    scheduled_email_id = Column(Integer, ForeignKey("scheduled_emails.id"), nullable=True, index=True)
+    address = Column(String(320), nullable=False)                   # lowercase email address
+    status = Column(String(50), default="pending")
+    status_code = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # /recipients/<address>/history: address == x, newest first
+        Index("ix_email_recipients_address_time", "address", "created_at"),
+    )
+
+class OutboxItem(Base):
+    """ A queued email waiting for (or held by) a background sender. The
+        row is written in the same transaction as its "queued" EmailLog
+        and deleted in the one that records the outcome, so an email whose
+        sender died before that is picked up again after a restart.
+    """
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True)
+    email_log_id = Column(Integer, ForeignKey("email_logs.id"), nullable=False, unique=True)
+    claimed_by = Column(String(128), nullable=True)                 # replica whose senders hold the email
+    lease_until = Column(DateTime(timezone=True), nullable=True)    # claim expires after this time (None = pending)
+    claims = Column(Integer, nullable=False, default=0, server_default="0")     # times the email was handed to a sender
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+
+    __table_args__ = (
+        # outbox feeder: lease_until is None or lease_until < now
+        Index("ix_outbox_lease_until", "lease_until"),
+    )
+
+class IdempotencyKey(Base):
+    """ The response of a request sent with an Idempotency-Key header,
+        replayed when the same key is sent again until expires_at.
+        A "pending" row locks the key while the first request runs.
+    """
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True)
+    endpoint = Column(String(64), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)               # sha256 of the request JSON
+    status = Column(String(16), nullable=False, default="pending")  # "pending" or "done"
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_endpoint_key", "endpoint", "key", unique=True),
+        # purge: expires_at <= now
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
 
 """
 class DoNotSendLog(Base):
@@ -1,29 +1,310 @@
+import heapq
+import os
+import random
+import socket
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 
-from database import get_db, save_email_log
-from models import ScheduledEmail, EmailLog
-from email_sender import send_email
+from sqlalchemy import or_, update, select
 
-CHECK_INTERVAL_SECONDS = 60  # Check each 60 seconds
-PURGE_DAYS = 7               # Purge emails sent after this many days
+from database import get_db, save_email_log, save_retry_emails, update_email_log, split_recipients
+from models import ScheduledEmail, EmailLog, EmailBody, EmailRecipient, IdempotencyKey
+from email_sender import iter_email_envelopes
+from async_engine import deliver
+from metrics import Counter, Gauge, Histogram
 
-def _fetch_due_scheduled_emails(db):
-    """ Gets the scheduled emails where the scheduled_time is now or already happened
-        and the email is not processed yet
+PURGE_INTERVAL_SECONDS = float(os.getenv("PURGE_INTERVAL_SECONDS", "3600"))   # Purge old logs each hour
+PURGE_DAYS = int(os.getenv("PURGE_DAYS", "7"))                          # Purge emails sent after this many days
+EMAIL_LOG_PURGE_DAYS = int(os.getenv("EMAIL_LOG_PURGE_DAYS", str(PURGE_DAYS)))              # Per table override (0 keeps forever)
+SCHEDULED_EMAIL_PURGE_DAYS = int(os.getenv("SCHEDULED_EMAIL_PURGE_DAYS", str(PURGE_DAYS)))  # Per table override (0 keeps forever)
+PURGE_CHUNK_SIZE = int(os.getenv("PURGE_CHUNK_SIZE", "1000"))           # Rows deleted per transaction
+PURGE_CHUNK_PAUSE_SECONDS = float(os.getenv("PURGE_CHUNK_PAUSE_SECONDS", "0.05"))  # Pause between chunks so writers get the lock
+SCHEDULER_PRELOAD = int(os.getenv("SCHEDULER_PRELOAD", "1000"))         # Upcoming emails kept in the timer heap
+SCHEDULER_RESYNC_SECONDS = float(os.getenv("SCHEDULER_RESYNC_SECONDS", "300"))  # Reload the heap from the db at least this often
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))            # Threads sending due emails
+SCHEDULER_MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", str(SCHEDULER_WORKERS)))  # Max due emails handed to the workers at once
+SCHEDULER_REPLICA_ID = os.getenv("SCHEDULER_REPLICA_ID", f"{socket.gethostname()}-{os.getpid()}")  # Name used when claiming emails
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))  # How long a claim is held before another replica may take it
+SCHEDULER_CLAIM_BATCH = int(os.getenv("SCHEDULER_CLAIM_BATCH", "100"))  # Max due emails claimed at once
+SCHEDULER_COALESCE = os.getenv("SCHEDULER_COALESCE", "true").strip().lower() in ("1", "true", "yes")  # Send due emails with the same content together
+SCHEDULER_COALESCE_MAX_RECIPIENTS = int(os.getenv("SCHEDULER_COALESCE_MAX_RECIPIENTS", "100"))  # Recipients per SMTP transaction
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))          # Attempts before an email is marked "dead"
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", "30"))       # Delay before the first retry (doubles each attempt)
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", "3600"))       # Longest delay between two attempts
+RETRYABLE_STATUS_CODES = {int(c) for c in os.getenv("RETRYABLE_STATUS_CODES", "503,520").split(",") if c.strip()}  # send_email codes worth retrying
+
+SCHEDULER_RUN_SECONDS = Histogram("scheduler_run_duration_seconds", "Time the scheduler loop spends claiming and sending due emails once woken")
+SCHEDULER_CLAIMED = Counter("scheduler_claimed_total", "Scheduled emails claimed by this replica")
+SCHEDULER_PROCESSED = Counter("scheduler_processed_total", "Scheduled emails processed by status", ("status",))
+SCHEDULER_DUE = Gauge("scheduler_due_emails", "Scheduled emails that are due and not sent yet (all replicas)")
+SCHEDULER_TIMER_SIZE = Gauge("scheduler_timer_heap_size", "Upcoming emails held in the scheduler timer")
+PURGE_SECONDS = Histogram("purge_duration_seconds", "Duration of a full purge run",
+                          buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+PURGE_ROWS = Counter("purge_rows_total", "Rows deleted by the purge", ("table",))
+RETRIES = Counter("email_retries_total", "Emails rescheduled after a transient failure, and emails given up on", ("outcome",))
+SCHEDULER_COALESCED = Counter("scheduler_coalesced_emails_total", "Scheduled emails sent in a transaction shared with other emails of the same content")
+SCHEDULER_TRANSACTIONS = Counter("scheduler_smtp_transactions_total", "SMTP transactions (DATA) used to send scheduled emails")
+
+
+def _as_utc(dt: datetime) -> datetime:
+    """SQLite hands back naive datetimes, every time in the db is UTC."""
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+class ScheduleTimer:
+    """ In-process wakeup engine for scheduled emails.
+
+        Keeps the next upcoming scheduled times in a min-heap so the
+        scheduler can sleep until the earliest one is due instead of
+        polling the database. Only the first `preload` upcoming emails
+        are held in memory; `horizon` is the latest time loaded, and
+        anything scheduled after it is picked up by a later reload.
+
+    Args:
+        preload (int): max number of upcoming emails kept in the heap
+        resync_seconds (float): max seconds between reloads from the db
+    """
+
+    def __init__(self, preload: int = 1000, resync_seconds: float = 300):
+        self.preload = max(1, preload)
+        self.resync_seconds = resync_seconds
+        self._heap = []                 # (next_attempt_at, schedule_id)
+        self._horizon = None            # None = every upcoming email is in the heap
+        self._notified = None           # entries added while a reload is running
+        self._reload_at = 0.0           # monotonic time of the next forced reload
+        self._cond = threading.Condition()
+
+    def reload(self, db) -> None:
+        """ Replace the heap with the next upcoming emails from the db
+
+        Args:
+            db (database session): The open session of the database
+        """
+        with self._cond:
+            self._notified = []
+        rows = db.query(ScheduledEmail.next_attempt_at, ScheduledEmail.schedule_id).filter(
+            ScheduledEmail.status == "scheduled"
+        ).order_by(ScheduledEmail.next_attempt_at).limit(self.preload).all()
+
+        with self._cond:
+            heap = [(_as_utc(t), sid) for t, sid in rows] + self._notified
+            heapq.heapify(heap)
+            self._heap = heap
+            self._horizon = _as_utc(rows[-1][0]) if len(rows) >= self.preload else None
+            self._notified = None
+            self._reload_at = time.monotonic() + self.resync_seconds
+
+    def needs_reload(self) -> bool:
+        """Reload when the resync interval passed or a truncated heap ran dry."""
+        with self._cond:
+            if time.monotonic() >= self._reload_at:
+                return True
+            return not self._heap and self._horizon is not None
+
+    def force_reload(self) -> None:
+        """Reload from the db on the next loop, e.g. after popped emails could not be sent."""
+        with self._cond:
+            self._reload_at = 0.0
+
+    def notify(self, schedule_id: str, scheduled_time: datetime) -> None:
+        """ Add a newly scheduled email, waking the scheduler if it is
+            now the earliest one
+
+        Args:
+            schedule_id (str): the schedule id of the email
+            scheduled_time (datetime): when the email should be sent
+        """
+        scheduled_time = _as_utc(scheduled_time)
+        with self._cond:
+            if self._notified is not None:
+                self._notified.append((scheduled_time, schedule_id))
+            if self._horizon is not None and scheduled_time > self._horizon:
+                return
+            earlier = not self._heap or scheduled_time < self._heap[0][0]
+            heapq.heappush(self._heap, (scheduled_time, schedule_id))
+            if earlier:
+                self._cond.notify_all()
+
+    def wait(self, until: float) -> None:
+        """ Sleep until the earliest email is due, a new earlier email
+            arrives, or the monotonic deadline `until` is reached
+
+        Args:
+            until (float): monotonic time to wake up at the latest
+        """
+        with self._cond:
+            until = min(until, self._reload_at)
+            while True:
+                timeout = until - time.monotonic()
+                if self._heap:
+                    head = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+                    timeout = min(timeout, head)
+                if timeout <= 0:
+                    return
+                if not self._cond.wait(timeout):
+                    return
+
+    def pop_due(self) -> int:
+        """ Remove every due email from the heap
+
+        Returns:
+            int: how many emails in the heap were due
+        """
+        now = datetime.now(timezone.utc)
+        due = 0
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+                due += 1
+        return due
+
+
+_timer = ScheduleTimer(SCHEDULER_PRELOAD, SCHEDULER_RESYNC_SECONDS)
+SCHEDULER_TIMER_SIZE.set_function(lambda: len(_timer._heap))
+
+
+def notify_scheduled(schedule_id: str, scheduled_time: datetime) -> None:
+    """Tell the running scheduler about a newly scheduled email."""
+    _timer.notify(schedule_id, scheduled_time)
+
+def _claimable(now: datetime):
+    """Filter for due emails that no replica holds a live lease on."""
+    return (
+        ScheduledEmail.status == "scheduled",
+        ScheduledEmail.next_attempt_at <= now,
+        or_(ScheduledEmail.lease_until.is_(None), ScheduledEmail.lease_until < now),
+    )
+
+
+def _fetch_due_scheduled_emails(db, limit: int = SCHEDULER_CLAIM_BATCH):
+    """ Gets the scheduled emails whose next attempt (the scheduled_time, or a
+        retry) is now or already happened, the email is not processed yet and
+        no other replica is holding it
     
     Args:
         db (database session): The open session of the database
+        limit (int): max number of emails returned
 
     Returns:
-        All the emails that haven't been sent out yet and should be.
+        The ids of the emails that haven't been sent out yet and should be,
+        ordered by next_attempt_at.
     """
     now = datetime.now(timezone.utc)
-    return db.query(ScheduledEmail).filter(
+    rows = db.query(ScheduledEmail.id).filter(
+        *_claimable(now)
+    ).order_by(ScheduledEmail.next_attempt_at, ScheduledEmail.id).limit(limit).all()
+    return [row.id for row in rows]
+
+
+def _claim_due_scheduled_emails(db):
+    """ Atomically claim a batch of due emails for this replica. The
+        conditional UPDATE only takes rows whose lease is free or expired,
+        so two replicas never claim the same email at the same time.
+        A crashed replica's claims become free again once its lease ends.
+
+    Args:
+        db (database session): The open session of the database
+
+    Returns:
+        The ids of the emails claimed by this replica, ordered by next_attempt_at.
+    """
+    candidates = _fetch_due_scheduled_emails(db)
+    if not candidates:
+        return []
+
+    now = datetime.now(timezone.utc)
+    lease_until = now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+    db.execute(
+        update(ScheduledEmail)
+        .where(ScheduledEmail.id.in_(candidates), *_claimable(now))
+        .values(claimed_by=SCHEDULER_REPLICA_ID, lease_until=lease_until)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    rows = db.query(ScheduledEmail.id).filter(
+        ScheduledEmail.id.in_(candidates),
+        ScheduledEmail.claimed_by == SCHEDULER_REPLICA_ID,
+        ScheduledEmail.lease_until == lease_until
+    ).order_by(ScheduledEmail.next_attempt_at, ScheduledEmail.id).all()
+    return [row.id for row in rows]
+
+
+def _next_lease_expiry(db):
+    """ Gets the earliest time a due email leased by another replica
+        becomes claimable again, so a crashed replica's work is picked up.
+
+    Returns:
+        datetime: the earliest lease expiry, or None
+    """
+    now = datetime.now(timezone.utc)
+    expiry = db.query(ScheduledEmail.lease_until).filter(
         ScheduledEmail.status == "scheduled",
-        ScheduledEmail.scheduled_time <= now
-    ).all()
+        ScheduledEmail.next_attempt_at <= now,
+        ScheduledEmail.lease_until >= now
+    ).order_by(ScheduledEmail.lease_until).first()
+    return expiry[0] if expiry else None
+
+
+def _count_due_emails() -> int:
+    """Number of due scheduled emails, for the scheduler_due_emails gauge."""
+    with get_db() as db:
+        return db.query(ScheduledEmail.id).filter(
+            ScheduledEmail.status == "scheduled",
+            ScheduledEmail.next_attempt_at <= datetime.now(timezone.utc)
+        ).count()
+
+
+SCHEDULER_DUE.set_function(_count_due_emails)
+
+
+# ------------------------
+#   RETRIES
+# ------------------------
+
+def is_transient(status_code: int) -> bool:
+    """If a send_email failure code is worth retrying (connection / unknown errors)."""
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def retry_delay(attempts: int) -> float:
+    """ Seconds to wait before the next attempt: exponential backoff
+        with jitter, so emails that failed together do not all retry
+        at the same moment
+
+    Args:
+        attempts (int): attempts made so far (1 after the first failure)
+
+    Returns:
+        float: a delay between half and all of the capped backoff
+    """
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def schedule_retries(db, failures: list) -> dict:
+    """ Hand emails whose first (immediate) attempt failed with a
+        transient error over to the scheduler
+
+    Args:
+        db (database session): The open session of the database
+        failures (list[tuple]): (log_id, status_code) of each failed email
+
+    Returns:
+        dict: log_id -> (schedule_id, next_attempt_at) of each retry
+    """
+    now = datetime.now(timezone.utc)
+    planned = [(log_id, status_code, now + timedelta(seconds=retry_delay(1))) for log_id, status_code in failures]
+    schedule_ids = save_retry_emails(db, planned)
+    retries = {}
+    for log_id, _, next_attempt_at in planned:
+        if log_id in schedule_ids:
+            retries[log_id] = (schedule_ids[log_id], next_attempt_at)
+            _timer.notify(schedule_ids[log_id], next_attempt_at)
+    RETRIES.inc(len(retries), outcome="scheduled")
+    return retries
 
 
 def _process_single_email(db, scheduled: ScheduledEmail):
@@ -34,7 +315,7 @@ def _process_single_email(db, scheduled: ScheduledEmail):
         db (database instance): The open session of the database
         scheduled (ScheduledEmail): The column of the email to send from email.db
     """
-    recipients = [r.strip() for r in scheduled.recipients.split(",") if r.strip()]
+    recipients = split_recipients(scheduled.recipients)
 
     if not recipients:
         print(f"[scheduler] scheduled email {scheduled.schedule_id} has no valid recipients, skipping")
@@ -42,76 +323,410 @@ def _process_single_email(db, scheduled: ScheduledEmail):
         return
 
     # Attempt to send
-    success, status_code, _ = send_email(
+    success, status_code, _ = deliver(
         recipients=recipients,
         subject=scheduled.subject_line,
         body=scheduled.body,
         is_html=scheduled.is_html
     )
+    SCHEDULER_TRANSACTIONS.inc()
+    _record_attempt(db, scheduled, recipients, success, status_code)
+
 
-    # Update scheduled email status
+def _record_attempt(db, scheduled: ScheduledEmail, recipients: list[str], success: bool, status_code: int, refused: dict = None):
+    """ Save the outcome of one send attempt of a scheduled email: a
+        retry for transient failures with attempts left, otherwise its
+        final status and email log
+
+    Args:
+        db (database instance): The open session of the database
+        scheduled (ScheduledEmail): The email that was sent
+        recipients (list[str]): The addresses it was sent to
+        success (bool): If the email was sent
+        status_code (int): The status code returned by send_email
+        refused (dict): Recipients the SMTP server refused (address -> reply code)
+    """
     now = datetime.now(timezone.utc)
-    scheduled.status = "sent" if success else "failed"
+    attempts = (scheduled.attempts or 0) + 1
+    scheduled.attempts = attempts
+    scheduled.lease_until = None
+
+    # Transient failure: try again later, served by the same due query
+    if not success and is_transient(status_code) and attempts < RETRY_MAX_ATTEMPTS:
+        scheduled.status_code = status_code
+        scheduled.next_attempt_at = now + timedelta(seconds=retry_delay(attempts))
+        if scheduled.email_log_id:
+            db.query(EmailLog).filter(EmailLog.id == scheduled.email_log_id).update(
+                {"attempts": attempts, "status_code": status_code, "next_attempt_at": scheduled.next_attempt_at},
+                synchronize_session=False
+            )
+        _timer.notify(scheduled.schedule_id, scheduled.next_attempt_at)
+        RETRIES.inc(outcome="scheduled")
+        print(f"[scheduler] email {scheduled.schedule_id} failed with {status_code} (attempt {attempts}), "
+              f"retrying at {scheduled.next_attempt_at.isoformat()}")
+        return
+
+    # Update scheduled email status ("dead" once transient failures used up every attempt)
+    status = "sent" if success else ("dead" if is_transient(status_code) else "failed")
+    if status == "dead":
+        RETRIES.inc(outcome="dead")
+    scheduled.status = status
     scheduled.sent_at = now if success else None
     scheduled.status_code = 200 if success else status_code
 
-    # Log the email
+    # A retried immediate send completes its own log row
+    if scheduled.email_log_id:
+        if not update_email_log(db, scheduled.email_log_id, success, status_code, status=status, attempts=attempts, refused=refused):
+            print(f"[scheduler] Failed to update log of retried email {scheduled.schedule_id}")
+        return
+
+    # Log the email (it shares the stored body of the scheduled email)
     log_success = save_email_log(
         db,
         recipients=recipients,
         subject_line=scheduled.subject_line,
-        body=scheduled.body,
+        body=None if scheduled.body_hash else scheduled.body,
         is_html=scheduled.is_html,
         success=success,
-        status_code=status_code
+        status_code=status_code,
+        body_hash=scheduled.body_hash,
+        scheduled_email_id=scheduled.id,
+        status=status,
+        attempts=attempts,
+        refused=refused
     )
     if not log_success:
         print(f"[scheduler] Failed to log scheduled email {scheduled.schedule_id}")
 
-def purge_logs(db):
-    purge_date = datetime.now(timezone.utc) - timedelta(days=PURGE_DAYS)
 
-    #Delete all logs after purge date
-    db.query(EmailLog).filter(
-        EmailLog.sent_at <= purge_date
-    ).delete()
+# ------------------------
+#   COALESCING
+# ------------------------
 
-    db.query(ScheduledEmail).filter(
-        ScheduledEmail.sent_at.isnot(None),
-        ScheduledEmail.sent_at <= purge_date
-    ).delete()
+def _coalesce(due_ids: list[int]) -> list[list[int]]:
+    """ Group claimed emails with the same content (stored body, subject
+        and format) so each group can be sent over one SMTP session
 
-    db.commit()
+    Args:
+        due_ids (list[int]): ids of the claimed emails, ordered by next_attempt_at
 
+    Returns:
+        list[list[int]]: the groups, in the order of their first email
+    """
+    if not SCHEDULER_COALESCE or len(due_ids) < 2:
+        return [[email_id] for email_id in due_ids]
+    with get_db() as db:
+        content = {
+            row.id: (row.body_hash, row.subject_line, row.is_html) if row.body_hash else row.id
+            for row in db.query(
+                ScheduledEmail.id, ScheduledEmail.body_hash, ScheduledEmail.subject_line, ScheduledEmail.is_html
+            ).filter(ScheduledEmail.id.in_(due_ids))
+        }
+    groups = {}
+    for email_id in due_ids:
+        groups.setdefault(content.get(email_id, email_id), []).append(email_id)
+    return list(groups.values())
 
-def check_scheduled_emails_loop():
-    """ This function is the main loop for the scheduler. It looks
-        through all the scheduled emails to find ones that need to be sent
-        ever minute, and attempts to send them.
+
+def _pack_envelopes(emails: list) -> list[tuple]:
+    """ Pack emails of the same content into SMTP transactions of at most
+        SCHEDULER_COALESCE_MAX_RECIPIENTS recipients. An address is never
+        given twice in one transaction, so nobody gets fewer copies than
+        they would have got from separate sends.
+
+    Args:
+        emails (list[tuple]): (ScheduledEmail, recipients) pairs
+
+    Returns:
+        list[tuple]: (emails of the transaction, its recipients) pairs
+    """
+    envelopes = []
+    members, to, seen = [], [], set()
+    for scheduled, recipients in emails:
+        if members and (len(to) + len(recipients) > SCHEDULER_COALESCE_MAX_RECIPIENTS or seen.intersection(recipients)):
+            envelopes.append((members, to))
+            members, to, seen = [], [], set()
+        members.append((scheduled, recipients))
+        to.extend(recipients)
+        seen.update(recipients)
+    if members:
+        envelopes.append((members, to))
+    return envelopes
+
+
+def _process_scheduled_group(email_ids: list[int]) -> list[tuple]:
+    """ Worker task: send claimed emails with identical content over one
+        SMTP session, packing their recipients into shared transactions,
+        and record the result of every email and recipient. Each
+        transaction's emails are committed as soon as it returns, so a
+        worker that dies mid-group only leaves unsent emails claimed.
+
+    Args:
+        email_ids (list[int]): ids of the ScheduledEmail rows (claimed by this replica)
+
+    Returns:
+        list[tuple]: (schedule id, status) of every email processed
+    """
+    with get_db() as db:
+        try:
+            rows = db.query(ScheduledEmail).filter(
+                ScheduledEmail.id.in_(email_ids),
+                ScheduledEmail.status == "scheduled",
+                ScheduledEmail.claimed_by == SCHEDULER_REPLICA_ID
+            ).order_by(ScheduledEmail.next_attempt_at, ScheduledEmail.id).all()
+            if not rows:
+                return []
+
+            emails = []
+            for scheduled in rows:
+                recipients = list(dict.fromkeys(split_recipients(scheduled.recipients)))
+                if recipients:
+                    emails.append((scheduled, recipients))
+                else:
+                    print(f"[scheduler] scheduled email {scheduled.schedule_id} has no valid recipients, skipping")
+                    scheduled.status = "failed"
+            processed = [(scheduled.schedule_id, scheduled.status) for scheduled in rows if scheduled.status == "failed"]
+            db.commit()
+
+            envelopes = _pack_envelopes(emails)
+            first = emails[0][0] if emails else None
+            results = iter_email_envelopes([to for _, to in envelopes], first.subject_line, first.body, first.is_html) if first else []
+
+            for (members, _), (success, status_code, _, refused) in zip(envelopes, results):
+                SCHEDULER_TRANSACTIONS.inc()
+                if len(members) > 1:
+                    SCHEDULER_COALESCED.inc(len(members))
+                for scheduled, recipients in members:
+                    mine = {a: code for a, code in refused.items() if a in recipients}
+                    if success and len(mine) == len(recipients):
+                        # every recipient of this email was refused
+                        _record_attempt(db, scheduled, recipients, False, 500, mine)
+                    else:
+                        _record_attempt(db, scheduled, recipients, success, status_code, mine)
+                    processed.append((scheduled.schedule_id, scheduled.status))
+                db.commit()
+            return processed
+        except Exception:
+            db.rollback()
+            raise
+
+def _detach_references(db, model, ids: list[int]) -> None:
+    """ Unlink the rows that reference emails about to be purged.
+        An email_recipients row still linked to the other table (the
+        EmailLog of a sent scheduled email, or the other way round) is
+        kept for it, and retry rows forget the log they retried.
+
+    Args:
+        db (database session): The open session of the database
+        model (Base): EmailLog or ScheduledEmail
+        ids (list[int]): ids of the emails being purged
+    """
+    if model is EmailLog:
+        fk, other = EmailRecipient.email_log_id, EmailRecipient.scheduled_email_id
+    elif model is ScheduledEmail:
+        fk, other = EmailRecipient.scheduled_email_id, EmailRecipient.email_log_id
+    else:
+        return
+    db.query(EmailRecipient).filter(fk.in_(ids), other.is_(None)).delete(synchronize_session=False)
+    db.query(EmailRecipient).filter(fk.in_(ids)).update({fk: None}, synchronize_session=False)
+    if model is EmailLog:
+        # retry rows of immediate sends point at their log too
+        db.query(ScheduledEmail).filter(ScheduledEmail.email_log_id.in_(ids)).update(
+            {ScheduledEmail.email_log_id: None}, synchronize_session=False
+        )
+
+
+def _purge_table(db, model, *filters) -> int:
+    """ Delete the rows of a table matching filters in chunks of
+        PURGE_CHUNK_SIZE rows, one transaction per chunk, pausing between
+        chunks so other writers are not blocked for long
+
+    Args:
+        db (database session): The open session of the database
+        model (Base): the table to purge
+        filters: SQLAlchemy filters selecting the rows to delete
+
+    Returns:
+        int: how many rows were deleted
+    """
+    key = model.__mapper__.primary_key[0]
+    removed = 0
+    while True:
+        ids = [row[0] for row in db.query(key).filter(*filters).limit(PURGE_CHUNK_SIZE).all()]
+        if not ids:
+            return removed
+        _detach_references(db, model, ids)
+        # filters are checked again by the DELETE in case a row changed meanwhile
+        removed += db.query(model).filter(key.in_(ids), *filters).delete(synchronize_session=False)
+        db.commit()
+        if len(ids) < PURGE_CHUNK_SIZE:
+            return removed
+        time.sleep(PURGE_CHUNK_PAUSE_SECONDS)
+
+
+def purge_logs(db) -> dict:
+    """ Delete sent emails older than their table's purge age, bodies no
+        email uses anymore and expired idempotency keys
+
+    Args:
+        db (database session): The open session of the database
+
+    Returns:
+        dict: rows removed per table and the seconds spent
+    """
+    start = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    report = {}
+
+    if EMAIL_LOG_PURGE_DAYS > 0:
+        report[EmailLog.__tablename__] = _purge_table(
+            db, EmailLog,
+            EmailLog.sent_at <= now - timedelta(days=EMAIL_LOG_PURGE_DAYS)
+        )
+
+    if SCHEDULED_EMAIL_PURGE_DAYS > 0:
+        report[ScheduledEmail.__tablename__] = _purge_table(
+            db, ScheduledEmail,
+            ScheduledEmail.sent_at.isnot(None),
+            ScheduledEmail.sent_at <= now - timedelta(days=SCHEDULED_EMAIL_PURGE_DAYS)
+        )
+
+    # Bodies no email refers to anymore
+    report[EmailBody.__tablename__] = _purge_table(
+        db, EmailBody,
+        ~EmailBody.hash.in_(select(EmailLog.body_hash).where(EmailLog.body_hash.isnot(None))),
+        ~EmailBody.hash.in_(select(ScheduledEmail.body_hash).where(ScheduledEmail.body_hash.isnot(None)))
+    )
+
+    # Idempotency keys past their TTL
+    report[IdempotencyKey.__tablename__] = _purge_table(db, IdempotencyKey, IdempotencyKey.expires_at <= now)
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    PURGE_SECONDS.observe(report["seconds"])
+    for table, rows in report.items():
+        if table != "seconds":
+            PURGE_ROWS.inc(rows, table=table)
+    return report
+
+
+def _process_scheduled_id(email_id: int):
+    """ Worker task: send one scheduled email in its own database
+        session and commit it on its own
+
+    Args:
+        email_id (int): the id of the ScheduledEmail row (claimed by this replica)
+
+    Returns:
+        str: the schedule id of the email (None if it was already handled)
+        str: the status of the email after processing
+    """
+    with get_db() as db:
+        try:
+            scheduled = db.get(ScheduledEmail, email_id)
+            if scheduled is None or scheduled.status != "scheduled" or scheduled.claimed_by != SCHEDULER_REPLICA_ID:
+                return None, None
+            _process_single_email(db, scheduled)
+            schedule_id, status = scheduled.schedule_id, scheduled.status
+            db.commit()
+            return schedule_id, status
+        except Exception:
+            db.rollback()
+            raise
+
+
+_dispatch_pool = ThreadPoolExecutor(max_workers=max(1, SCHEDULER_WORKERS), thread_name_prefix="email-scheduler")
+_in_flight = threading.BoundedSemaphore(max(1, SCHEDULER_MAX_IN_FLIGHT))
+
+
+def _send_due_emails():
+    """ Claim and send every scheduled email that is due, one claim
+        batch at a time. If other replicas hold due emails, wake up again
+        when their lease runs out in case they crashed.
     """
     while True:
+        with get_db() as db:
+            due_ids = _claim_due_scheduled_emails(db)
+            if not due_ids:
+                expiry = _next_lease_expiry(db)
+                if expiry is not None:
+                    _timer.notify("", expiry)
+                return
+        SCHEDULER_CLAIMED.inc(len(due_ids))
+        print(f"[scheduler] now={datetime.now(timezone.utc).isoformat()} claimed={len(due_ids)} replica={SCHEDULER_REPLICA_ID}")
+        _dispatch_claimed(due_ids)
+
+
+def _dispatch_claimed(due_ids: list[int]):
+    """ Send claimed emails over the worker pool. Emails are handed out
+        in next_attempt_at order, emails with the same content together,
+        with at most SCHEDULER_MAX_IN_FLIGHT tasks in the pool at once.
+
+    Args:
+        due_ids (list[int]): ids of the claimed emails, ordered by next_attempt_at
+    """
+    futures = []
+    for group in _coalesce(due_ids):
+        _in_flight.acquire()
         try:
-            with get_db() as db:
-                try:
-                    due_list = _fetch_due_scheduled_emails(db)
-                    print(f"[scheduler] now={datetime.now(timezone.utc).isoformat()} due={len(due_list)}")
+            if len(group) > 1:
+                future = _dispatch_pool.submit(_process_scheduled_group, group)
+            else:
+                future = _dispatch_pool.submit(_process_scheduled_id, group[0])
+        except Exception:
+            _in_flight.release()
+            raise
+        future.add_done_callback(lambda _: _in_flight.release())
+        futures.append((group, future))
 
-                    for scheduled in due_list:
-                        print(f"[scheduler] processing id={scheduled.schedule_id} at {scheduled.scheduled_time}")
-                        _process_single_email(db, scheduled)
+    for group, future in futures:
+        try:
+            result = future.result()
+            for schedule_id, status in (result if len(group) > 1 else [result]):
+                if schedule_id:
+                    SCHEDULER_PROCESSED.inc(status=status)
+                    print(f"[scheduler] processed id={schedule_id} status={status}")
+        except Exception as inner:
+            SCHEDULER_PROCESSED.inc(len(group), status="error")
+            print(f"[scheduler] processing error for emails {group}: {inner}")
 
-                    db.commit()  # commit all processed emails at once
 
-                except Exception as inner:
-                    db.rollback()
-                    print(f"[scheduler] processing error: {inner}")
-                
-                purge_logs(db)
+def check_scheduled_emails_loop():
+    """ This function is the main loop for the scheduler. It sleeps
+        until the earliest scheduled email is due (or a new earlier one
+        is scheduled), then sends every email that is due.
+    """
+    while True:
+        try:
+            if _timer.needs_reload():
+                with get_db() as db:
+                    _timer.reload(db)
+
+            _timer.wait(until=float("inf"))
+
+            if _timer.pop_due():
+                with SCHEDULER_RUN_SECONDS.time():
+                    _send_due_emails()
 
         except Exception as outer:
             print(f"[scheduler] unexpected error: {outer}")
+            # the popped due emails are still in the db, get them back instead of waiting for the resync
+            _timer.force_reload()
+            time.sleep(1)
+
+
+def purge_logs_loop():
+    """ This function is the main loop for the purger. It purges old
+        logs every PURGE_INTERVAL_SECONDS, separately from the scheduler.
+    """
+    while True:
+        try:
+            with get_db() as db:
+                report = purge_logs(db)
+            print(f"[purge] {report}")
+        except Exception as e:
+            print(f"[purge] unexpected error: {e}")
 
-        time.sleep(CHECK_INTERVAL_SECONDS)
+        time.sleep(PURGE_INTERVAL_SECONDS)
 
 
 def start_scheduler():
@@ -119,3 +734,10 @@ def start_scheduler():
     t = threading.Thread(target=check_scheduled_emails_loop, daemon=True)
     t.start()
     print("Email scheduler started")
+
+
+def start_purger():
+    """Start the background log purge thread that stops when the app stops."""
+    t = threading.Thread(target=purge_logs_loop, daemon=True)
+    t.start()
+    print("Log purger started")
@@ -0,0 +1,280 @@
+#region imports
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from database import get_db, update_email_log, claim_outbox, release_outbox, load_outbox_emails, next_outbox_expiry, count_outbox
+from email_sender import send_email, SMTP_POOL_SIZE
+from async_engine import engine, use_async_engine
+from scheduler import is_transient, schedule_retries, SCHEDULER_REPLICA_ID
+from metrics import Counter, Gauge
+#endregion
+
+# ------------------------
+#   ENV LOAD AND SETUP
+# ------------------------
+
+SEND_ASYNC = os.getenv("SEND_ASYNC", "false").strip().lower() in ("1", "true", "yes")  # Default mode for /send-email
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))              # Background sender threads
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "1000"))     # Max emails waiting for a sender
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(SMTP_POOL_SIZE)))  # Threads delivering /send-email/batch
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))         # How long a replica holds a queued email before another may take it
+OUTBOX_CLAIM_BATCH = int(os.getenv("OUTBOX_CLAIM_BATCH", "1000"))              # Outbox emails claimed per transaction when replaying
+OUTBOX_RECOVERY_SECONDS = float(os.getenv("OUTBOX_RECOVERY_SECONDS", "300"))   # Look for emails left by crashed replicas at least this often
+OUTBOX_MAX_CLAIMS = int(os.getenv("OUTBOX_MAX_CLAIMS", "5"))                   # Claims before an email that never finishes is marked "dead"
+
+_queue = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+_started = False
+_start_lock = threading.Lock()
+_batch_executor = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS), thread_name_prefix="email-batch")
+_outbox_wake = threading.Event()
+
+SEND_QUEUE_DEPTH = Gauge("send_queue_depth", "Emails waiting for a background sender")
+SEND_QUEUE_DEPTH.set_function(lambda: engine.in_flight if use_async_engine() else _queue.qsize())
+OUTBOX_EMAILS = Counter("outbox_emails_total", "Outbox emails replayed to the senders, spilled by a full queue, recovered at startup or given up on", ("event",))
+
+
+def _count_outbox() -> int:
+    """Number of emails in the outbox, for the outbox_emails gauge."""
+    with get_db() as db:
+        return count_outbox(db)
+
+
+Gauge("outbox_emails", "Queued emails not finished yet, in memory or waiting in the outbox (all replicas)").set_function(_count_outbox)
+
+# ------------------------
+#   QUEUE + WORKERS
+# ------------------------
+
+def outbox_claim() -> tuple:
+    """ The claim an email saved with save_queued_email_log gets when it
+        goes straight to this replica's senders
+
+    Returns:
+        str: replica id
+        datetime: end of the lease
+    """
+    return SCHEDULER_REPLICA_ID, datetime.now(timezone.utc) + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+
+
+def enqueue_email(log_id: int, recipients: list[str], subject_line: str, body: str, is_html: bool) -> bool:
+    """ Hand a queued email (saved in the outbox claimed with outbox_claim())
+        over to the background senders. If they are full the claim is
+        released and the email waits in the outbox for room.
+
+    Args:
+        log_id (int): id of the "queued" EmailLog row for this email
+        recipients (list[str]): list of recipiant emails
+        subject_line (str): subject line of the email
+        body (str): body of the email
+        is_html (bool): if the body is formatted in HTML
+
+    Returns:
+        bool: False if the senders were full and the email waits in the outbox
+    """
+    if _submit(log_id, recipients, subject_line, body, is_html):
+        return True
+    with get_db() as db:
+        release_outbox(db, log_ids=[log_id])
+    OUTBOX_EMAILS.inc(event="spilled")
+    _outbox_wake.set()
+    return False
+
+
+def _submit(log_id: int, recipients: list[str], subject_line: str, body: str, is_html: bool) -> bool:
+    """Put an email in the in-memory queue (or on the asyncio engine), False if it is full."""
+    if use_async_engine():
+        return engine.submit(recipients, subject_line, body, is_html,
+                             callback=lambda result: _record(log_id, *result)) is not None
+    try:
+        _queue.put_nowait((log_id, recipients, subject_line, body, is_html))
+        return True
+    except queue.Full:
+        return False
+
+
+def _deliver(log_id: int, recipients: list[str], subject_line: str, body: str, is_html: bool) -> None:
+    """ Send a queued email and record the outcome on its log row
+
+    Args:
+        log_id (int): id of the "queued" EmailLog row for this email
+        recipients (list[str]): list of recipiant emails
+        subject_line (str): subject line of the email
+        body (str): body of the email
+        is_html (bool): if the body is formatted in HTML
+    """
+    _record(log_id, *send_email(recipients, subject_line, body, is_html))
+
+
+def _record(log_id: int, success: bool, status_code: int, message: str) -> None:
+    """ Record the outcome of a queued email on its log row (or hand a
+        transient failure to the scheduler to retry)
+
+    Args:
+        log_id (int): id of the "queued" EmailLog row for this email
+        success (bool): if the email was sent
+        status_code (int): status code of the send
+        message (str): status message of the send
+    """
+    if not success:
+        print(f"[send-queue] email {log_id} failed: {message}")
+
+    with get_db() as db:
+        if not success and is_transient(status_code):
+            if schedule_retries(db, [(log_id, status_code)]):
+                return
+        if not update_email_log(db, log_id, success, status_code):
+            print(f"[send-queue] Failed to update log for email {log_id}")
+
+
+def _sender_loop() -> None:
+    """Main loop for a background sender thread."""
+    while True:
+        job = _queue.get()
+        try:
+            _deliver(*job)
+        except Exception as e:
+            print(f"[send-queue] unexpected error: {e}")
+        finally:
+            _queue.task_done()
+
+
+def start_send_workers() -> None:
+    """ Start the background sender threads (once) that stop when the app
+        stops, or the asyncio delivery engine that replaces them, then
+        recover the outbox and start replaying it
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        if use_async_engine():
+            engine.start()
+        else:
+            for i in range(max(1, SEND_WORKERS)):
+                t = threading.Thread(target=_sender_loop, name=f"email-sender-{i}", daemon=True)
+                t.start()
+            print(f"Email send workers started ({SEND_WORKERS})")
+        recover_outbox()
+        threading.Thread(target=_outbox_loop, name="email-outbox", daemon=True).start()
+        _started = True
+
+
+# ------------------------
+#   OUTBOX REPLAY
+# ------------------------
+
+def _free_slots() -> int:
+    """Emails the senders can take right now without refusing any."""
+    if use_async_engine():
+        return engine.max_pending - engine.in_flight
+    if SEND_QUEUE_SIZE <= 0:
+        return OUTBOX_CLAIM_BATCH
+    return SEND_QUEUE_SIZE - _queue.qsize()
+
+
+def recover_outbox() -> int:
+    """ Release the outbox emails this replica held when it last stopped,
+        so they are replayed now instead of when their lease ends. Only
+        works if SCHEDULER_REPLICA_ID stays the same across restarts;
+        otherwise they are replayed once OUTBOX_LEASE_SECONDS have passed.
+
+    Returns:
+        int: how many emails were released
+    """
+    start = time.perf_counter()
+    with get_db() as db:
+        released = release_outbox(db, claimed_by=SCHEDULER_REPLICA_ID)
+        pending = count_outbox(db)
+    OUTBOX_EMAILS.inc(released, event="recovered")
+    print(f"[outbox] recovered {released} emails of {SCHEDULER_REPLICA_ID}, {pending} waiting ({time.perf_counter() - start:.3f}s)")
+    _outbox_wake.set()
+    return released
+
+
+def replay_outbox() -> int:
+    """ Claim outbox emails nobody holds, OUTBOX_CLAIM_BATCH at a time, and
+        hand them to the senders while they have room. Emails claimed more
+        than OUTBOX_MAX_CLAIMS times (their sender kept dying) are "dead".
+
+    Returns:
+        int: how many emails were handed to the senders
+    """
+    handed = 0
+    while True:
+        limit = min(_free_slots(), OUTBOX_CLAIM_BATCH)
+        if limit <= 0:
+            time.sleep(0.05)    # senders are full, wait for room without touching the db
+            continue
+
+        with get_db() as db:
+            claimed = claim_outbox(db, SCHEDULER_REPLICA_ID, OUTBOX_LEASE_SECONDS, limit)
+            for log_id, claims in claimed:
+                if claims > OUTBOX_MAX_CLAIMS:
+                    print(f"[outbox] email {log_id} claimed {claims} times, giving up")
+                    update_email_log(db, log_id, False, 520, status="dead")
+                    OUTBOX_EMAILS.inc(event="dead")
+            emails = load_outbox_emails(db, [log_id for log_id, claims in claimed if claims <= OUTBOX_MAX_CLAIMS])
+
+            refused = [e["log_id"] for e in emails
+                       if not _submit(e["log_id"], e["recipients"], e["subject_line"], e["body"], e["is_html"])]
+            if refused:
+                release_outbox(db, log_ids=refused)
+        handed += len(emails) - len(refused)
+        OUTBOX_EMAILS.inc(len(emails) - len(refused), event="replayed")
+        if len(claimed) < limit:
+            return handed
+
+
+def _outbox_loop() -> None:
+    """ Main loop of the outbox thread: replays the outbox when woken (at
+        startup and when a full queue spills into it), when an email held
+        by another replica gets claimable again, and every
+        OUTBOX_RECOVERY_SECONDS. It does not poll the db otherwise.
+    """
+    while True:
+        try:
+            handed = replay_outbox()
+            if handed:
+                print(f"[outbox] replayed {handed} emails")
+            with get_db() as db:
+                expiry = next_outbox_expiry(db, SCHEDULER_REPLICA_ID)
+            timeout = OUTBOX_RECOVERY_SECONDS
+            if expiry is not None:
+                timeout = min(timeout, max(0.0, (expiry - datetime.now(timezone.utc)).total_seconds()))
+            _outbox_wake.wait(timeout)
+            _outbox_wake.clear()
+        except Exception as e:
+            print(f"[outbox] unexpected error: {e}")
+            time.sleep(1)
+
+
+# ------------------------
+#   BATCH DELIVERY
+# ------------------------
+
+def send_batch(messages: list[dict]) -> list[tuple[bool, int, str]]:
+    """ Deliver a batch of emails in parallel over the shared worker pool.
+        Every worker sends through the SMTP connection pool, so sessions
+        are reused across the whole batch.
+
+    Args:
+        messages (list[dict]): emails with "recipients", "subject_line", "body" and "is_html"
+
+    Returns:
+        list[tuple]: the send_email result (success, status_code, message)
+                     of each email, in the same order as messages
+    """
+    if use_async_engine():
+        return engine.send_many(messages)
+
+    def _send(m):
+        try:
+            return send_email(m["recipients"], m["subject_line"], m["body"], m["is_html"])
+        except Exception as e:
+            return False, 520, f"Unknown error: {e}"
+
+    return list(_batch_executor.map(_send, messages))
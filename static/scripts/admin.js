@@ -1,5 +1,25 @@
 const emailEntries = document.querySelectorAll(".email-entry");
 
+/** This function loads the body of an email from the server
+ *  the first time its details are opened
+ *
+ * @param {HTMLElement} details 
+ */
+function loadBody(details) {
+    const bodyDiv = details.querySelector(".email-body");
+    if (!bodyDiv || bodyDiv.dataset.loaded) return;
+    bodyDiv.dataset.loaded = "true";
+    fetch(bodyDiv.dataset.bodyUrl)
+        .then(response => response.json())
+        .then(data => {
+            bodyDiv.innerHTML = data.status === "success" ? data.body : data.message;
+        })
+        .catch(() => {
+            bodyDiv.textContent = "Failed to load body";
+            delete bodyDiv.dataset.loaded;
+        });
+}
+
 /** This function toggles the details display from none to
  *  block based on a given email id
  *
@@ -12,6 +32,7 @@ function toggleDetails(id) {
         details.style.display = "none";
         arrow.classList.remove("open");
     } else {
+        loadBody(details);
         details.style.display = "block";
         arrow.classList.add("open");
     }
@@ -47,55 +68,67 @@ expandButton.addEventListener('click', () => {
 });
 
 const searchButton = document.getElementById("searchBtn");
+const clearButton = document.getElementById("clearBtn");
 const filterText = document.getElementById("filter-text");
+const filterFrom = document.getElementById("filter-from");
+const filterTo = document.getElementById("filter-to");
+
+// Filter commands (see /static/autocomplete.js) and the query
+// parameter the server filters on for each of them
+const filterParams = {
+    "status": "status",
+    "status_code": "status_code",
+    "recipients": "recipient",
+    "subject_line": "subject",
+    "schedule_id": "schedule_id"
+};
 
-/** This function filters all of the email entries
- *  based on a list of commands in /static/autocomplete.js
- *  It looks for 1-1 matches or general matches if the keyword
- *  "INCLUDES" is in the command
+/** This function reloads the page with the filter from the
+ *  filter box and the date range, so the server does the
+ *  filtering. Recipients and subject lines are partial matches,
+ *  the other fields are exact matches.
  */
 function filter() {
-    const query = filterText.value.trim();
-    if (!query) {
-        emailEntries.forEach(e => e.style.display = "block");
-        return;
-    }
+    const params = new URLSearchParams(window.location.search);
+    Object.values(filterParams).forEach(param => params.delete(param));
+    ["from", "to", "after"].forEach(param => params.delete(param));
 
     // Split by ":" and remove quotes / "INCLUDES"
-    const queryFormatted = query.split(/:(.+)/).map(substr => substr.replace(/"/g, "").replace("INCLUDES", "").trim());
-    let key = queryFormatted[0]; // e.g. status_code
-    if (key == "created_at") {
-        key = "created_at_formatted";
+    const query = filterText.value.trim();
+    if (query) {
+        const queryFormatted = query.split(/:(.+)/).map(substr => substr.replace(/"/g, "").replace("INCLUDES", "").trim());
+        const param = filterParams[queryFormatted[0]]; // e.g. status_code
+        const value = queryFormatted[1] || ""; // e.g. 200
+        if (!param) {
+            alert(`Can't filter by "${queryFormatted[0]}"`);
+            return;
+        }
+        if (value) params.set(param, value);
     }
-    const value = queryFormatted[1] ? queryFormatted[1].toLowerCase() : ""; // e.g. 200
-    const partial = query.toUpperCase().includes("INCLUDES");
-    console.log(`Looking for ${partial ? "partial" : "exact"} match for ${key} with value ${value}`)
+    if (filterFrom.value) params.set("from", filterFrom.value);
+    if (filterTo.value) params.set("to", filterTo.value);
 
-    emailEntries.forEach(entry => {
-        const element = entry.querySelector(`.${key}`);
-        let text = element ? element.textContent.replace(/"/g, "").trim() : "";
-        console.log(text);
-
-        // Handle null values
-        if (text.toLowerCase() === "null") text = "";
+    window.location.search = params.toString();
+}
 
-        if (partial) {
-            // Partial, case-insensitive match
-            if (text.toLowerCase().includes(value)) {
-                entry.style.display = "block";
-            } else {
-                entry.style.display = "none";
-            }
-        } else {
-            // Exact match, case-insensitive
-            if (text.toLowerCase() === value) {
-                entry.style.display = "block";
-            } else {
-                entry.style.display = "none";
-            }
+/* Show the current filter in the filter box */
+(function showCurrentFilter() {
+    const params = new URLSearchParams(window.location.search);
+    for (const [key, param] of Object.entries(filterParams)) {
+        if (params.get(param)) {
+            filterText.value = `"${key}": ${params.get(param)}`;
+            return;
         }
-    });
-}
+    }
+})();
+
+/* Remove every filter */
+clearButton.addEventListener('click', () => {
+    filterText.value = "";
+    filterFrom.value = "";
+    filterTo.value = "";
+    filter();
+});
 
 /* Allow for user to type enter in place of clucking search button */
 filterText.addEventListener('keydown', function(event) {
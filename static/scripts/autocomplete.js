@@ -102,51 +102,22 @@ let commands = [];
 
 if (viewType === "email") {
   // list of filter commands avialiable for emails
+  // (recipients and subject_line match any part of the value)
   commands = [
-    `"id": ""`,
     `"recipients": ""`,
     `"subject_line": ""`,
-    `"body": ""`,
-    `"is_html": ""`,
     `"status": ""`,
-    `"status_code": ""`,
-    `"created_at": ""`,
-    `"sent_at": ""`,
-    
-    `"id" INCLUDES: ""`,
-    `"recipients" INCLUDES: ""`,
-    `"subject_line" INCLUDES: ""`,
-    `"body" INCLUDES: ""`,
-    `"is_html" INCLUDES: ""`,
-    `"status" INCLUDES: ""`,
-    `"status_code" INCLUDES: ""`,
-    `"created_at" INCLUDES: ""`,
-    `"sent_at" INCLUDES: ""`
+    `"status_code": ""`
   ];
 } else if (viewType === "scheduled") {
   // list of filter commands avialiable for scheduled emails
+  // (recipients and subject_line match any part of the value)
   commands = [
-    `"id": ""`,
     `"schedule_id": ""`,
     `"recipients": ""`,
     `"subject_line": ""`,
-    `"body": ""`,
-    `"is_html": ""`,
     `"status": ""`,
-    `"status_code": ""`,
-    `"scheduled_time": ""`,
-    `"created_at": ""`,
-    
-    `"id" INCLUDES: ""`,
-    `"schedule_id" INCLUDES: ""`,
-    `"recipients" INCLUDES: ""`,
-    `"subject_line" INCLUDES: ""`,
-    `"body" INCLUDES: ""`,
-    `"is_html" INCLUDES: ""`,
-    `"status" INCLUDES: ""`,
-    `"status_code" INCLUDES: ""`,
-    `"scheduled_time" INCLUDES: ""`,
-    `"created_at" INCLUDES: ""`
+    `"status_code": ""`
   ];
 }
 
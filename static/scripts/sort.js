@@ -3,67 +3,29 @@ const sortButton = document.getElementById("sortByBtn");
 var sortOptions = ["Oldest", "Newest", "Email Status"];
 var divShowing = false;
 
-/** This function formatts an isoString to a date string
- * 
- * @param {string} isoString 
- * @returns dateString
- */
-function formatISODate(isoString) {
-    if (!isoString) return "null"; // handle null values
-
-    const date = new Date(isoString);
-    const options = { 
-        year: 'numeric', month: 'long', day: 'numeric',
-        hour: '2-digit', minute: '2-digit', hour12: true 
-    };
-    return date.toLocaleString('en-US', options); 
-}
-
-/** This function sorts the current list of emails
- *  based on oldest, newest, or email status
+// Sort option shown in the dropdown and the sort the server uses for it
+const sortParams = {
+    "Oldest": "oldest",
+    "Newest": "newest",
+    "Email Status": "status"
+};
+
+/** This function reloads the list of emails sorted by
+ *  oldest, newest, or email status (sorted by the server)
  * 
  * @param {string} sortingMethod 
  */
 function sortEmailsBy(sortingMethod) {
-    const emailEntries = Array.from(document.querySelectorAll('.email-entry'));
-    if (emailEntries.length === 0) return;
-
-    let sorted = [];
-
-    switch (sortingMethod) {
-        case "Newest":
-            sorted = emailEntries.sort((a, b) => {
-                const dateA = new Date(a.querySelector('.created_at').textContent.replaceAll('"',''));
-                const dateB = new Date(b.querySelector('.created_at').textContent.replaceAll('"',''));
-                return dateB - dateA; // newest first
-            });
-            break;
-
-        case "Oldest":
-            sorted = emailEntries.sort((a, b) => {
-                const dateA = new Date(a.querySelector('.created_at').textContent.replaceAll('"',''));
-                const dateB = new Date(b.querySelector('.created_at').textContent.replaceAll('"',''));
-                return dateA - dateB; // oldest first
-            });
-            break;
-
-        case "Email Status":
-            sorted = emailEntries.sort((a, b) => {
-                const statusA = parseInt(a.querySelector('.status_code').textContent.replaceAll('"', '')) || 0;
-                const statusB = parseInt(b.querySelector('.status_code').textContent.replaceAll('"', '')) || 0;
-                return statusA - statusB;
-            });
-            break;
-
-        default:
-            console.warn("Unknown sorting method:", sortingMethod);
-            return;
+    const sort = sortParams[sortingMethod];
+    if (!sort) {
+        console.warn("Unknown sorting method:", sortingMethod);
+        return;
     }
 
-    const parent = emailEntries[0].parentElement;
-    sorted.forEach(el => parent.appendChild(el));
-
-    toggleDivDisplay();
+    const params = new URLSearchParams(window.location.search);
+    params.set("sort", sort);
+    params.delete("after"); // back to the first page
+    window.location.search = params.toString();
 }
 
 /* Create all the sort options dynamically */